@@ -50,13 +50,17 @@ INSTALLED_APPS = [
 
 # Add this setting to use our custom authentication backend.
 # Django will try these backends in order.
+# EmailOrUsernameBackend also accepts plain usernames and extends ModelBackend
+# (permissions, is_active), so no fallback backend is needed; each extra
+# backend would hash the password again on every failed login.
 AUTHENTICATION_BACKENDS = [
     'api.backends.EmailOrUsernameBackend',
-    'django.contrib.auth.backends.ModelBackend', # Keep the default backend for compatibility.
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # Server-Timing headers and the /api/metrics/ histograms (see api/metrics.py)
+    'api.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,12 +78,45 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # Configure Django REST Framework to use JWT
+SIMPLE_JWT = {
+    # Token logins do not go through django.contrib.auth.login(), so the token
+    # view records last_login itself (one UPDATE per login).
+    'UPDATE_LAST_LOGIN': True,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT authentication that serves the user and their roles from the cache
+        'api.authentication.CachedJWTAuthentication',
     )
 }
 
+# Bearer token that lets a Prometheus scraper read /api/metrics/ without a JWT.
+# Admins can always read it with their own token.
+METRICS_TOKEN = None
+
+# Cache used for authenticated users and their roles (see api/authentication.py)
+# and for closed sales-report periods (see inventory/reports.py). It is local to
+# each worker process.
+# 'versions' holds the version tokens of the per-process caches (settings,
+# promotions, sales reports; see inventory/caching.py). Every worker must read
+# the same tokens for an invalidation to reach it, so they are kept in files next
+# to the database rather than in process memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # The default of 300 entries would cull a single year of daily report buckets.
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'versions',
+    },
+}
+
+# Upper bound, in seconds, on how long a cached user may be served
+AUTH_USER_CACHE_TIMEOUT = 300
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -105,6 +142,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests instead of reconnecting (and
+        # re-running the pragmas below) every time.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL lets readers carry on while a till is writing; synchronous=NORMAL
+            # is durable across application crashes in WAL mode and avoids an
+            # fsync per commit.
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            # Seconds a connection waits for the write lock before "database is locked"
+            'timeout': 20,
+            # Take the write lock when a transaction starts. A deferred transaction
+            # that reads first and writes later fails instantly, without waiting,
+            # when another writer got in between.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
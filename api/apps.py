@@ -1,4 +1,11 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_login_indexes(sender, using, **kwargs):
+    from .backends import create_login_indexes
+    create_login_indexes(connections[using])
 
 
 class ApiConfig(AppConfig):
@@ -8,3 +15,8 @@ class ApiConfig(AppConfig):
      # Add this ready method to import your signals
     def ready(self):
         import api.signals
+        # Query, auth and serializer timing for RequestMetricsMiddleware
+        from . import metrics
+        metrics.install()
+        # Indexes on auth_user for case-insensitive logins (see api/backends.py)
+        post_migrate.connect(install_login_indexes, sender=self)
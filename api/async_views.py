@@ -0,0 +1,92 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, generics
+from rest_framework.views import APIView
+from .authentication import auser_roles
+
+# Methods routed to the async view by split_reads(); everything else, including
+# OPTIONS (which describes the write methods too), goes to the sync view.
+ASYNC_METHODS = ('GET', 'HEAD')
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, for read endpoints served under ASGI.
+
+    DRF itself is synchronous, so authentication is awaited here: authenticators
+    with an `aauthenticate` method run on the event loop and others in a worker
+    thread. The user's roles are loaded before the permission checks, so
+    content negotiation, permissions, throttling and exception handling can stay
+    DRF's own synchronous code without touching the database.
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            # OPTIONS is answered by APIView's synchronous handler.
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """Async version of APIView.initial()."""
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        # Mirrors Request._authenticate(), which would run the authenticators synchronously.
+        for authenticator in request.authenticators:
+            aauthenticate = getattr(authenticator, 'aauthenticate', None)
+            try:
+                if aauthenticate is not None:
+                    user_auth = await aauthenticate(request)
+                else:
+                    user_auth = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                break
+        else:
+            request._not_authenticated()
+        await auser_roles(request.user)
+
+
+class AsyncGenericAPIView(AsyncAPIView, generics.GenericAPIView):
+    """GenericAPIView with async handlers. Querysets must be evaluated with the async ORM."""
+
+
+def split_reads(async_view, sync_view):
+    """
+    Returns a view that serves GET and HEAD with `async_view` and every other
+    method with `sync_view`, run in a worker thread as Django would run it.
+    Lets one URL keep its synchronous write handlers while reads go async.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method in ASYNC_METHODS:
+            return await async_view(request, *args, **kwargs)
+        return await sync_to_async(sync_view)(request, *args, **kwargs)
+    # CsrfViewMiddleware only sees the outer view; both inner views are exempt
+    # already, like every DRF view.
+    return csrf_exempt(view)
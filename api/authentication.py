@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from . import metrics
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def invalidate_user(*user_ids):
+    """Drops cached users (and their roles) so the next request reloads them."""
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+def user_roles(user):
+    """
+    Returns the names of the user's groups (roles), ordered by group id.
+    The result is memoised on the user object, and authenticated users served by
+    CachedJWTAuthentication arrive with it already filled in from the cache.
+    """
+    if not user.is_authenticated:
+        return ()
+    roles = getattr(user, '_role_names', None)
+    if roles is None:
+        roles = tuple(user.groups.order_by('pk').values_list('name', flat=True))
+        user._role_names = roles
+    return roles
+
+
+async def auser_roles(user):
+    """Async version of user_roles()."""
+    if not user.is_authenticated:
+        return ()
+    roles = getattr(user, '_role_names', None)
+    if roles is None:
+        roles = tuple([name async for name in user.groups.order_by('pk').values_list('name', flat=True)])
+        user._role_names = roles
+    return roles
+
+
+def has_role(user, *role_names):
+    return any(role in role_names for role in user_roles(user))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that serves the user row and its roles from the cache.
+
+    Only active users that passed simplejwt's own checks are cached, and the
+    entry is dropped by the signal receivers in api/signals.py whenever the user
+    or their group membership changes, so a warm request makes no auth queries.
+    """
+    def authenticate(self, request):
+        with metrics.phase('auth'):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = cache.get(user_cache_key(user_id)) if user_id is not None else None
+        if user is not None:
+            if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            return user
+
+        user = super().get_user(validated_token)
+        user_roles(user)
+        cache.set(user_cache_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+    async def aauthenticate(self, request):
+        """Async version of authenticate(), used by AsyncAPIView (see api/async_views.py)."""
+        with metrics.phase('auth'):
+            header = self.get_header(request)
+            if header is None:
+                return None
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        # The cache is read inline: Django's cache.aget() only hands the sync call
+        # to the same single worker thread the async ORM queues its queries on.
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = cache.get(user_cache_key(user_id)) if user_id is not None else None
+        if user is not None:
+            if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            return user
+
+        # Cache misses are rare; simplejwt's own checks only exist in sync form.
+        user = await sync_to_async(super().get_user)(validated_token)
+        await auser_roles(user)
+        cache.set(user_cache_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Lets a metrics scraper in with `Authorization: Bearer <METRICS_TOKEN>`.
+    Any other header is left to the authenticators that follow.
+    """
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and constant_time_compare(header, f'Bearer {token}'):
+            return AnonymousUser(), METRICS_SCRAPER
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+# request.auth of a request authenticated by MetricsTokenAuthentication
+METRICS_SCRAPER = 'metrics-scraper'
@@ -1,25 +1,74 @@
+import string
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from django.db.models.functions import Lower
 
 UserModel = get_user_model()
 
+# Expression indexes serving the case-insensitive lookups below. auth_user is
+# not our model, so they are created after migrate (see ApiConfig.ready).
+LOGIN_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS auth_user_username_lower_idx ON {UserModel._meta.db_table} (LOWER(username))",
+    f"CREATE INDEX IF NOT EXISTS auth_user_email_lower_idx ON {UserModel._meta.db_table} (LOWER(email))",
+]
+
+
+# SQLite's LOWER() folds ASCII letters only, so the login is folded the same way:
+# str.lower() would turn 'Émile' into 'émile', which LOWER(username) never equals.
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def ascii_lower(value):
+    return value.translate(_ASCII_LOWER)
+
+
+def create_login_indexes(using):
+    with using.cursor() as cursor:
+        for statement in LOGIN_INDEXES:
+            cursor.execute(statement)
+
+
 class EmailOrUsernameBackend(ModelBackend):
     """
     This is a custom authentication backend.
     It allows users to log in with their email address or username.
+
+    It is the only backend in AUTHENTICATION_BACKENDS, so a failed login hashes
+    the password once rather than once per backend.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Try to fetch the user by searching the username or email field (case-insensitive).
-            user = UserModel.objects.get(Q(username__iexact=username) | Q(email__iexact=username))
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # LOWER(column) = value matches the expression indexes; iexact compiles
+        # to LIKE, which has to scan the table.
+        normalized = ascii_lower(username.strip())
+        candidates = list(
+            UserModel.objects.alias(username_lower=Lower('username'), email_lower=Lower('email'))
+            .filter(Q(username_lower=normalized) | Q(email_lower=normalized))
+        )
+        # An exact username wins, then a unique case-insensitive username, then a
+        # unique email; an ambiguous login matches nobody.
+        user = None
+        for matches in (
+            [c for c in candidates if c.username == username.strip()],
+            [c for c in candidates if ascii_lower(c.username) == normalized],
+            [c for c in candidates if ascii_lower(c.email or '') == normalized],
+        ):
+            if matches:
+                user = matches[0] if len(matches) == 1 else None
+                break
+
+        if user is None:
             # Run the default password hasher once to reduce the timing
             # difference between a user not existing and a user with a wrong
             # password. This is a security best practice.
             UserModel().set_password(password)
             return None
-        
+
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,317 @@
+import random
+import time
+from decimal import Decimal
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+from inventory import ledger, rollups
+from inventory.models import Product, Sale, SaleItem, StockMovement
+from inventory.promotions import active_promotions_by_product
+from inventory.reports import invalidate_sales_reports
+from inventory.settings_registry import get_setting
+
+# Upper bound on sales accepted by one offline sync request.
+MAX_SYNC_BATCH_SIZE = 1000
+
+# How often a sync batch is re-read and retried when a concurrent checkout
+# takes the stock it had planned to use between its read and its UPDATE.
+SYNC_ATTEMPTS = 3
+
+# SQLite builds the OR/CASE chains below as a left-deep expression tree and
+# refuses trees deeper than 1000 nodes, so very large carts are split up.
+STOCK_UPDATE_CHUNK_SIZE = 200
+
+# Checkout transactions that find the database locked, after the connection's
+# busy timeout, are rerun this often with exponential backoff and jitter.
+LOCK_RETRY_ATTEMPTS = 4
+LOCK_RETRY_BASE_DELAY = 0.05  # seconds
+LOCK_RETRY_MAX_DELAY = 1.0
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a conditional stock decrement could not be applied.
+    `shortages` is a list of (product_name, available, requested) tuples.
+    """
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(self.messages())
+
+    def messages(self):
+        if not self.shortages:
+            return ["Stock changed during checkout. Please try again."]
+        return [
+            f"Not enough stock for {name}. Available: {available}, Requested: {requested}"
+            for name, available, requested in self.shortages
+        ]
+
+
+def retry_on_lock(func):
+    """
+    Calls `func`, which must run its own transaction, and calls it again when
+    SQLite reports the database as locked. Nothing is retried inside an outer
+    transaction, whose earlier work the failure has already rolled back.
+    """
+    for attempt in range(LOCK_RETRY_ATTEMPTS):
+        try:
+            return func()
+        except OperationalError as exc:
+            if 'locked' not in str(exc) or connection.in_atomic_block or attempt == LOCK_RETRY_ATTEMPTS - 1:
+                raise
+        time.sleep(min(LOCK_RETRY_MAX_DELAY, LOCK_RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1))
+
+
+def merge_quantities(lines):
+    """Sums requested quantities per product id, so repeated cart lines are checked together."""
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def sellable_batches(products, today):
+    """
+    Loads and locks the sellable batches of the given products' medicines with
+    one indexed query (product_fefo_idx) per STOCK_UPDATE_CHUNK_SIZE medicines. A
+    medicine is every batch sharing a product's name and unit; a batch is
+    sellable while in stock and not past its expiry date. Returns
+    {(name, unit): [Product, ...]} with each list in first-expiry-first-out order.
+    """
+    items = list({(product.name, product.unit) for product in products})
+    batches = {item: [] for item in items}
+    for start in range(0, len(items), STOCK_UPDATE_CHUNK_SIZE):
+        condition = Q()
+        for name, unit in items[start:start + STOCK_UPDATE_CHUNK_SIZE]:
+            condition |= Q(name=name, unit=unit)
+        queryset = (Product.objects.select_for_update()
+                    .filter(condition, expiry_date__gte=today, quantity__gt=0)
+                    .order_by('expiry_date', 'id'))
+        for batch in queryset:
+            batches[batch.name, batch.unit].append(batch)
+    return batches
+
+
+def allocate_batches(lines, batches, available):
+    """
+    Splits (product, quantity, unit_price) cart lines across the batches of their
+    medicine, earliest expiry first, and returns the allocated lines in the same
+    form, one per batch used. The line's product only names the medicine.
+
+    `batches` comes from sellable_batches(); `available` maps batch ids to units
+    not yet allocated and is decremented. When a medicine falls short, raises
+    InsufficientStock and leaves `available` untouched.
+    """
+    requested = merge_quantities(((product.name, product.unit), quantity) for product, quantity, _ in lines)
+    shortages = []
+    for item, quantity in requested.items():
+        in_stock = sum(available[batch.id] for batch in batches[item])
+        if in_stock < quantity:
+            shortages.append((item[0], in_stock, quantity))
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    allocated = []
+    for product, quantity, unit_price in lines:
+        for batch in batches[product.name, product.unit]:
+            take = min(quantity, available[batch.id])
+            if take:
+                allocated.append((batch, take, unit_price))
+                available[batch.id] -= take
+                quantity -= take
+            if not quantity:
+                break
+    return allocated
+
+
+def sale_movements(sale, quantities):
+    """Ledger rows taking a saved sale's {product_id: quantity} out of stock."""
+    return ledger.movements(StockMovement.SALE, {product_id: -quantity for product_id, quantity in quantities.items()},
+                            f'sale:{sale.pk}', sale.user)
+
+
+def update_stock(quantities, sign, condition=lambda product_id, quantity: Q(pk=product_id)):
+    """
+    Adds `sign` * quantity to stock for {product_id: quantity} with set-based UPDATE
+    statements of at most STOCK_UPDATE_CHUNK_SIZE rows each. The arithmetic happens
+    in the database, so changes committed since the rows were read are kept; a row
+    is only touched where `condition(product_id, quantity)` holds.
+    Returns the number of rows updated.
+    """
+    items = list(quantities.items())
+    now = timezone.now()
+    updated = 0
+    for start in range(0, len(items), STOCK_UPDATE_CHUNK_SIZE):
+        chunk = items[start:start + STOCK_UPDATE_CHUNK_SIZE]
+        matching = Q()
+        whens = []
+        for product_id, quantity in chunk:
+            matching |= condition(product_id, quantity)
+            whens.append(When(pk=product_id, then=F('quantity') + sign * quantity))
+        updated += Product.objects.filter(matching).update(
+            quantity=Case(*whens, output_field=PositiveIntegerField()),
+            # update() skips auto_now, so keep the timestamp honest ourselves.
+            updated_at=now,
+        )
+    return updated
+
+
+def decrement_stock(quantities):
+    """
+    Decrements stock for {product_id: quantity} with conditional UPDATE statements.
+
+    A row is only touched if it still holds enough stock, so two tills selling the
+    last units at the same time can never both succeed. Must be called inside
+    `transaction.atomic()`: when any product falls short, InsufficientStock is
+    raised and the caller's transaction rolls back the rows already decremented.
+    """
+    updated = update_stock(quantities, -1, lambda product_id, quantity: Q(pk=product_id, quantity__gte=quantity))
+    if updated != len(quantities):
+        # Only rows that fell short were left untouched, so their quantity is current.
+        current = Product.objects.filter(pk__in=quantities).values_list('id', 'name', 'quantity')
+        shortages = [
+            (name, available, quantities[product_id])
+            for product_id, name, available in current
+            if available < quantities[product_id]
+        ]
+        raise InsufficientStock(shortages)
+
+
+def price_sale(lines, discount_type, discount_value, promo_map, tax_rate):
+    """
+    Computes the amounts stored on a Sale.
+    `lines` is an iterable of (product, quantity, unit_price) tuples as rung up,
+    before batch allocation: promotions are those of the product the till sold.
+    """
+    lines = list(lines)
+    subtotal = sum((Decimal(unit_price) * quantity for _, quantity, unit_price in lines), Decimal('0'))
+
+    # --- Apply Automatic Promotions ---
+    promotion_discount_amount = Decimal('0')
+    for product, quantity, unit_price in lines:
+        promo = promo_map.get(product.id)
+        if promo is not None and promo.promotion_type == 'product_percentage':
+            promotion_discount_amount += Decimal(unit_price) * quantity * (promo.value / Decimal('100.0'))
+
+    # --- Apply Manual Discount (on the price after promotions) ---
+    price_after_promos = subtotal - promotion_discount_amount
+    manual_discount_amount = Decimal('0')
+    if discount_type == 'percentage':
+        manual_discount_amount = price_after_promos * (discount_value / Decimal('100.0'))
+    elif discount_type == 'fixed':
+        manual_discount_amount = discount_value
+    manual_discount_amount = min(price_after_promos, manual_discount_amount)
+
+    taxable_amount = price_after_promos - manual_discount_amount
+    tax_amount = taxable_amount * (tax_rate / Decimal('100.0'))
+
+    return {
+        'subtotal': subtotal,
+        'promotion_discount_amount': promotion_discount_amount,
+        'discount_amount': manual_discount_amount,
+        'tax_amount': tax_amount,
+        'total_amount': taxable_amount + tax_amount,
+    }
+
+
+def sync_sales(sales_data, user):
+    """
+    Replays a batch of sales queued by an offline terminal.
+
+    Promotions, the tax rate and the batches of every referenced medicine are loaded
+    once, stock is allocated to the sales first-expiry-first-out in the order they
+    were queued, and all accepted sales, their items and the stock decrement are
+    written in bulk in one transaction. Returns one result dict per input sale,
+    in input order.
+
+    Replays are idempotent: a sale whose `client_id` this user already synced is
+    answered with the id booked the first time (`replayed: true`) and writes
+    nothing. Sales keep the terminal's `created_at`, so they count towards the
+    day they were rung up in the rollups, reports and reorder velocity.
+    """
+    for attempt in range(SYNC_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _sync_sales_once(sales_data, user)
+        except (InsufficientStock, IntegrityError):
+            # Another till sold the stock between our read and our UPDATE, or a
+            # concurrent retry of this batch booked the same client_id first; the
+            # transaction rolled back, so re-plan against the fresh rows.
+            if attempt == SYNC_ATTEMPTS - 1:
+                raise
+
+
+def _sync_sales_once(sales_data, user):
+    product_ids = {item['product'] for sale in sales_data for item in sale['items']}
+    products = Product.objects.in_bulk(product_ids)
+    batches = sellable_batches(products.values(), timezone.localdate())
+    available = {batch.id: batch.quantity for item_batches in batches.values() for batch in item_batches}
+    promo_map = active_promotions_by_product()
+    tax_rate = get_setting('tax_rate')
+
+    client_ids = {sale_data['client_id'] for sale_data in sales_data if sale_data.get('client_id')}
+    booked = dict(Sale.objects.filter(user=user, client_id__in=client_ids).values_list('client_id', 'id'))
+    now = timezone.now()
+
+    results = []
+    accepted = []  # (result, Sale, allocated lines)
+    pending = {}  # client_id -> result of the sale accepted earlier in this batch
+    repeats = []  # (result, earlier result) for client_ids repeated within the batch
+    total_quantities = {}
+    for sale_data in sales_data:
+        client_id = sale_data.get('client_id', '')
+        result = {'client_id': client_id}
+        results.append(result)
+        if client_id in booked:
+            result.update(status='accepted', id=booked[client_id], replayed=True)
+            continue
+        if client_id in pending:
+            repeats.append((result, pending[client_id]))
+            continue
+
+        missing = sorted({item['product'] for item in sale_data['items']} - products.keys())
+        if missing:
+            result.update(status='rejected', errors=[f"Unknown product id {pid}." for pid in missing])
+            continue
+
+        # Sales are allocated in queue order, each against what the earlier ones left.
+        requested = [(products[item['product']], item['quantity'], item['unit_price']) for item in sale_data['items']]
+        try:
+            lines = allocate_batches(requested, batches, available)
+        except InsufficientStock as exc:
+            result.update(status='rejected', errors=exc.messages())
+            continue
+
+        for batch, quantity, _ in lines:
+            total_quantities[batch.id] = total_quantities.get(batch.id, 0) + quantity
+
+        amounts = price_sale(requested, sale_data['discount_type'], sale_data['discount_value'], promo_map, tax_rate)
+        sale = Sale(user=user, client_id=client_id, created_at=sale_data.get('created_at') or now,
+                    discount_type=sale_data['discount_type'], discount_value=sale_data['discount_value'], **amounts)
+        result['status'] = 'accepted'
+        accepted.append((result, sale, lines))
+        if client_id:
+            pending[client_id] = result
+
+    if accepted:
+        # SQLite returns the new primary keys from a bulk INSERT, so items can reference them.
+        Sale.objects.bulk_create([sale for _, sale, _ in accepted])
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=batch, quantity=quantity, unit_price=unit_price)
+            for _, sale, lines in accepted
+            for batch, quantity, unit_price in lines
+        ], batch_size=500)
+        decrement_stock(total_quantities)
+        ledger.record(
+            row for _, sale, lines in accepted
+            for row in sale_movements(sale, merge_quantities((batch.id, quantity) for batch, quantity, _ in lines))
+        )
+        rollups.record_sales((sale, sum(quantity for _, quantity, _ in lines)) for _, sale, lines in accepted)
+        for result, sale, _ in accepted:
+            result['id'] = sale.id
+        # Sales rung up on an earlier day change report buckets cached as final.
+        if any(timezone.localdate(sale.created_at) < timezone.localdate(now) for _, sale, _ in accepted):
+            invalidate_sales_reports()
+    for result, earlier in repeats:
+        result.update(status='accepted', id=earlier['id'], replayed=True)
+
+    return results
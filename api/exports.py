@@ -0,0 +1,119 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from inventory.models import RestockHistory, SaleItem
+
+# Rows fetched from the database per round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+SALE_COLUMNS = [
+    ('sale_id', 'sale_id'),
+    ('created_at', 'sale__created_at'),
+    ('cashier', 'sale__user__username'),
+    ('product_id', 'product_id'),
+    ('product_name', 'product__name'),
+    ('batch_number', 'product__batch_number'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'unit_price'),
+    ('sale_subtotal', 'sale__subtotal'),
+    ('sale_discount_amount', 'sale__discount_amount'),
+    ('sale_tax_amount', 'sale__tax_amount'),
+    ('sale_total_amount', 'sale__total_amount'),
+]
+
+RESTOCK_COLUMNS = [
+    ('id', 'id'),
+    ('restock_date', 'restock_date'),
+    ('product_id', 'product_id'),
+    ('product_name', 'product__name'),
+    ('supplier_id', 'supplier_id'),
+    ('supplier_name', 'supplier__name'),
+    ('user', 'user__username'),
+    ('quantity_added', 'quantity_added'),
+    ('cost_per_unit', 'cost_per_unit'),
+    ('notes', 'notes'),
+]
+
+
+def date_range_bounds(start, end):
+    """Turns inclusive local dates (either may be None) into [start, end) datetimes."""
+    lower = timezone.make_aware(datetime.combine(start, time.min)) if start else None
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)) if end else None
+    return lower, upper
+
+
+def sale_item_rows(start=None, end=None):
+    lower, upper = date_range_bounds(start, end)
+    queryset = SaleItem.objects.all()
+    if lower:
+        queryset = queryset.filter(sale__created_at__gte=lower)
+    if upper:
+        queryset = queryset.filter(sale__created_at__lt=upper)
+    return SALE_COLUMNS, (queryset.order_by('sale__created_at', 'sale_id', 'id')
+                          .values_list(*[lookup for _, lookup in SALE_COLUMNS])
+                          .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+
+def restock_rows(start=None, end=None):
+    lower, upper = date_range_bounds(start, end)
+    queryset = RestockHistory.objects.all()
+    if lower:
+        queryset = queryset.filter(restock_date__gte=lower)
+    if upper:
+        queryset = queryset.filter(restock_date__lt=upper)
+    return RESTOCK_COLUMNS, (queryset.order_by('restock_date', 'id')
+                             .values_list(*[lookup for _, lookup in RESTOCK_COLUMNS])
+                             .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+
+class _Echo:
+    """A file-like object whose write() hands the line back to the csv writer's caller."""
+    def write(self, value):
+        return value
+
+
+def _csv_lines(names, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+async def _aiterate(lines):
+    """
+    Serves a synchronous line generator to an async server. Each batch of
+    EXPORT_CHUNK_SIZE lines is pulled on the thread that owns the database
+    connection, so only one batch is held in memory at a time.
+    """
+    next_batch = sync_to_async(lambda: ''.join(islice(lines, EXPORT_CHUNK_SIZE)), thread_sensitive=True)
+    while batch := await next_batch():
+        yield batch
+
+
+def streaming_export(columns, rows, output, filename, asynchronous=False):
+    """
+    Streams `rows` as CSV or NDJSON. Rows are pulled from the database iterator
+    as the client reads, so memory stays flat and the header goes out at once.
+    Pass `asynchronous` when serving under ASGI: Django would otherwise read a
+    synchronous iterator to the end before sending anything.
+    """
+    names = [name for name, _ in columns]
+    lines = _csv_lines(names, rows) if output == 'csv' else _ndjson_lines(names, rows)
+    response = StreamingHttpResponse(_aiterate(lines) if asynchronous else lines, content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
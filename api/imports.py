@@ -0,0 +1,251 @@
+import csv
+import io
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import connection, transaction
+from django.utils import timezone
+from inventory import ledger, rollups
+from inventory.models import Product, RestockHistory, StockMovement, Supplier
+from inventory.reports import invalidate_sales_reports
+
+# Rows validated and written per round of bulk queries
+IMPORT_BATCH_SIZE = 1000
+
+# Errors beyond this many are counted but not listed in the report
+MAX_REPORTED_ERRORS = 500
+
+# Columns overwritten from the CSV on an existing product; quantity is added, not replaced
+UPDATED_FIELDS = ['category', 'expiry_date', 'unit', 'price', 'supplier']
+
+
+def _text(max_length):
+    def parse(value):
+        if len(value) > max_length:
+            raise ValueError(f'Ensure this field has no more than {max_length} characters.')
+        return value
+    return parse
+
+
+def _count(value):
+    try:
+        result = int(value)
+    except ValueError:
+        raise ValueError('A valid integer is required.')
+    if result < 0:
+        raise ValueError('Ensure this value is greater than or equal to 0.')
+    return result
+
+
+def _money(value):
+    try:
+        result = Decimal(value)
+    except InvalidOperation:
+        raise ValueError('A valid number is required.')
+    if not result.is_finite() or result < 0:
+        raise ValueError('Ensure this value is a positive number.')
+    if result != result.quantize(Decimal('0.01')) or result >= 10 ** 8:
+        raise ValueError('Ensure there are no more than 8 digits before and 2 after the decimal point.')
+    return result.quantize(Decimal('0.01'))
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError('Date has wrong format. Use one of these formats instead: YYYY-MM-DD.')
+
+
+def _supplier(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('A valid integer is required.')
+
+
+# CSV column -> (parser, default); columns without a default are required.
+# Rows are parsed by hand rather than with a serializer: at tens of thousands of
+# rows per upload, DRF field validation was most of the import's run time.
+COLUMNS = {
+    'name': (_text(255), None),
+    'category': (_text(100), None),
+    'batch_number': (_text(100), ''),
+    'expiry_date': (_date, None),
+    'unit': (_text(50), None),
+    # Units received with this row; added to stock and recorded as a restock
+    'quantity': (_count, 0),
+    'price': (_money, None),
+    # Supplier ids are checked against the database once per batch, not per row
+    'supplier': (_supplier, None),
+    'cost_per_unit': (_money, Decimal('0.00')),
+}
+
+
+def parse_row(raw):
+    """Returns (row, errors) for one CSV record; blank cells count as missing."""
+    row, errors = {}, {}
+    for column, (parse, default) in COLUMNS.items():
+        value = raw.get(column)
+        value = value.strip() if isinstance(value, str) else ''
+        if not value:
+            if default is None:
+                errors[column] = ['This field is required.']
+            row[column] = default
+            continue
+        try:
+            row[column] = parse(value)
+        except ValueError as exc:
+            errors[column] = [str(exc)]
+    return row, errors
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.restocked_units = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'restocked_units': self.restocked_units,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def _validated_batch(numbered_rows, report):
+    """Validates one batch of (row_number, raw dict) pairs; supplier ids are checked with one query."""
+    valid = []
+    for row_number, raw in numbered_rows:
+        row, errors = parse_row(raw)
+        if errors:
+            report.add_error(row_number, errors)
+        else:
+            valid.append((row_number, row))
+
+    supplier_ids = set(Supplier.objects.filter(id__in={row['supplier'] for _, row in valid})
+                       .values_list('id', flat=True))
+    checked = []
+    for row_number, row in valid:
+        if row['supplier'] in supplier_ids:
+            checked.append((row_number, row))
+        else:
+            report.add_error(row_number, {'supplier': [f"Supplier {row['supplier']} does not exist."]})
+    return checked
+
+
+def _update_products(pairs, now):
+    """
+    Applies the CSV columns to existing products with one executemany() UPDATE.
+
+    bulk_update() builds a CASE over every row of the batch for each column and
+    dominated the run time of large imports. The quantity is added
+    in the database, so sales committed meanwhile are not overwritten.
+    """
+    if not pairs:
+        return
+    fields = [Product._meta.get_field(name) for name in UPDATED_FIELDS]
+    quantity = Product._meta.get_field('quantity').column
+    updated_at = Product._meta.get_field('updated_at')
+    assignments = ', '.join(f'{field.column} = %s' for field in fields)
+    sql = (f'UPDATE {Product._meta.db_table} SET {assignments}, {quantity} = {quantity} + %s, '
+           f'{updated_at.column} = %s WHERE id = %s')
+    now = updated_at.get_db_prep_save(now, connection)
+    params = []
+    for product, row in pairs:
+        values = [row[name] for name in UPDATED_FIELDS]
+        params.append([*(field.get_db_prep_save(value, connection) for field, value in zip(fields, values)),
+                       row['quantity'], now, product.pk])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _apply_batch(rows, user, report):
+    """Upserts one batch of validated rows on (name, batch_number) with bulk queries."""
+    # Rows repeating a key within the batch are merged: later cells win, quantities add up.
+    merged = {}
+    for _, row in rows:
+        key = (row['name'], row['batch_number'])
+        if key in merged:
+            row = {**row, 'quantity': merged[key]['quantity'] + row['quantity']}
+        merged[key] = row
+    if not merged:
+        return
+
+    # Filtering on batch_number__in as well would make SQLite probe the index for
+    # every name x batch pair; names alone are selective, the rest is matched here.
+    existing = {}
+    candidates = (Product.objects.filter(name__in={name for name, _ in merged})
+                  .order_by('-id').only('id', 'name', 'batch_number', 'category'))
+    for product in candidates:
+        key = (product.name, product.batch_number)
+        # Pre-existing duplicates resolve to the oldest row.
+        if key in merged:
+            existing[key] = product
+
+    now = timezone.now()
+    to_create, to_update, restocks = [], [], []
+    for key, row in merged.items():
+        product = existing.get(key)
+        if product is None:
+            product = Product(
+                name=row['name'], batch_number=row['batch_number'], category=row['category'],
+                expiry_date=row['expiry_date'], unit=row['unit'], price=row['price'],
+                supplier_id=row['supplier'], quantity=row['quantity'],
+            )
+            to_create.append(product)
+        else:
+            to_update.append((product, row))
+        if row['quantity']:
+            restocks.append((product, row))
+
+    # SQLite returns the new primary keys, so restocks can point at created products.
+    Product.objects.bulk_create(to_create)
+    _update_products(to_update, now)
+    if any(product.category != row['category'] for product, row in to_update):
+        invalidate_sales_reports()
+    restocks = RestockHistory.objects.bulk_create([
+        RestockHistory(product=product, supplier_id=row['supplier'], user=user, quantity_added=row['quantity'],
+                       cost_per_unit=row['cost_per_unit'], notes='CSV import')
+        for product, row in restocks
+    ])
+    ledger.record(ledger.restock_movements(StockMovement.IMPORT, restocks))
+
+    units = sum(restock.quantity_added for restock in restocks)
+    rollups.record_restock(units)
+    rollups.record_stock_change(units)
+    report.created += len(to_create)
+    report.updated += len(to_update)
+    report.restocked_units += units
+
+
+def import_products(uploaded_file, user):
+    """
+    Imports products from a CSV upload with the columns listed in COLUMNS.
+
+    The file is read as a stream and processed in batches of IMPORT_BATCH_SIZE
+    rows, each costing a fixed handful of queries. Invalid rows are skipped and
+    reported by line number; everything else is written in one transaction.
+    """
+    report = ImportReport()
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+    # Line 1 is the header, so data rows start at line 2.
+    numbered = enumerate(reader, start=2)
+    with transaction.atomic():
+        while True:
+            batch = list(islice(numbered, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            _apply_batch(_validated_batch(batch, report), user, report)
+    return report
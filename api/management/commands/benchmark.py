@@ -0,0 +1,242 @@
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import error, request as urlrequest
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from inventory.management.commands.seed_data import SEED_PASSWORD
+from inventory.models import Product
+
+SCENARIOS = ('checkout', 'catalog', 'dashboard', 'restock', 'login')
+
+# Reported per scenario; latencies are in milliseconds.
+METRICS = ('throughput', 'p50', 'p95', 'p99', 'queries')
+
+# Metrics where a larger value is an improvement
+HIGHER_IS_BETTER = {'throughput'}
+
+
+class InProcessClient:
+    """Drives the API through the Django test client and counts queries per request."""
+
+    def __init__(self):
+        # 'localhost' is only implicitly allowed while DEBUG is on.
+        hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host and not host.startswith('.')]
+        # Server errors are counted like any other failed response.
+        self.client = APIClient(HTTP_HOST=hosts[0] if hosts else 'localhost', raise_request_exception=False)
+
+    def call(self, method, path, data=None, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data, format='json', **headers)
+        body = response.json() if response.get('Content-Type', '').startswith('application/json') else None
+        return response.status_code, body, len(queries)
+
+
+class ServerClient:
+    """Drives a running server over HTTP. Query counts are not visible from outside."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def call(self, method, path, data=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        body = json.dumps(data).encode() if data is not None else None
+        req = urlrequest.Request(self.base_url + path, data=body, headers=headers, method=method.upper())
+        try:
+            with urlrequest.urlopen(req) as response:
+                status, payload = response.status, response.read()
+        except error.HTTPError as exc:
+            status, payload = exc.code, exc.read()
+        try:
+            return status, json.loads(payload), None
+        except ValueError:
+            return status, None, None
+
+
+def summarize(samples, elapsed, concurrency):
+    """
+    Reduces (latency_seconds, queries, ok) samples to the reported metrics.
+    Throughput is successful requests per second of wall time.
+    """
+    latencies = sorted(latency * 1000 for latency, _, _ in samples)
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    counts = [queries for _, queries, _ in samples if queries is not None]
+    ok = sum(1 for _, _, succeeded in samples if succeeded)
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - ok,
+        'concurrency': concurrency,
+        'throughput': round(ok / elapsed, 1) if elapsed else 0.0,
+        'p50': round(p50, 2),
+        'p95': round(p95, 2),
+        'p99': round(p99, 2),
+        'queries': round(statistics.mean(counts), 1) if counts else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns [(scenario, metric, baseline, current, change, regressed)] for every
+    metric present in both runs. A metric regresses when it is worse than the
+    baseline by more than `tolerance` (a fraction); any increase in queries per
+    request counts as a regression.
+    """
+    rows = []
+    for scenario, current in results.items():
+        previous = baseline.get(scenario)
+        if not previous:
+            continue
+        for metric in METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            if metric == 'queries':
+                regressed = new > old
+            elif metric in HIGHER_IS_BETTER:
+                regressed = change < -tolerance
+            else:
+                regressed = change > tolerance
+            rows.append((scenario, metric, old, new, change, regressed))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks checkout, catalog listing, the dashboard, restocking and login against "
+        "the current database (see seed_data) and reports throughput, p50/p95/p99 latency "
+        "and queries per request, optionally compared with a stored baseline. Writes sales "
+        "and restocks, so run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per scenario.")
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated subset of: {', '.join(SCENARIOS)}.")
+        parser.add_argument('--url', help="Base URL of a running server; the test client is used if omitted.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Parallel requests (--url only).")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--save-baseline', metavar='PATH', help="Write the results to PATH as JSON.")
+        parser.add_argument('--baseline', metavar='PATH', help="Compare the results with a saved baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed relative slowdown before a metric counts as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}.")
+        if options['concurrency'] > 1 and not options['url']:
+            raise CommandError("--concurrency needs --url; the test client runs one request at a time.")
+
+        self.random = random.Random(options['seed'])
+        self.client = ServerClient(options['url']) if options['url'] else InProcessClient()
+        self._prepare()
+
+        results = {}
+        for name in scenarios:
+            make_request = getattr(self, f'_{name}')
+            for _ in range(options['warmup']):
+                self._timed(make_request)
+            results[name] = self._run(make_request, options['requests'], options['concurrency'])
+            self._report(name, results[name])
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}.")
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = self._compare(results, json.load(f), options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} metric(s) regressed against the baseline.")
+
+    def _prepare(self):
+        status, body, _ = self.client.call('post', '/api/token/', {
+            'username': 'seed_admin', 'password': SEED_PASSWORD})
+        if status != 200:
+            raise CommandError("Could not log in as seed_admin; run seed_data first.")
+        self.admin_token = body['access']
+        self.cashiers = [f'seed_cashier{i}' for i in range(1, 6)]
+        status, body, _ = self.client.call('post', '/api/token/', {
+            'username': self.cashiers[0], 'password': SEED_PASSWORD})
+        self.cashier_token = body['access'] if status == 200 else self.admin_token
+
+        # Sellable products: in stock and not expired, so checkouts succeed.
+        self.products = list(
+            Product.objects.filter(quantity__gte=20, expiry_date__gt=timezone.localdate())
+            .order_by('?').values_list('id', 'price', 'supplier_id')[:1000]
+        )
+        if not self.products:
+            raise CommandError("No sellable products; run seed_data first.")
+
+    def _timed(self, make_request):
+        method, path, data, token = make_request()
+        started = time.perf_counter()
+        status, _, queries = self.client.call(method, path, data, token)
+        return time.perf_counter() - started, queries, 200 <= status < 300
+
+    def _run(self, make_request, count, concurrency):
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(concurrency) as pool:
+                samples = list(pool.map(lambda _: self._timed(make_request), range(count)))
+        else:
+            samples = [self._timed(make_request) for _ in range(count)]
+        return summarize(samples, time.perf_counter() - started, concurrency)
+
+    # Each scenario returns (method, path, data, token) for one request.
+
+    def _checkout(self):
+        lines = self.random.sample(self.products, min(len(self.products), self.random.randint(1, 3)))
+        items = [{'product': product_id, 'quantity': 1, 'unit_price': str(price)}
+                 for product_id, price, _ in lines]
+        return 'post', '/api/sales/', {'items': items}, self.cashier_token
+
+    def _catalog(self):
+        return 'get', '/api/products/', None, self.cashier_token
+
+    def _dashboard(self):
+        return 'get', '/api/dashboard-stats/', None, self.admin_token
+
+    def _restock(self):
+        lines = self.random.sample(self.products, min(len(self.products), self.random.randint(1, 5)))
+        items = [{'product_id': product_id, 'supplier_id': supplier_id, 'quantity_added': 10,
+                  'cost_per_unit': str(price)} for product_id, price, supplier_id in lines]
+        return 'post', '/api/products/restock/', {'notes': 'Benchmark', 'items': items}, self.admin_token
+
+    def _login(self):
+        return 'post', '/api/token/', {'username': self.random.choice(self.cashiers), 'password': SEED_PASSWORD}, None
+
+    def _report(self, name, result):
+        queries = '-' if result['queries'] is None else result['queries']
+        self.stdout.write(
+            f"{name:<10} {result['requests']:>5} req  {result['errors']:>3} err  "
+            f"{result['throughput']:>8} req/s  p50 {result['p50']:>8} ms  p95 {result['p95']:>8} ms  "
+            f"p99 {result['p99']:>8} ms  queries {queries}"
+        )
+
+    def _compare(self, results, baseline, tolerance):
+        regressions = 0
+        for scenario, metric, old, new, change, regressed in compare(results, baseline, tolerance):
+            regressions += regressed
+            line = f"{scenario:<10} {metric:<10} {old:>10} -> {new:>10} ({change:+.1%})"
+            self.stdout.write(self.style.ERROR(line + "  REGRESSION") if regressed else line)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+        return regressions
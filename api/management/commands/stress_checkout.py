@@ -0,0 +1,97 @@
+import multiprocessing
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from inventory.models import Product, Sale, SaleItem, Supplier
+from .benchmark import InProcessClient
+
+
+def _till(args):
+    """Runs one till's checkouts in a child process; returns its statuses and acknowledged sale ids."""
+    till, token, product_ids, sales, quantity = args
+    client = InProcessClient()
+    statuses, sale_ids = Counter(), []
+    for i in range(sales):
+        # Every till hits the same few rows, in a different order per till.
+        product_id = product_ids[(till + i) % len(product_ids)]
+        status, body, _ = client.call('post', '/api/sales/', {
+            'items': [{'product': product_id, 'quantity': quantity, 'unit_price': '1.00'}]}, token)
+        statuses[status] += 1
+        if status == 201:
+            sale_ids.append(body['id'])
+    connections.close_all()
+    return statuses, sale_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent checkouts from several processes against the configured "
+        "(file-backed) database and checks that every acknowledged sale and stock "
+        "movement was committed exactly once. Writes to the database, so run it "
+        "against a scratch copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tills', type=int, default=8, help="Concurrent processes.")
+        parser.add_argument('--sales', type=int, default=100, help="Checkouts per till.")
+        parser.add_argument('--products', type=int, default=3, help="Products the tills compete for.")
+        parser.add_argument('--quantity', type=int, default=1, help="Units per checkout.")
+
+    def handle(self, *args, **options):
+        tills, sales = options['tills'], options['sales']
+        if connections['default'].settings_dict['NAME'] in ('', ':memory:') or \
+                'mode=memory' in str(connections['default'].settings_dict['NAME']):
+            raise CommandError("The stress test needs a file-backed database shared by all processes.")
+
+        cashier, _ = User.objects.get_or_create(username='stress_cashier', defaults={'email': 'stress@example.com'})
+        cashier.groups.add(Group.objects.get_or_create(name='cashier')[0])
+        token = str(RefreshToken.for_user(cashier).access_token)
+        supplier, _ = Supplier.objects.get_or_create(
+            name='Stress Supplier', defaults={'email': 'stress@example.com', 'phone': '0'})
+        stock = tills * sales * options['quantity']  # enough for every sale to go to one product
+        products = [
+            Product.objects.create(
+                name=f'Stress Product {i}', category='Stress', batch_number=f'STRESS-{time.time_ns()}-{i}',
+                expiry_date=timezone.localdate() + timedelta(days=365), unit='Units', quantity=stock,
+                price=Decimal('1.00'), supplier=supplier,
+            )
+            for i in range(options['products'])
+        ]
+        first_sale_id = (Sale.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+        # Children must open their own connections rather than share the parent's.
+        connections.close_all()
+        started = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(tills) as pool:
+            results = pool.map(_till, [
+                (till, token, [product.id for product in products], sales, options['quantity'])
+                for till in range(tills)
+            ])
+        elapsed = time.perf_counter() - started
+
+        statuses = sum((till_statuses for till_statuses, _ in results), Counter())
+        acknowledged = {sale_id for _, sale_ids in results for sale_id in sale_ids}
+        committed = set(Sale.objects.filter(id__gte=first_sale_id, user=cashier).values_list('id', flat=True))
+        lost = acknowledged - committed
+        unacknowledged = committed - acknowledged
+        sold = sum(SaleItem.objects.filter(sale_id__in=committed).values_list('quantity', flat=True))
+        remaining = sum(Product.objects.filter(id__in=[p.id for p in products]).values_list('quantity', flat=True))
+        stock_drift = stock * len(products) - remaining - sold
+
+        self.stdout.write(
+            f"{tills} tills x {sales} checkouts in {elapsed:.1f}s ({sum(statuses.values()) / elapsed:.0f}/s); "
+            f"responses: {dict(sorted(statuses.items()))}"
+        )
+        self.stdout.write(
+            f"acknowledged {len(acknowledged)}, committed {len(committed)}, lost {len(lost)}, "
+            f"committed without acknowledgement {len(unacknowledged)}, stock drift {stock_drift}"
+        )
+        if lost or unacknowledged or stock_drift or statuses[201] != tills * sales:
+            raise CommandError("Sales were lost or rejected under concurrency.")
+        self.stdout.write(self.style.SUCCESS("Every checkout was committed exactly once."))
@@ -0,0 +1,213 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+# Histogram bucket upper bounds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+# Phases timed inside a request, besides the database. Time spent in queries
+# during a phase is counted as database time only.
+PHASES = ('auth', 'serializer')
+
+_timings = ContextVar('request_timings', default=None)
+_lock = threading.Lock()
+
+
+class RequestTimings:
+    __slots__ = ('queries', 'db', 'phases', 'active')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket (non-cumulative) + overflow, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            base = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+REQUEST_DURATION = Histogram('vetpos_request_duration_seconds', 'Total time spent handling a request.', DURATION_BUCKETS)
+DB_DURATION = Histogram('vetpos_db_duration_seconds', 'Time spent in database queries per request.', DURATION_BUCKETS)
+DB_QUERIES = Histogram('vetpos_db_queries', 'Database queries per request.', QUERY_BUCKETS)
+PHASE_DURATION = Histogram('vetpos_phase_duration_seconds',
+                           'Time spent in authentication and serializers per request, excluding queries.',
+                           DURATION_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, PHASE_DURATION)
+
+
+def record(view, method, total, timings):
+    labels = (('view', view), ('method', method))
+    with _lock:
+        REQUEST_DURATION.observe(labels, total)
+        DB_DURATION.observe(labels, timings.db)
+        DB_QUERIES.observe(labels, timings.queries)
+        for phase, seconds in timings.phases.items():
+            PHASE_DURATION.observe(labels + (('phase', phase),), seconds)
+
+
+def render():
+    """Returns every histogram in the Prometheus text exposition format."""
+    with _lock:
+        lines = [line for histogram in HISTOGRAMS for line in histogram.render()]
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        for histogram in HISTOGRAMS:
+            histogram.series.clear()
+
+
+@contextmanager
+def phase(name):
+    """
+    Adds the time spent in the block to the current request's `name` phase,
+    less the queries it ran. Nested use of the same phase is counted once.
+    """
+    timings = _timings.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    db_before = timings.db
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.phases[name] += time.perf_counter() - started - (timings.db - db_before)
+
+
+def _time_queries(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db += time.perf_counter() - started
+
+
+def _install_query_timer(sender, connection, **kwargs):
+    # Installed once per connection rather than per request; it only records
+    # while a request is being timed. Reconnects send the signal again.
+    if _time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_queries)
+
+
+def _in_serializer_phase(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with phase('serializer'):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def install():
+    """
+    Hooks the query timer into every database connection and times serializer
+    validation and representation. Called once from ApiConfig.ready().
+    """
+    connection_created.connect(_install_query_timer)
+    # DRF has no hook around serialization, so `is_valid` and `data` are wrapped
+    # on the base classes that define them; field and nested serializers run
+    # inside those calls.
+    for cls in (serializers.BaseSerializer, serializers.Serializer, serializers.ListSerializer):
+        if 'is_valid' in cls.__dict__:
+            cls.is_valid = _in_serializer_phase(cls.is_valid)
+        if 'data' in cls.__dict__:
+            cls.data = property(_in_serializer_phase(cls.data.fget))
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request and records its query count, database time, auth and
+    serializer time and total latency. The figures are returned to the client in
+    a Server-Timing header and aggregated into the histograms served at
+    /api/metrics/.
+
+    Histograms live in process memory, so each worker reports its own; sum
+    them across workers in Prometheus.
+    """
+    # Async-capable, so ASGI requests to async views never switch to a thread here.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, time.perf_counter() - started, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, time.perf_counter() - started, timings)
+
+    def _finish(self, request, response, total, timings):
+        match = request.resolver_match
+        record(match.view_name if match else 'unmatched', request.method, total, timings)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries"',
+            *(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.phases.items()),
+            f'total;dur={total * 1000:.2f}',
+        ])
+        return response
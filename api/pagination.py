@@ -0,0 +1,142 @@
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the full ordering tuple, e.g. (-created_at, id).
+
+    DRF's CursorPagination only filters on the first ordering field and falls
+    back to OFFSET for ties; here the cursor stores every ordering value and the
+    page is selected with a row-value comparison, so rows sharing a timestamp
+    never shift between pages and a deep page costs the same as the first.
+    The primary key is always appended as the final tie-breaker.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('id',)
+        return ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return json.dumps(values)
+
+    def _keyset_filter(self, position, reverse, queryset):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # (a, b, c) after (x, y, z)  <=>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            value = self._cursor_value(queryset, name, value)
+            descending = field.startswith('-') != reverse
+            condition |= equal_so_far & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal_so_far &= Q(**{name: value})
+        return condition
+
+    def _cursor_value(self, queryset, name, value):
+        """Parses one cursor value as the field it orders on; a tampered value is a bad cursor."""
+        if value is None or isinstance(value, (list, dict)):
+            raise NotFound(self.invalid_cursor_message)
+        if name in queryset.query.annotations:
+            # Annotations (e.g. the product status rank) are parsed as their output field.
+            field = queryset.query.annotations[name].output_field
+        else:
+            field = queryset.model._meta.get_field('id' if name == 'pk' else name)
+        try:
+            return field.to_python(value)
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async version of paginate_queryset()."""
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page([row async for row in queryset])
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            _, reverse, current_position = self.cursor
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            queryset = queryset.filter(self._keyset_filter(current_position, reverse, queryset))
+        self._position = reverse, current_position
+
+        # Fetch one extra row to learn whether another page follows.
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, results):
+        reverse, current_position = self._position
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if has_following else None
+        )
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class SalePagination(KeysetPagination):
+    ordering = ('-created_at', 'id')
+
+
+class RestockHistoryPagination(KeysetPagination):
+    ordering = ('-restock_date', 'id')
+
+
+class ReorderSuggestionPagination(KeysetPagination):
+    ordering = ('days_of_cover', 'id')
+
+
+class ProductPagination(KeysetPagination):
+    ordering = ('name', 'id')
@@ -0,0 +1,52 @@
+from django.db import transaction
+from inventory import ledger, rollups
+from inventory.models import RestockHistory, StockMovement
+from .checkout import merge_quantities, update_stock
+
+# Upper bound on lines accepted in one delivery.
+MAX_DELIVERY_LINES = 1000
+
+
+class ProductsMissing(Exception):
+    """Raised when a product of the delivery was deleted after it was validated."""
+
+
+def increment_stock(quantities):
+    """
+    Adds {product_id: quantity} to stock with set-based UPDATE statements.
+
+    The addition happens in the database, so sales committed between reading and
+    writing are never overwritten. Raises ProductsMissing if any row is gone;
+    call inside `transaction.atomic()` so the other rows roll back with it.
+    """
+    if update_stock(quantities, 1) != len(quantities):
+        raise ProductsMissing()
+
+
+def apply_delivery(lines, user):
+    """
+    Books a delivery: every line's quantity is added to stock and recorded in
+    RestockHistory, all in one transaction. `lines` are dicts with product_id,
+    supplier_id, quantity_added, cost_per_unit and notes, already validated.
+    Returns the total units received.
+    """
+    quantities = merge_quantities((line['product_id'], line['quantity_added']) for line in lines)
+    with transaction.atomic():
+        increment_stock(quantities)
+        # bulk_create() skips the RestockHistory signal, so the rollups are fed below.
+        restocks = RestockHistory.objects.bulk_create([
+            RestockHistory(
+                product_id=line['product_id'],
+                supplier_id=line['supplier_id'],
+                user=user,
+                quantity_added=line['quantity_added'],
+                cost_per_unit=line['cost_per_unit'],
+                notes=line.get('notes', ''),
+            )
+            for line in lines
+        ])
+        ledger.record(ledger.restock_movements(StockMovement.RESTOCK, restocks))
+        units = sum(quantities.values())
+        rollups.record_restock(units)
+        rollups.record_stock_change(units)
+    return units
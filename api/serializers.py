@@ -3,12 +3,20 @@ from rest_framework import serializers
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-from inventory.models import Setting, Supplier, Product, RestockHistory, Sale, SaleItem, Promotion
+from inventory.models import Setting, Supplier, Product, RestockHistory, Sale, SaleItem, Promotion, ReorderSuggestion
+from inventory import ledger, rollups
+from inventory.promotions import active_promotions_by_product
+from inventory.settings_registry import get_setting
 from django.db import transaction
+from .checkout import (
+    MAX_SYNC_BATCH_SIZE, InsufficientStock, allocate_batches, decrement_stock, merge_quantities, price_sale,
+    sale_movements, sellable_batches,
+)
+from .restocks import MAX_DELIVERY_LINES
 
 class UserListSerializer(serializers.ModelSerializer):
     # This field gets the user's role from the group they belong to.
-    role = serializers.CharField(source='groups.first.name', read_only=True)
+    role = serializers.SerializerMethodField()
      # Add a method field to get the full name
     full_name = serializers.SerializerMethodField()
     status = serializers.SerializerMethodField()
@@ -27,6 +35,12 @@ class UserListSerializer(serializers.ModelSerializer):
           return obj.get_full_name() or obj.username
     def get_status(self, obj):
         return "active" if obj.is_active else "inactive"
+
+    def get_role(self, obj):
+        # Read from the prefetched groups (UserViewSet prefetches them); groups.first()
+        # would issue a fresh query per user.
+        groups = obj.groups.all()
+        return min(groups, key=lambda group: group.pk).name if groups else None
    
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -98,28 +112,32 @@ class SupplierSerializer(serializers.ModelSerializer):
     # The frontend uses 'contact', so we'll map it from 'contact_person'
     contact = serializers.CharField(source='contact_person', required=False, allow_blank=True)
     
-    # These fields don't exist on the model yet, so we provide defaults.
-    # We will implement the logic for these later with the Restocking module.
     totalOrders = serializers.SerializerMethodField()
     lastOrder = serializers.SerializerMethodField()
+    totalSpend = serializers.SerializerMethodField()
 
     class Meta:
         model = Supplier
         # We make 'is_active' a normal field. The frontend will now receive it
         # and can send it back directly for updates.
-        fields = ['id', 'name', 'contact', 'email', 'phone', 'address', 'status', 'totalOrders', 'lastOrder', 'is_active']
+        fields = ['id', 'name', 'contact', 'email', 'phone', 'address', 'status', 'totalOrders', 'lastOrder',
+                  'totalSpend', 'is_active']
 
 
     def get_status_display(self, obj):
         return "active" if obj.is_active else "inactive"
 
+    # The statistics are annotated by Supplier.objects.with_order_stats(), which
+    # SupplierViewSet applies; a supplier created just now has no restocks yet.
     def get_totalOrders(self, obj):
-        # Placeholder logic
-        return 0
-    
+        return getattr(obj, 'restock_count', 0)
+
     def get_lastOrder(self, obj):
-        # Placeholder logic
-        return "N/A"
+        last = getattr(obj, 'last_restock', None)
+        return serializers.DateTimeField().to_representation(last) if last else "N/A"
+
+    def get_totalSpend(self, obj):
+        return f"{getattr(obj, 'total_spend', 0):.2f}"
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -139,15 +157,18 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_status(self, obj):
         """Calculates product status based on quantity and expiry date."""
+        # List views annotate the status in the database (ProductQuerySet.with_status)
+        if getattr(obj, 'status', None) is not None:
+            return obj.status
         today = timezone.now().date()
         if obj.expiry_date < today:
             return 'expired'
         if obj.quantity == 0:
             return 'out-of-stock'
-        # Using a hardcoded threshold of 10 for low stock for now
-        if obj.quantity < 10:
+        # Thresholds come from the cached settings, so this costs no queries per row
+        if obj.quantity < get_setting('low_stock_threshold'):
             return 'low-stock'
-        if obj.expiry_date <= today + timedelta(days=30):
+        if obj.expiry_date <= today + timedelta(days=get_setting('expiry_warning_days')):
             return 'expiring-soon'
         return 'in-stock' 
     
@@ -159,6 +180,54 @@ class RestockSerializer(serializers.Serializer):
     cost_per_unit = serializers.DecimalField(max_digits=10, decimal_places=2)
     notes = serializers.CharField(required=False, allow_blank=True)
 
+    def validate_supplier_id(self, value):
+        if not Supplier.objects.filter(pk=value).exists():
+            raise serializers.ValidationError(f"Supplier {value} does not exist.")
+        return value
+
+
+# Serializers for booking a whole delivery in one request
+class DeliveryLineSerializer(serializers.Serializer):
+    # Plain ids: products and suppliers are checked for the whole delivery in one query each.
+    product_id = serializers.IntegerField()
+    quantity_added = serializers.IntegerField(min_value=1)
+    # Defaults to the delivery's supplier_id
+    supplier_id = serializers.IntegerField(required=False)
+    cost_per_unit = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+
+class DeliverySerializer(serializers.Serializer):
+    supplier_id = serializers.IntegerField(required=False)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    items = DeliveryLineSerializer(many=True, allow_empty=False, max_length=MAX_DELIVERY_LINES)
+
+    def validate(self, data):
+        lines = [
+            {'supplier_id': data.get('supplier_id'), 'notes': data['notes'], **line}
+            for line in data['items']
+        ]
+        supplier_ids = set(Supplier.objects.filter(
+            pk__in={line['supplier_id'] for line in lines if line['supplier_id'] is not None}
+        ).values_list('id', flat=True))
+        product_ids = set(Product.objects.filter(
+            pk__in={line['product_id'] for line in lines}
+        ).values_list('id', flat=True))
+
+        errors = []
+        for line in lines:
+            line_errors = {}
+            if line['supplier_id'] is None:
+                line_errors['supplier_id'] = ["A supplier is required for every line."]
+            elif line['supplier_id'] not in supplier_ids:
+                line_errors['supplier_id'] = [f"Supplier {line['supplier_id']} does not exist."]
+            if line['product_id'] not in product_ids:
+                line_errors['product_id'] = [f"Product {line['product_id']} does not exist."]
+            errors.append(line_errors)
+        if any(errors):
+            raise serializers.ValidationError({'items': errors})
+        return {**data, 'items': lines}
+
 # Serializer to display the restock history
 class RestockHistorySerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -173,6 +242,17 @@ class RestockHistorySerializer(serializers.ModelSerializer):
         ]
 
 
+class ReorderSuggestionSerializer(serializers.ModelSerializer):
+    supplier_name = serializers.CharField(source='supplier.name', read_only=True, default=None)
+
+    class Meta:
+        model = ReorderSuggestion
+        fields = [
+            'id', 'name', 'unit', 'supplier', 'supplier_name', 'quantity', 'daily_velocity',
+            'days_of_cover', 'lead_time_days', 'suggested_quantity', 'computed_at'
+        ]
+
+
 class PromotionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Promotion
@@ -188,7 +268,11 @@ class SaleItemSerializer(serializers.ModelSerializer):
         fields = ['product', 'product_name', 'quantity', 'unit_price']
 
 class SaleCreateSerializer(serializers.ModelSerializer):
-    """Serializer for creating a new sale."""
+    """
+    Serializer for creating a new sale. An item's `product` may be any batch of
+    the medicine sold; the quantity is allocated across its unexpired batches,
+    earliest expiry first, and the sale's items list one line per batch.
+    """
     items = SaleItemSerializer(many=True)
     discount_type = serializers.CharField(required=False, default='none')
     discount_value = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0)
@@ -213,82 +297,76 @@ class SaleCreateSerializer(serializers.ModelSerializer):
         
         # Use a database transaction to ensure all operations succeed or none do.
         with transaction.atomic():
-            # Calculate subtotal from item list
-            subtotal = sum(Decimal(item['unit_price']) * item['quantity'] for item in items_data)
-            
-            # --- Apply Automatic Promotions ---
-            promotion_discount_amount = Decimal('0')
-            today = timezone.now().date()
-            active_promotions = Promotion.objects.filter(
-                is_active=True, 
-                start_date__lte=today, 
-                end_date__gte=today
-            ).prefetch_related('products')
-
-            promo_map = {p.id: promo for promo in active_promotions for p in promo.products.all()}
-
-            for item_data in items_data:
-                product = item_data['product']
-                if product.id in promo_map:
-                    promo = promo_map[product.id]
-                    if promo.promotion_type == 'product_percentage':
-                        item_price = Decimal(item_data.get('unit_price', product.price))
-                        item_total = item_price * item_data['quantity']
-                        promotion_discount_amount += item_total * (promo.value / Decimal('100.0'))
-
-            # --- Apply Manual Discount (on the price after promotions) ---
-            price_after_promos = subtotal - promotion_discount_amount
-            manual_discount_amount = Decimal('0')
-            if discount_type == 'percentage':
-                manual_discount_amount = price_after_promos * (discount_value / Decimal('100.0'))
-            elif discount_type == 'fixed':
-                manual_discount_amount = discount_value
-            
-            manual_discount_amount = min(price_after_promos, manual_discount_amount)
-
-            taxable_amount = price_after_promos - manual_discount_amount
-
-            
-            
-            # Get tax rate from settings, default to 0 if not found
+            # Each line names a medicine; its quantity is taken from the batches
+            # expiring first, and the sale records one item per batch used.
+            requested = [(item['product'], item['quantity'], item['unit_price']) for item in items_data]
+            batches = sellable_batches([product for product, _, _ in requested], timezone.localdate())
+            available = {batch.id: batch.quantity for item_batches in batches.values() for batch in item_batches}
             try:
-                tax_rate_setting = Setting.objects.get(key='tax_rate')
-                tax_rate = Decimal(tax_rate_setting.value)
-            except (Setting.DoesNotExist, ValueError):
-                tax_rate = Decimal('0.0')
-                
-             # Calculate tax and total
-            tax_amount = taxable_amount * (tax_rate / Decimal('100.0'))
-            total_amount = taxable_amount + tax_amount
-            
-            
+                lines = allocate_batches(requested, batches, available)
+            except InsufficientStock as exc:
+                raise serializers.ValidationError(exc.messages())
+            # Priced as rung up, so the promotions the till showed apply whichever batches were used.
+            amounts = price_sale(requested, discount_type, discount_value, active_promotions_by_product(),
+                                 get_setting('tax_rate'))
+
             # Create the sale with calculated values
             sale = Sale.objects.create(
-                subtotal=subtotal,
                 discount_type=discount_type,
                 discount_value=discount_value,
-                discount_amount=manual_discount_amount,
-                tax_amount=tax_amount,
-                total_amount=total_amount,
+                **amounts,
                 **validated_data
             )
             
-             # Create sale items and update product stock
-            for item_data in items_data:
-                product = item_data['product']
-                quantity_sold = item_data['quantity']
-                
-                if product.quantity < quantity_sold:
-                    raise serializers.ValidationError(f"Not enough stock for {product.name}. Available: {product.quantity}, Requested: {quantity_sold}")
+            # Create all sale items in one INSERT
+            SaleItem.objects.bulk_create([
+                SaleItem(sale=sale, product=batch, quantity=quantity, unit_price=unit_price)
+                for batch, quantity, unit_price in lines
+            ])
+
+            # Decrease stock with conditional updates; the database still rejects
+            # oversells where the batch rows were not actually locked.
+            quantities = merge_quantities((batch.id, quantity) for batch, quantity, _ in lines)
+            try:
+                decrement_stock(quantities)
+            except InsufficientStock as exc:
+                raise serializers.ValidationError(exc.messages())
 
-                SaleItem.objects.create(sale=sale, **item_data)
-                
-                # Decrease product quantity
-                product.quantity -= quantity_sold
-                product.save()
-                
+            ledger.record(sale_movements(sale, quantities))
+            rollups.record_sales([(sale, sum(quantities.values()))])
             return sale
 
+
+# Serializers for replaying sales queued by offline terminals
+class SyncSaleItemSerializer(serializers.Serializer):
+    # A plain id: products are resolved for the whole batch in one query, not per line.
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class SyncSaleSerializer(serializers.Serializer):
+    # Terminal-side reference, echoed back so the till can match results to its queue.
+    # A sale whose client_id the cashier already synced is not booked again.
+    client_id = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    # When the sale was rung up on the terminal; defaults to the time of the sync.
+    created_at = serializers.DateTimeField(required=False)
+    items = SyncSaleItemSerializer(many=True, allow_empty=False)
+    discount_type = serializers.CharField(required=False, default='none')
+    discount_value = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0)
+
+
+class SaleSyncSerializer(serializers.Serializer):
+    sales = SyncSaleSerializer(many=True, allow_empty=False, max_length=MAX_SYNC_BATCH_SIZE)
+
+    def validate_sales(self, sales):
+        # A terminal clock running ahead must not book sales into the future.
+        now = timezone.now()
+        for sale in sales:
+            if sale.get('created_at') and sale['created_at'] > now:
+                sale['created_at'] = now
+        return sales
+
 class SaleListSerializer(serializers.ModelSerializer):
     """Serializer for listing past sales."""
     user_name = serializers.CharField(source='user.username', read_only=True)
@@ -1,11 +1,38 @@
-from django.contrib.auth.signals import user_logged_in
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from django.utils import timezone
+from .authentication import invalidate_user
 
-@receiver(user_logged_in)
-def update_last_login(sender, user, **kwargs):
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
     """
-    A signal receiver that updates the last_login field for a user when they log in.
+    Drops the cached user whenever the row changes (status, password, profile).
     """
-    user.last_login = timezone.now()
-    user.save(update_fields=['last_login'])
\ No newline at end of file
+    invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_cached_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops cached roles when group membership changes, e.g. from
+    UserCreateSerializer (groups.add) or UserUpdateSerializer (groups.set).
+    """
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_user(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear() does not report which users it removes.
+        invalidate_user(*instance.user_set.values_list('pk', flat=True))
+    elif action.startswith('post_') and pk_set:
+        invalidate_user(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_members(sender, instance, created=False, **kwargs):
+    """
+    Renaming or deleting a group changes the role of every member.
+    """
+    if not created:
+        invalidate_user(*instance.user_set.values_list('pk', flat=True))
@@ -1,3 +1,1731 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User, Group
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.test import AsyncClient, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from inventory import caching, catalog, ledger, reports, settings_registry
+from inventory.models import Supplier, Product, Promotion, RestockHistory, Sale, SaleItem, StockMovement
+from inventory.rollups import read_dashboard_rollups
+from . import metrics
+from .authentication import user_roles
+from .checkout import LOCK_RETRY_ATTEMPTS, LOCK_RETRY_MAX_DELAY, decrement_stock, retry_on_lock, sellable_batches
+from .management.commands.benchmark import SCENARIOS, compare
+from .serializers import ProductSerializer, SaleCreateSerializer
+from .views import ProductViewSet
+
+
+def clear_caches():
+    """Empties this process's caches and the version tokens shared with other workers."""
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def make_user(username, role):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+    group, _ = Group.objects.get_or_create(name=role)
+    user.groups.add(group)
+    return user
+
+
+def make_product(supplier, name='Amoxicillin', quantity=50, price='2.50', **kwargs):
+    kwargs.setdefault('expiry_date', timezone.now().date() + timedelta(days=365))
+    return Product.objects.create(
+        name=name, category=kwargs.pop('category', 'Antibiotics'), batch_number=kwargs.pop('batch_number', 'B1'),
+        unit=kwargs.pop('unit', 'Tablets'), quantity=quantity, price=Decimal(price), supplier=supplier, **kwargs
+    )
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _sale_serializer(self, lines):
+        serializer = SaleCreateSerializer(data={'items': [
+            {'product': product.id, 'quantity': quantity, 'unit_price': str(product.price)}
+            for product, quantity in lines
+        ]})
+        serializer.is_valid(raise_exception=True)
+        return serializer
+
+    def test_checkout_decrements_stock_and_creates_items(self):
+        product = make_product(self.supplier, quantity=10)
+        response = self.client.post('/api/sales/', {
+            'items': [{'product': product.id, 'quantity': 4, 'unit_price': '2.50'}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 6)
+        self.assertEqual(SaleItem.objects.filter(sale_id=response.data['id']).count(), 1)
+
+    def test_oversell_is_rejected_and_rolled_back(self):
+        plenty = make_product(self.supplier, name='Plenty', quantity=100)
+        scarce = make_product(self.supplier, name='Scarce', quantity=2)
+        response = self.client.post('/api/sales/', {'items': [
+            {'product': plenty.id, 'quantity': 5, 'unit_price': '2.50'},
+            {'product': scarce.id, 'quantity': 3, 'unit_price': '2.50'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not enough stock for Scarce', str(response.data))
+        plenty.refresh_from_db()
+        self.assertEqual(plenty.quantity, 100)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_repeated_lines_are_checked_together(self):
+        product = make_product(self.supplier, quantity=5)
+        serializer = self._sale_serializer([(product, 3), (product, 3)])
+
+        with self.assertRaises(serializers.ValidationError):
+            serializer.save(user=self.cashier)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 5)
+
+    def test_concurrent_tills_cannot_lose_updates(self):
+        # Till B read the batches (5 in stock) before till A's sale committed; only the
+        # conditional decrement stands between that stale read and an oversell.
+        product = make_product(self.supplier, quantity=5)
+        stale = sellable_batches([product], timezone.localdate())
+        till_a = self._sale_serializer([(product, 3)])
+        till_b = self._sale_serializer([(product, 3)])
+
+        till_a.save(user=self.cashier)
+        with mock.patch('api.serializers.sellable_batches', return_value=stale), \
+                mock.patch('api.serializers.decrement_stock', side_effect=decrement_stock) as decrement, \
+                self.assertRaises(serializers.ValidationError) as rejected:
+            till_b.save(user=self.cashier)
+
+        decrement.assert_called_once_with({product.id: 3})
+        self.assertIn('Not enough stock', str(rejected.exception))
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 2)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_checkout_queries_do_not_grow_with_cart_size(self):
+        products = [make_product(self.supplier, name=f'P{i}', batch_number=f'B{i}') for i in range(30)]
+        self._sale_serializer([(products[0], 1)]).save(user=self.cashier)  # creates today's rollup rows
+
+        small = self._sale_serializer([(products[0], 1)])
+        with CaptureQueriesContext(connection) as small_ctx:
+            small.save(user=self.cashier)
+
+        large = self._sale_serializer([(p, 1) for p in products])
+        with CaptureQueriesContext(connection) as large_ctx:
+            large.save(user=self.cashier)
+
+        self.assertEqual(len(small_ctx), len(large_ctx))
+
+
+class BatchAllocationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+        today = timezone.localdate()
+        self.expired = make_product(self.supplier, batch_number='OLD', quantity=20, expiry_date=today - timedelta(days=1))
+        self.late = make_product(self.supplier, batch_number='LATE', quantity=10, expiry_date=today + timedelta(days=90))
+        self.early = make_product(self.supplier, batch_number='EARLY', quantity=3, expiry_date=today)
+        # Same name, different unit: a different medicine
+        self.syrup = make_product(self.supplier, batch_number='SYR', quantity=10, unit='ml')
+
+    def _sold(self, sale_id):
+        return list(SaleItem.objects.filter(sale_id=sale_id).order_by('id').values_list('product_id', 'quantity'))
+
+    def _quantities(self):
+        return dict(Product.objects.values_list('batch_number', 'quantity'))
+
+    def test_checkout_takes_earliest_expiry_first_and_splits_items(self):
+        response = self.client.post('/api/sales/', {'items': [
+            {'product': self.late.id, 'quantity': 5, 'unit_price': '2.50'}]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._sold(response.data['id']), [(self.early.id, 3), (self.late.id, 2)])
+        self.assertEqual([item['quantity'] for item in response.data['items']], [3, 2])
+        self.assertEqual(self._quantities(), {'OLD': 20, 'LATE': 8, 'EARLY': 0, 'SYR': 10})
+        self.assertEqual(Sale.objects.get().subtotal, Decimal('12.50'))
+
+    def test_expired_batches_do_not_sell(self):
+        # Picking the expired batch still sells from the fresh ones.
+        response = self.client.post('/api/sales/', {'items': [
+            {'product': self.expired.id, 'quantity': 4, 'unit_price': '2.50'}]}, format='json')
+        self.assertEqual(self._sold(response.data['id']), [(self.early.id, 3), (self.late.id, 1)])
+
+        response = self.client.post('/api/sales/', {'items': [
+            {'product': self.expired.id, 'quantity': 10, 'unit_price': '2.50'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not enough stock for Amoxicillin. Available: 9, Requested: 10', str(response.data))
+        self.assertEqual(self._quantities()['OLD'], 20)
+
+    def test_promotions_follow_the_product_rung_up(self):
+        today = timezone.localdate()
+        promo = Promotion.objects.create(name='Clearance', value=Decimal('50'), start_date=today, end_date=today)
+        promo.products.set([self.late])
+        line = {'product': self.late.id, 'quantity': 2, 'unit_price': '2.50'}
+
+        response = self.client.post('/api/sales/', {'items': [line]}, format='json')
+        self.assertEqual(self._sold(response.data['id']), [(self.early.id, 2)])
+        self.assertEqual(Sale.objects.get(pk=response.data['id']).promotion_discount_amount, Decimal('2.50'))
+        response = self.client.post('/api/sales/sync/', {'sales': [{'items': [line]}]}, format='json')
+        self.assertEqual(Sale.objects.get(pk=response.data['results'][0]['id']).promotion_discount_amount,
+                         Decimal('2.50'))
+
+    def test_sync_allocates_in_queue_order(self):
+        line = {'product': self.early.id, 'quantity': 2, 'unit_price': '2.50'}
+        response = self.client.post('/api/sales/sync/', {'sales': [
+            {'items': [line]}, {'items': [line, {**line, 'product': self.syrup.id}]},
+        ]}, format='json')
+
+        first, second = response.data['results']
+        self.assertEqual(self._sold(first['id']), [(self.early.id, 2)])
+        self.assertEqual(self._sold(second['id']), [(self.early.id, 1), (self.late.id, 1), (self.syrup.id, 2)])
+        self.assertEqual(self._quantities(), {'OLD': 20, 'LATE': 9, 'EARLY': 0, 'SYR': 8})
+
+
+class SaleSyncTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _queued_sale(self, client_id, *lines):
+        return {'client_id': client_id, 'items': [
+            {'product': product.id, 'quantity': quantity, 'unit_price': str(product.price)}
+            for product, quantity in lines
+        ]}
+
+    def test_sync_accepts_in_queue_order_and_rejects_for_stock(self):
+        product = make_product(self.supplier, quantity=5)
+        response = self.client.post('/api/sales/sync/', {'sales': [
+            self._queued_sale('a', (product, 3)),
+            self._queued_sale('b', (product, 3)),
+            self._queued_sale('c', (product, 2)),
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['accepted', 'rejected', 'accepted'])
+        self.assertIn('Not enough stock', results[1]['errors'][0])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(Sale.objects.get(pk=results[0]['id']).items.get().quantity, 3)
+        self.assertEqual(Sale.objects.get(pk=results[0]['id']).user, self.cashier)
+
+    def test_sync_matches_single_checkout_amounts(self):
+        product = make_product(self.supplier, quantity=50)
+        sale_data = {'items': [{'product': product.id, 'quantity': 3, 'unit_price': '2.50'}],
+                     'discount_type': 'percentage', 'discount_value': '10'}
+        single = self.client.post('/api/sales/', sale_data, format='json')
+        synced = self.client.post('/api/sales/sync/', {'sales': [sale_data]}, format='json')
+
+        a = Sale.objects.get(pk=single.data['id'])
+        b = Sale.objects.get(pk=synced.data['results'][0]['id'])
+        self.assertEqual((a.subtotal, a.discount_amount, a.total_amount), (b.subtotal, b.discount_amount, b.total_amount))
+
+    def test_sync_rejects_unknown_products(self):
+        response = self.client.post('/api/sales/sync/', {'sales': [
+            {'items': [{'product': 9999, 'quantity': 1, 'unit_price': '1.00'}]},
+        ]}, format='json')
+
+        self.assertEqual(response.data['results'][0]['status'], 'rejected')
+        self.assertFalse(Sale.objects.exists())
+
+    def test_retried_batch_is_not_booked_twice(self):
+        product = make_product(self.supplier, quantity=10)
+        batch = {'sales': [self._queued_sale('a', (product, 2)), self._queued_sale('a', (product, 2))]}
+        first = self.client.post('/api/sales/sync/', batch, format='json').data['results']
+        retry = self.client.post('/api/sales/sync/', batch, format='json').data['results']
+
+        sale_id = first[0]['id']
+        self.assertEqual([(r['status'], r['id']) for r in first + retry], [('accepted', sale_id)] * 4)
+        self.assertEqual([r.get('replayed', False) for r in first + retry], [False, True, True, True])
+        product.refresh_from_db()
+        self.assertEqual((product.quantity, Sale.objects.count()), (8, 1))
+
+        # client_ids are only unique per cashier.
+        other = APIClient()
+        other.force_authenticate(make_user('till2', 'cashier'))
+        other.post('/api/sales/sync/', batch, format='json')
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_sync_keeps_the_terminal_sale_time(self):
+        product = make_product(self.supplier, quantity=10)
+        rung_up = timezone.now() - timedelta(days=2)
+        response = self.client.post('/api/sales/sync/', {'sales': [
+            {**self._queued_sale('a', (product, 1)), 'created_at': rung_up.isoformat()},
+            {**self._queued_sale('b', (product, 1)), 'created_at': (timezone.now() + timedelta(days=1)).isoformat()},
+        ]}, format='json')
+
+        past, future = (Sale.objects.get(pk=r['id']) for r in response.data['results'])
+        self.assertEqual(past.created_at, rung_up)
+        self.assertLessEqual(future.created_at, timezone.now())
+        # Counted on the day it was rung up, not the day of the sync
+        all_time, today = read_dashboard_rollups()
+        self.assertEqual((all_time.sales_count, today.sales_count), (2, 1))
+
+    def test_sync_query_count_is_independent_of_batch_size(self):
+        products = [make_product(self.supplier, name=f'P{i}', batch_number=f'B{i}') for i in range(5)]
+
+        def sync(count):
+            sales = [self._queued_sale(str(n), (products[n % 5], 1)) for n in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post('/api/sales/sync/', {'sales': sales}, format='json')
+            return len(ctx)
+
+        sync(1)  # warm up per-user role resolution
+        self.assertEqual(sync(2), sync(40))
+
+
+class CachedRoleTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.admin = make_user('boss', 'admin')
+        self.cashier = make_user('till1', 'cashier')
+        Group.objects.get_or_create(name='inventory_manager')
+
+    def _client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_warm_catalog_request_makes_no_auth_queries(self):
+        client = self._client(self.cashier)
+        self.assertEqual(client.get('/api/products/').status_code, 200)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(client.get('/api/products/').status_code, 200)
+        auth_queries = [q['sql'] for q in ctx.captured_queries if 'auth_' in q['sql']]
+        self.assertEqual(auth_queries, [])
+
+    def test_role_change_through_user_update_takes_effect_immediately(self):
+        cashier_client = self._client(self.cashier)
+        self.assertEqual(cashier_client.get('/api/sales/').status_code, 200)
+        self.assertEqual(cashier_client.get('/api/user/profile/').data['role'], 'cashier')
+
+        response = self._client(self.admin).patch(
+            f'/api/users/{self.cashier.id}/', {'role_name': 'inventory_manager'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(cashier_client.get('/api/sales/').status_code, 403)
+        self.assertEqual(cashier_client.get('/api/user/profile/').data['role'], 'inventory_manager')
+
+    def test_deactivated_user_is_rejected_immediately(self):
+        client = self._client(self.cashier)
+        self.assertEqual(client.get('/api/products/').status_code, 200)
+
+        self._client(self.admin).patch(f'/api/users/{self.cashier.id}/', {'is_active': False}, format='json')
+        self.assertEqual(client.get('/api/products/').status_code, 401)
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('boss', 'admin')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_dashboard_reflects_checkout_and_restock(self):
+        product = make_product(self.supplier, quantity=20)
+        make_product(self.supplier, name='Soon', batch_number='S1', quantity=12,
+                     expiry_date=timezone.localdate() + timedelta(days=10))
+        make_product(self.supplier, name='Gone', batch_number='G1', quantity=12,
+                     expiry_date=timezone.localdate() - timedelta(days=1))
+        self.client.post('/api/sales/', {
+            'items': [{'product': product.id, 'quantity': 4, 'unit_price': '2.50'}],
+        }, format='json')
+        self.client.post(f'/api/products/{product.id}/restock/', {
+            'quantity_added': 10, 'supplier_id': self.supplier.id, 'cost_per_unit': '1.00',
+        }, format='json')
+
+        data = self.client.get('/api/dashboard-stats/').data
+        self.assertEqual(data['total_revenue'], Decimal('10.00'))
+        self.assertEqual(data['products_in_stock'], 20 - 4 + 10 + 12 + 12)
+        self.assertEqual(data['sales_today'], 1)
+        self.assertEqual(data['expiring_soon'], 1)
+
+    def test_dashboard_cost_does_not_grow_with_sales(self):
+        product = make_product(self.supplier, quantity=500)
+        self.client.get('/api/dashboard-stats/')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get('/api/dashboard-stats/')
+        for _ in range(5):
+            self.client.post('/api/sales/', {
+                'items': [{'product': product.id, 'quantity': 1, 'unit_price': '2.50'}],
+            }, format='json')
+        with CaptureQueriesContext(connection) as after:
+            self.client.get('/api/dashboard-stats/')
+
+        self.assertEqual(len(before), len(after))
+        self.assertFalse(any('inventory_sale' in q['sql'] for q in after.captured_queries))
+
+
+class PromotionIndexTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.manager = make_user('boss', 'admin')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = make_product(self.supplier, price='10.00')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _promotion(self, value, *products):
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            promo = Promotion.objects.create(name=f'{value}% off', value=Decimal(value),
+                                             start_date=today, end_date=today + timedelta(days=7))
+            promo.products.set(products)
+        return promo
+
+    def _checkout(self):
+        response = self.client.post('/api/sales/', {
+            'items': [{'product': self.product.id, 'quantity': 1, 'unit_price': '10.00'}],
+        }, format='json')
+        return Sale.objects.get(pk=response.data['id'])
+
+    def test_largest_overlapping_promotion_wins(self):
+        self._promotion('15', self.product)
+        self._promotion('25', self.product)
+        self._promotion('5', self.product)
+
+        self.assertEqual(self._checkout().promotion_discount_amount, Decimal('2.50'))
+
+    def test_warm_checkout_makes_no_promotion_queries(self):
+        self._promotion('10', self.product)
+        self._checkout()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._checkout()
+        self.assertFalse(any('inventory_promotion' in q['sql'] for q in ctx.captured_queries))
+
+    def test_promotion_changes_rebuild_the_index(self):
+        other = make_product(self.supplier, name='Other', batch_number='O1')
+        promo = self._promotion('10', other)
+        self.assertEqual(self._checkout().promotion_discount_amount, 0)
+
+        manager = APIClient()
+        manager.force_authenticate(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            manager.patch(f'/api/promotions/{promo.id}/', {'products': [other.id, self.product.id]}, format='json')
+        self.assertEqual(self._checkout().promotion_discount_amount, Decimal('1.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            manager.patch(f'/api/promotions/{promo.id}/', {'is_active': False}, format='json')
+        self.assertEqual(self._checkout().promotion_discount_amount, 0)
+
+
+class SettingsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.admin = make_user('boss', 'admin')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _save(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/settings/', data, format='json')
+
+    def test_post_upserts_all_keys_in_one_statement(self):
+        self._save({'tax_rate': '5', 'store_name': 'Main'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._save({'tax_rate': '16', 'store_name': 'Vet Clinic', 'currency': 'KES'})
+
+        self.assertEqual(response.status_code, 200)
+        writes = [q for q in ctx.captured_queries if 'inventory_setting' in q['sql']]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.client.get('/api/settings/').data,
+                         {'tax_rate': '16', 'store_name': 'Vet Clinic', 'currency': 'KES'})
+
+    def test_invalid_typed_values_are_rejected(self):
+        response = self._save({'tax_rate': 'abc', 'low_stock_threshold': '5'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tax_rate', response.data)
+        self.assertEqual(self.client.get('/api/settings/').data, {})
+
+    def test_negative_counts_are_rejected(self):
+        response = self._save({'low_stock_threshold': '-5', 'expiry_warning_days': '-1', 'reorder_cover_days': '0'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'low_stock_threshold', 'expiry_warning_days'})
+        self.assertEqual(settings_registry.get_setting('low_stock_threshold'), 10)
+
+    def test_saved_settings_reach_other_worker_processes(self):
+        def version_seen_by_another_process():
+            return subprocess.run(
+                [sys.executable, 'manage.py', 'shell', '-v', '0', '-c',
+                 "from inventory import caching; print(caching.current_version('settings'))"],
+                capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+            ).stdout.strip()
+
+        before = version_seen_by_another_process()
+        self.assertEqual(caching.current_version('settings'), before)
+        self._save({'tax_rate': '16'})
+        self.assertEqual(version_seen_by_another_process(), caching.current_version('settings'))
+        self.assertNotEqual(caching.current_version('settings'), before)
+
+    def test_checkout_and_status_use_cached_settings(self):
+        self._save({'tax_rate': '10', 'low_stock_threshold': '25'})
+        product = make_product(self.supplier, quantity=20, price='10.00')
+        cashier = make_user('till1', 'cashier')
+        till = APIClient()
+        till.force_authenticate(cashier)
+        till.get('/api/products/')
+
+        with CaptureQueriesContext(connection) as ctx:
+            products = till.get('/api/products/').data['results']
+            response = till.post('/api/sales/', {
+                'items': [{'product': product.id, 'quantity': 1, 'unit_price': '10.00'}],
+            }, format='json')
+
+        self.assertEqual(products[0]['status'], 'low-stock')
+        self.assertEqual(Sale.objects.get(pk=response.data['id']).tax_amount, Decimal('1.00'))
+        self.assertFalse(any('inventory_setting' in q['sql'] for q in ctx.captured_queries))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.admin = make_user('boss', 'admin')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _walk(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            pages += 1
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_sales_with_identical_timestamps_are_paged_without_gaps(self):
+        sales = Sale.objects.bulk_create([Sale(total_amount=Decimal('1.00')) for _ in range(7)])
+        Sale.objects.update(created_at=timezone.now())
+
+        ids, pages = self._walk('/api/sales/', page_size=3)
+        self.assertEqual(ids, sorted(s.id for s in sales))
+        self.assertEqual(pages, 3)
+
+    def test_inserts_during_paging_do_not_shift_pages(self):
+        for i in range(6):
+            make_product(self.supplier, name=f'Drug {i}', batch_number=f'B{i}')
+        first = self.client.get('/api/products/', {'page_size': 3}).data
+        make_product(self.supplier, name='Aaa new', batch_number='N1')
+
+        second = self.client.get(first['next']).data
+        self.assertEqual([p['name'] for p in second['results']], ['Drug 3', 'Drug 4', 'Drug 5'])
+        previous = self.client.get(second['previous']).data
+        self.assertEqual([p['name'] for p in previous['results']], ['Drug 0', 'Drug 1', 'Drug 2'])
+
+    def test_tampered_cursors_are_not_found(self):
+        Sale.objects.create(total_amount=Decimal('1.00'))
+        for position in (['abc', '1'], [None, '1'], [[1], '1'], ['2024-01-01T00:00:00+00:00', 'x']):
+            cursor = base64.b64encode(urlencode({'p': json.dumps(position)}).encode()).decode()
+            response = self.client.get('/api/sales/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        for i in range(12):
+            make_product(self.supplier, name=f'Drug {i:02}', batch_number=f'B{i}')
+        response = self.client.get('/api/products/', {'page_size': 2})
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get('/api/products/', {'page_size': 2})
+        for _ in range(4):
+            response = self.client.get(response.data['next'])
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(response.data['next'])
+
+        self.assertEqual(len(first), len(deep))
+        self.assertFalse(any('OFFSET' in q['sql'] for q in deep.captured_queries))
+
+
+class ListQueryBudgetTests(TestCase):
+    """Each list endpoint must cost a fixed number of queries, however many rows it returns."""
+
+    def setUp(self):
+        clear_caches()
+        self.admin = make_user('boss', 'admin')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.client.get('/api/user/profile/')  # resolve the admin's roles once
+        self.created = 0
+
+    def assertQueryBudget(self, url, budget, add_rows):
+        def measure():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, {'page_size': 500})
+            self.assertEqual(response.status_code, 200)
+            return len(ctx)
+
+        add_rows(10)
+        measure()  # warm the per-process caches (roles, settings)
+        small = measure()
+        add_rows(40)
+        large = measure()
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, budget)
+
+    def _products(self, count):
+        products = []
+        for _ in range(count):
+            self.created += 1
+            products.append(make_product(self.supplier, name=f'Drug {self.created}', batch_number=f'B{self.created}'))
+        return products
+
+    def test_sales(self):
+        def add(count):
+            product, = self._products(1)
+            for _ in range(count):
+                sale = Sale.objects.create(user=self.admin, total_amount=Decimal('5.00'))
+                SaleItem.objects.bulk_create([
+                    SaleItem(sale=sale, product=product, quantity=1, unit_price=Decimal('2.50')) for _ in range(2)
+                ])
+        self.assertQueryBudget('/api/sales/', 2, add)
+
+    def test_users(self):
+        def add(count):
+            cashiers, _ = Group.objects.get_or_create(name='cashier')
+            for _ in range(count):
+                self.created += 1
+                User.objects.create(username=f'user{self.created}').groups.add(cashiers)
+        self.assertQueryBudget('/api/users/', 2, add)
+
+    def test_promotions(self):
+        def add(count):
+            products = self._products(2)
+            today = timezone.localdate()
+            for _ in range(count):
+                promo = Promotion.objects.create(name='Promo', value=Decimal('10'), start_date=today, end_date=today)
+                promo.products.set(products)
+        self.assertQueryBudget('/api/promotions/', 2, add)
+
+    def test_products(self):
+        # The page plus one query for the catalog ETag
+        self.assertQueryBudget('/api/products/', 2, self._products)
+
+    def test_restock_history(self):
+        def add(count):
+            product, = self._products(1)
+            for _ in range(count):
+                RestockHistory.objects.create(product=product, supplier=self.supplier, user=self.admin,
+                                              quantity_added=1, cost_per_unit=Decimal('1.00'))
+        self.assertQueryBudget('/api/restock-history/', 1, add)
+
+    def test_suppliers(self):
+        def add(count):
+            for _ in range(count):
+                self.created += 1
+                Supplier.objects.create(name=f'S{self.created}', email=f's{self.created}@example.com', phone='1')
+        self.assertQueryBudget('/api/suppliers/', 1, add)
+
+
+class ProductFilterTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.other_supplier = Supplier.objects.create(name='Vetco', email='vetco@example.com', phone='456')
+        today = timezone.localdate()
+        make_product(self.supplier, name='Expired', quantity=50, expiry_date=today - timedelta(days=1))
+        make_product(self.supplier, name='Empty', quantity=0)
+        make_product(self.supplier, name='Low', quantity=3, category='Vaccines')
+        make_product(self.other_supplier, name='Soon', quantity=50, expiry_date=today + timedelta(days=5))
+        make_product(self.other_supplier, name='Plenty', quantity=50, category='Vaccines')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _names(self, **params):
+        response = self.client.get('/api/products/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['name'] for row in response.data['results']]
+
+    def test_status_is_computed_in_the_database(self):
+        rows = self.client.get('/api/products/').data['results']
+        self.assertEqual({row['name']: row['status'] for row in rows}, {
+            'Expired': 'expired', 'Empty': 'out-of-stock', 'Low': 'low-stock',
+            'Soon': 'expiring-soon', 'Plenty': 'in-stock',
+        })
+        for product in Product.objects.all():
+            self.assertEqual(ProductSerializer(product).data['status'],
+                             next(row['status'] for row in rows if row['name'] == product.name))
+
+    def test_filters(self):
+        self.assertEqual(self._names(status='low-stock,out-of-stock'), ['Empty', 'Low'])
+        self.assertEqual(self._names(category='Vaccines'), ['Low', 'Plenty'])
+        self.assertEqual(self._names(supplier=self.other_supplier.id), ['Plenty', 'Soon'])
+        today = timezone.localdate()
+        self.assertEqual(self._names(expiry_after=today.isoformat(),
+                                     expiry_before=(today + timedelta(days=30)).isoformat()), ['Soon'])
+
+    def test_each_status_filter_matches_the_annotation(self):
+        make_product(self.supplier, name='Stale empty', quantity=0, expiry_date=timezone.localdate() - timedelta(days=3))
+        make_product(self.supplier, name='Low and soon', quantity=2, expiry_date=timezone.localdate() + timedelta(days=2))
+        rows = self.client.get('/api/products/').data['results']
+        for status in Product.STATUSES:
+            self.assertEqual(self._names(status=status), [row['name'] for row in rows if row['status'] == status])
+
+    def test_sorting_pages_through_every_row(self):
+        first = self.client.get('/api/products/', {'ordering': 'status', 'page_size': 2}).data
+        second = self.client.get(first['next']).data
+        third = self.client.get(second['next']).data
+        names = [row['name'] for page in (first, second, third) for row in page['results']]
+        self.assertEqual(names, ['Expired', 'Empty', 'Low', 'Soon', 'Plenty'])
+        descending = self.client.get('/api/products/', {'ordering': '-status', 'page_size': 3}).data
+        names = [row['name'] for page in (descending, self.client.get(descending['next']).data)
+                 for row in page['results']]
+        self.assertEqual(names, ['Plenty', 'Soon', 'Low', 'Empty', 'Expired'])
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get('/api/products/', {'status': 'bogus', 'expiry_after': '2026-13-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'status', 'expiry_after'})
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on the queries the hot endpoints actually issue against a
+    seeded database, and fails if any inventory table is read with a full table scan or
+    an unbounded walk over one of its indexes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('boss', 'admin')
+        suppliers = Supplier.objects.bulk_create([
+            Supplier(name=f'Supplier {i}', email=f's{i}@example.com', phone='1') for i in range(20)
+        ])
+        today = timezone.localdate()
+        Product.objects.bulk_create([
+            Product(name=f'Drug {i:04}', category=f'Category {i % 8}', batch_number=f'B{i}', unit='Tablets',
+                    expiry_date=today + timedelta(days=i % 400 - 20), quantity=i % 40, price=Decimal('2.00'),
+                    supplier=suppliers[i % 20])
+            for i in range(1000)
+        ])
+        products = list(Product.objects.all())
+        sales = Sale.objects.bulk_create([Sale(user=cls.admin, total_amount=Decimal('4.00')) for _ in range(300)])
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=products[i], quantity=1, unit_price=Decimal('2.00'))
+            for i, sale in enumerate(sales)
+        ])
+        RestockHistory.objects.bulk_create([
+            RestockHistory(product=products[i], supplier=suppliers[i % 20], user=cls.admin,
+                           quantity_added=5, cost_per_unit=Decimal('1.00'))
+            for i in range(300)
+        ])
+        for i in range(40):
+            promo = Promotion.objects.create(name=f'Promo {i}', value=Decimal('5'), is_active=i % 2 == 0,
+                                             start_date=today - timedelta(days=i), end_date=today + timedelta(days=i % 5))
+            promo.products.set(products[i * 5:i * 5 + 5])
+        cls.product_id = products[500].id
+        cls.supplier_id = suppliers[3].id
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def query_plans(self, method, url, data=None):
+        """Sends the request twice and returns (response, [(sql, plan steps)]) for the second."""
+        send = getattr(self.client, method)
+        send(url, data, format='json')  # warm the per-process caches
+        with CaptureQueriesContext(connection) as ctx:
+            response = send(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.data)
+
+        plans = []
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if 'inventory_' not in sql or not sql.startswith(('SELECT', 'UPDATE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return response, plans
+
+    def assertNoFullScans(self, method, url, data=None):
+        response, plans = self.query_plans(method, url, data)
+        for sql, plan in plans:
+            # Walking an index is only bounded when it yields the ORDER BY of a LIMITed query;
+            # otherwise it reads every entry, just like a table scan.
+            bounded = ' ORDER BY ' in sql and ' LIMIT ' in sql and 'USE TEMP B-TREE FOR ORDER BY' not in plan
+            full_scans = [step for step in plan if step.startswith('SCAN inventory_')
+                          and (' USING ' not in step or not bounded)]
+            self.assertEqual(full_scans, [], f'{url}: {sql}\n{plan}')
+        return response
+
+    def test_catalog_listing_and_filters(self):
+        today = timezone.localdate()
+        for params in ('', '&category=Category%203', f'&supplier={self.supplier_id}', '&ordering=expiry_date',
+                       '&ordering=-quantity', f'&expiry_after={today}&expiry_before={today + timedelta(days=30)}',
+                       '&status=low-stock', '&status=out-of-stock', '&status=expired,expiring-soon',
+                       '&status=in-stock'):
+            response = self.assertNoFullScans('get', f'/api/products/?page_size=20{params}')
+            self.assertNoFullScans('get', response.data['next'])
+
+    def test_status_filters_search_the_stock_indexes(self):
+        # A rare status would otherwise walk the name index until a page of matches turns up.
+        for status, index in (('out-of-stock', 'product_quantity_idx'), ('low-stock', 'product_quantity_idx'),
+                              ('expiring-soon', 'product_expiry_idx')):
+            _, plans = self.query_plans('get', f'/api/products/?page_size=20&status={status}')
+            steps = [step for sql, plan in plans if 'FROM "inventory_product"' in sql for step in plan]
+            self.assertIn(f'SEARCH inventory_product USING INDEX {index}', ' '.join(steps), steps)
+
+    def test_sales_and_restock_history_pages(self):
+        for url in ('/api/sales/', '/api/restock-history/'):
+            response = self.assertNoFullScans('get', url)
+            self.assertNoFullScans('get', response.data['next'])
+
+    def test_dashboard(self):
+        self.assertNoFullScans('get', '/api/dashboard-stats/')
+
+    def test_checkout(self):
+        self.assertNoFullScans('post', '/api/sales/', {
+            'items': [{'product': self.product_id, 'quantity': 1, 'unit_price': '2.00'}],
+        })
+
+    def test_promotion_index_lookup(self):
+        from inventory.promotions import build_promotion_index
+        with CaptureQueriesContext(connection) as ctx:
+            build_promotion_index(timezone.localdate())
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {ctx.captured_queries[0]['sql']}")
+            plan = [row[3] for row in cursor.fetchall()]
+        self.assertIn('promotion_active_range_idx', ' '.join(plan))
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.amoxicillin = make_product(self.supplier, name='Amoxicillin 250mg', category='Antibiotics', batch_number='AMX-01')
+        self.amoxiclav = make_product(self.supplier, name='Amoxiclav', category='Antibiotics', batch_number='CLV-7')
+        self.vaccine = make_product(self.supplier, name='Rabies Vaccine', category='Vaccines', batch_number='RAB-9')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _search(self, q, **params):
+        response = self.client.get('/api/products/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data]
+
+    def test_prefix_matches_on_name_category_and_batch(self):
+        self.assertEqual(sorted(self._search('amox')), ['Amoxicillin 250mg', 'Amoxiclav'])
+        self.assertEqual(self._search('vacc'), ['Rabies Vaccine'])
+        self.assertEqual(self._search('antib amoxicillin'), ['Amoxicillin 250mg'])
+        self.assertEqual(self._search('rab'), ['Rabies Vaccine'])
+
+    def test_exact_batch_number_hits_come_first(self):
+        make_product(self.supplier, name='Clv 7 strength tablets', category='Antibiotics', batch_number='X1')
+        self.assertEqual(self._search('clv-7')[0], 'Amoxiclav')
+
+    def test_index_follows_updates_and_deletes(self):
+        self.amoxiclav.name = 'Clavamox'
+        self.amoxiclav.save()
+        Product.objects.filter(pk=self.vaccine.pk).update(category='Biologicals')
+        self.amoxicillin.delete()
+
+        self.assertEqual(self._search('amox'), [])
+        self.assertEqual(self._search('clavam'), ['Clavamox'])
+        self.assertEqual(self._search('biolog'), ['Rabies Vaccine'])
+
+    def test_limit_and_fts_syntax_in_input(self):
+        self.assertEqual(len(self._search('a', limit=1)), 1)
+        # FTS5 operators in user input are matched as plain words, never parsed
+        self.assertEqual(self._search('"amox* OR ('), [])
+        self.assertEqual(self._search('  '), [])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.admin = make_user('boss', 'admin')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = make_product(self.supplier, name='Amoxicillin, 250mg')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        today = timezone.localdate()
+        for days_ago in (0, 3, 10):
+            sale = Sale.objects.create(user=self.admin, total_amount=Decimal('5.00'))
+            Sale.objects.filter(pk=sale.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=2, unit_price=Decimal('2.50'))
+        RestockHistory.objects.create(product=self.product, supplier=self.supplier, user=self.admin,
+                                      quantity_added=10, cost_per_unit=Decimal('1.20'), notes='Delivery "A"')
+        self.week_ago = (today - timedelta(days=7)).isoformat()
+
+    def _body(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_sales_csv_for_a_date_range(self):
+        response = self.client.get('/api/sales/export/', {'start': self.week_ago})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(self._body(response))))
+
+        self.assertEqual(rows[0][:3], ['sale_id', 'created_at', 'cashier'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][4], 'Amoxicillin, 250mg')
+
+    def test_restock_ndjson(self):
+        response = self.client.get('/api/restock-history/export/', {'output': 'ndjson'})
+        lines = [json.loads(line) for line in self._body(response).splitlines()]
+
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['notes'], 'Delivery "A"')
+        self.assertEqual(lines[0]['cost_per_unit'], '1.20')
+
+    def test_export_reads_rows_with_one_streamed_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._body(self.client.get('/api/sales/export/'))
+        self.assertEqual(sum('inventory_saleitem' in q['sql'] for q in ctx.captured_queries), 1)
+
+    async def test_asgi_export_streams_in_batches(self):
+        expected = await sync_to_async(lambda: self._body(self.client.get('/api/sales/export/')))()
+        token = await sync_to_async(lambda: f'Bearer {RefreshToken.for_user(self.admin).access_token}')()
+        with mock.patch('api.exports.EXPORT_CHUNK_SIZE', 2):
+            response = await AsyncClient().get('/api/sales/export/', headers={'Authorization': token})
+            # An async iterator is sent as it is read, rather than listed in full first.
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(b''.join(chunks).decode(), expected)
+
+    def test_validation_and_permissions(self):
+        self.assertEqual(self.client.get('/api/sales/export/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sales/export/', {'end': '17/10/2026'}).status_code, 400)
+        till = APIClient()
+        till.force_authenticate(make_user('till1', 'cashier'))
+        self.assertEqual(till.get('/api/sales/export/').status_code, 403)
+
+
+class ProductImportTests(TestCase):
+    HEADER = 'name,category,batch_number,expiry_date,unit,quantity,price,supplier,cost_per_unit\n'
+
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('stock', 'inventory_manager')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _import(self, body):
+        upload = SimpleUploadedFile('prices.csv', (self.HEADER + body).encode(), content_type='text/csv')
+        return self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+
+    def test_upserts_on_name_and_batch_and_records_restocks(self):
+        existing = make_product(self.supplier, name='Amoxicillin', batch_number='A1', quantity=5, price='2.00')
+        s = self.supplier.id
+        response = self._import(
+            f'Amoxicillin,Antibiotics,A1,2030-01-01,Tablets,10,2.40,{s},1.10\n'
+            f'Amoxicillin,Antibiotics,A2,2031-01-01,Tablets,20,2.40,{s},1.10\n'
+            f'Meloxicam,NSAIDs,,2030-06-01,ml,,9.99,{s},\n'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['restocked_units']),
+                         (2, 1, 30))
+        existing.refresh_from_db()
+        self.assertEqual((existing.quantity, existing.price), (15, Decimal('2.40')))
+        self.assertEqual(Product.objects.get(batch_number='A2').quantity, 20)
+        self.assertEqual(Product.objects.get(name='Meloxicam').quantity, 0)
+        self.assertEqual(sorted(RestockHistory.objects.values_list('quantity_added', flat=True)), [10, 20])
+
+    def test_reports_invalid_rows_and_imports_the_rest(self):
+        s = self.supplier.id
+        response = self._import(
+            f'Good,Cat,G1,2030-01-01,Tablets,1,1.00,{s},\n'
+            f'Bad date,Cat,B1,01/01/2030,Tablets,1,1.00,{s},\n'
+            f'No supplier,Cat,N1,2030-01-01,Tablets,1,1.00,999,\n'
+            f',Cat,E1,2030-01-01,Tablets,-3,1.00,{s},\n'
+        )
+
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['error_count'], 3)
+        errors = {e['row']: e['errors'] for e in response.data['errors']}
+        self.assertEqual(set(errors), {3, 4, 5})
+        self.assertIn('expiry_date', errors[3])
+        self.assertIn('supplier', errors[4])
+        self.assertEqual(set(errors[5]), {'name', 'quantity'})
+
+    def test_rows_are_written_in_bulk(self):
+        def run(count, prefix):
+            body = ''.join(f'{prefix}{i},Cat,B{i},2030-01-01,Tablets,3,1.00,{self.supplier.id},0.5\n'
+                           for i in range(count))
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._import(body).data['error_count'], 0)
+            return len(ctx)
+
+        run(1, 'Warm')  # creates the rollup rows
+        # bulk_create/bulk_update split statements at SQLite's parameter limit, so
+        # 400 rows cost a few extra statements, never one per row.
+        self.assertLess(run(400, 'Large'), run(5, 'Small') + 10)
+        self.assertEqual(Product.objects.filter(name__startswith='Large').count(), 400)
+
+
+class RestockDeliveryTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('stock', 'inventory_manager')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.other = Supplier.objects.create(name='Vetco', email='vetco@example.com', phone='456')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _deliver(self, items, **extra):
+        return self.client.post('/api/products/restock/', {
+            'supplier_id': self.supplier.id, 'items': items, **extra,
+        }, format='json')
+
+    def _line(self, product, quantity, **extra):
+        return {'product_id': product.id, 'quantity_added': quantity, 'cost_per_unit': '1.20', **extra}
+
+    def test_books_every_line_and_adds_to_current_stock(self):
+        first = make_product(self.supplier, name='Amoxicillin', quantity=5)
+        second = make_product(self.supplier, name='Meloxicam', batch_number='M1', quantity=0)
+        # A sale committed after the manager loaded the page must not be overwritten.
+        Product.objects.filter(pk=first.pk).update(quantity=3)
+
+        response = self._deliver([
+            self._line(first, 10),
+            self._line(second, 4, supplier_id=self.other.id, notes='Backorder'),
+            self._line(first, 2),
+        ], notes='Invoice 77')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['restocked_units'], 16)
+        quantities = {p['id']: p['quantity'] for p in response.data['products']}
+        self.assertEqual(quantities, {first.id: 15, second.id: 4})
+        history = RestockHistory.objects.order_by('id')
+        self.assertEqual([(h.product_id, h.supplier_id, h.quantity_added, h.notes) for h in history], [
+            (first.id, self.supplier.id, 10, 'Invoice 77'),
+            (second.id, self.other.id, 4, 'Backorder'),
+            (first.id, self.supplier.id, 2, 'Invoice 77'),
+        ])
+
+    def test_unknown_supplier_or_product_rejects_the_whole_delivery(self):
+        product = make_product(self.supplier, quantity=5)
+        response = self._deliver([
+            self._line(product, 10),
+            self._line(product, 1, supplier_id=999),
+            {'product_id': 999, 'quantity_added': 1, 'cost_per_unit': '1.00'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'][0], {})
+        self.assertIn('supplier_id', response.data['items'][1])
+        self.assertIn('product_id', response.data['items'][2])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 5)
+        self.assertFalse(RestockHistory.objects.exists())
+
+    def test_query_count_does_not_grow_with_delivery_size(self):
+        products = [make_product(self.supplier, name=f'Drug {i}', batch_number=f'D{i}', quantity=1)
+                    for i in range(60)]
+
+        def run(count):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._deliver([self._line(p, 1) for p in products[:count]]).status_code, 200)
+            return len(ctx)
+
+        run(1)  # creates the rollup rows
+        self.assertEqual(run(60), run(3))
+
+    def test_single_product_restock_checks_supplier(self):
+        product = make_product(self.supplier, quantity=5)
+        url = f'/api/products/{product.id}/restock/'
+        response = self.client.post(url, {'quantity_added': 5, 'supplier_id': 999, 'cost_per_unit': '1.00'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('supplier_id', response.data)
+
+        response = self.client.post(url, {'quantity_added': 5, 'supplier_id': self.supplier.id,
+                                          'cost_per_unit': '1.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quantity'], 10)
+        self.assertEqual(RestockHistory.objects.get().quantity_added, 5)
+
+
+class SupplierStatsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('stock', 'inventory_manager')
+        self.acme = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.vetco = Supplier.objects.create(name='Vetco', email='vetco@example.com', phone='456')
+        self.idle = Supplier.objects.create(name='Idle', email='idle@example.com', phone='789')
+        product = make_product(self.acme)
+        for supplier, quantity, cost in ((self.acme, 10, '1.50'), (self.acme, 4, '2.00'), (self.vetco, 100, '0.25')):
+            RestockHistory.objects.create(product=product, supplier=supplier, user=self.manager,
+                                          quantity_added=quantity, cost_per_unit=Decimal(cost))
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _rows(self, **params):
+        response = self.client.get('/api/suppliers/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_stats_come_from_restock_history(self):
+        rows = {row['name']: row for row in self._rows()}
+        self.assertEqual((rows['Acme']['totalOrders'], rows['Acme']['totalSpend']), (2, '23.00'))
+        self.assertEqual((rows['Vetco']['totalOrders'], rows['Vetco']['totalSpend']), (1, '25.00'))
+        self.assertEqual((rows['Idle']['totalOrders'], rows['Idle']['lastOrder'], rows['Idle']['totalSpend']),
+                         (0, 'N/A', '0.00'))
+        self.assertNotEqual(rows['Acme']['lastOrder'], 'N/A')
+
+    def test_sorting_and_filtering_on_stats(self):
+        self.assertEqual([row['name'] for row in self._rows(ordering='-total_spend')], ['Vetco', 'Acme', 'Idle'])
+        self.assertEqual([row['name'] for row in self._rows(ordering='-restock_count')][0], 'Acme')
+        self.assertEqual([row['name'] for row in self._rows(min_orders=1, min_spend='24')], ['Vetco'])
+        today = timezone.localdate().isoformat()
+        self.assertEqual([row['name'] for row in self._rows(ordered_after=today)], ['Acme', 'Vetco'])
+        response = self.client.get('/api/suppliers/', {'min_spend': 'lots'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_is_one_query(self):
+        self._rows()
+        with CaptureQueriesContext(connection) as ctx:
+            self._rows(ordering='last_restock')
+        self.assertEqual(len(ctx), 1)
+
+
+class SalesReportTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('boss', 'inventory_manager')
+        self.cashier = make_user('till1', 'cashier')
+        supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.amox = make_product(supplier, name='Amoxicillin', category='Antibiotics')
+        self.melox = make_product(supplier, name='Meloxicam', category='NSAIDs', batch_number='M1')
+        self.today = timezone.localdate()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _sale(self, days_ago, lines, discount='0', tax='0'):
+        subtotal = sum(Decimal(price) * quantity for _, quantity, price in lines)
+        sale = Sale.objects.create(user=self.cashier, subtotal=subtotal, discount_amount=Decimal(discount),
+                                   tax_amount=Decimal(tax), total_amount=subtotal - Decimal(discount) + Decimal(tax))
+        SaleItem.objects.bulk_create([SaleItem(sale=sale, product=product, quantity=quantity, unit_price=Decimal(price))
+                                      for product, quantity, price in lines])
+        Sale.objects.filter(pk=sale.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return sale
+
+    def _report(self, **params):
+        response = self.client.get('/api/reports/sales/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def test_daily_totals_and_product_split(self):
+        self._sale(2, [(self.amox, 2, '10.00'), (self.melox, 1, '20.00')], discount='4.00', tax='3.60')
+        self._sale(2, [(self.amox, 1, '10.00')])
+        self._sale(0, [(self.melox, 3, '20.00')])
+
+        rows = self._report(start=(self.today - timedelta(days=2)).isoformat())
+        self.assertEqual([(r['period_start'], r['sales_count'], r['units'], r['revenue']) for r in rows], [
+            (self.today - timedelta(days=2), 2, 4, Decimal('49.60')),
+            (self.today, 1, 3, Decimal('60.00')),
+        ])
+
+        rows = self._report(start=(self.today - timedelta(days=2)).isoformat(), end=(self.today - timedelta(days=2)).isoformat(),
+                            group_by='product')
+        by_name = {r['label']: r for r in rows}
+        # The sale's discount and tax are split 50/50: both lines are worth 20.00.
+        self.assertEqual((by_name['Amoxicillin']['units'], by_name['Amoxicillin']['revenue'],
+                          by_name['Amoxicillin']['discounts'], by_name['Amoxicillin']['tax']),
+                         (3, Decimal('29.80'), Decimal('2.00'), Decimal('1.80')))
+        self.assertEqual(by_name['Meloxicam']['revenue'], Decimal('19.80'))
+
+    def test_week_month_and_cashier_grouping(self):
+        self._sale(0, [(self.amox, 1, '10.00')])
+        rows = self._report(period='month', group_by='cashier', start=self.today.isoformat())
+        self.assertEqual([(r['period_start'], r['label'], r['revenue']) for r in rows],
+                         [(self.today.replace(day=1), 'till1', Decimal('10.00'))])
+        rows = self._report(period='week', group_by='category', start=self.today.isoformat())
+        self.assertEqual(rows[0]['period_start'], self.today - timedelta(days=self.today.weekday()))
+        self.assertEqual(rows[0]['label'], 'Antibiotics')
+        response = self.client.get('/api/reports/sales/', {'period': 'year'})
+        self.assertEqual(response.status_code, 400)
+        for period in reports.PERIODS:
+            response = self.client.get('/api/reports/sales/', {'period': period, 'start': '9999-12-01',
+                                                               'end': '9999-12-31'})
+            self.assertEqual(response.status_code, 400, period)
+            self.assertIn('end', response.data)
+
+    def test_closed_buckets_are_served_from_the_cache(self):
+        self._sale(10, [(self.amox, 1, '10.00')])
+        self._sale(0, [(self.amox, 1, '10.00')])
+        params = {'start': (self.today - timedelta(days=365)).isoformat()}
+        first = self._report(**params)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._report(**params), first)
+        # Only the open day is aggregated again.
+        self.assertEqual(len(ctx), 1, [q['sql'] for q in ctx.captured_queries])
+
+    def test_editing_a_past_sale_invalidates_cached_buckets(self):
+        sale = self._sale(3, [(self.amox, 1, '10.00')])
+        params = {'start': (self.today - timedelta(days=5)).isoformat(), 'end': (self.today - timedelta(days=1)).isoformat()}
+        self.assertEqual(len(self._report(**params)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.delete()
+        self.assertEqual(self._report(**params), [])
+
+
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.amox = make_product(self.supplier, name='Amoxicillin')
+        self.melox = make_product(self.supplier, name='Meloxicam', batch_number='M1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _changes(self, token=None):
+        response = self.client.get('/api/products/changes/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def _age(self, seconds=120):
+        # Moves every existing change out of the sync overlap window.
+        past = timezone.now() - timedelta(seconds=seconds)
+        Product.objects.update(updated_at=past)
+        Supplier.objects.update(updated_at=past)
+
+    def test_delta_returns_changes_and_tombstones(self):
+        self._age()
+        first = self._changes()
+        self.assertTrue(first['reset'])
+        self.assertEqual(len(first['products']), 2)
+
+        self.assertEqual(self._changes(first['token'])['products'], [])
+
+        Product.objects.filter(pk=self.amox.pk).update(price=Decimal('3.00'), updated_at=timezone.now())
+        deleted_id = self.melox.id
+        self.melox.delete()
+        delta = self._changes(first['token'])
+        self.assertFalse(delta['reset'])
+        self.assertEqual([(p['id'], p['price']) for p in delta['products']], [(self.amox.id, '3.00')])
+        self.assertEqual(delta['deleted'], [deleted_id])
+
+    def test_supplier_rename_and_threshold_change(self):
+        self._age()
+        token = self._changes()['token']
+        self.supplier.name = 'Acme Vet'
+        self.supplier.save()
+        self.assertEqual({p['supplier_name'] for p in self._changes(token)['products']}, {'Acme Vet'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(make_user('boss', 'admin'))
+            self.client.post('/api/settings/', {'low_stock_threshold': '100'}, format='json')
+        self.assertTrue(self._changes(token)['reset'])
+
+    def test_new_day_resends_only_products_whose_expiry_status_changed(self):
+        today = timezone.localdate()
+        expired = make_product(self.supplier, name='Expired', batch_number='E1', expiry_date=today - timedelta(days=1))
+        expiring = make_product(self.supplier, name='Expiring', batch_number='E2', expiry_date=today + timedelta(days=30))
+        make_product(self.supplier, name='Expired long ago', batch_number='E3', expiry_date=today - timedelta(days=9))
+        self._age()
+        yesterdays_token = catalog.make_token(timezone.now(), today - timedelta(days=1))
+
+        delta = self._changes(yesterdays_token)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(sorted(p['id'] for p in delta['products']), [expired.id, expiring.id])
+        self.assertEqual({p['status'] for p in delta['products']}, {'expired', 'expiring-soon'})
+
+    def test_sync_is_paged_with_one_token(self):
+        for i in range(5):
+            make_product(self.supplier, name=f'Drug {i}', batch_number=f'D{i}')
+        response = self.client.get('/api/products/changes/', {'page_size': 3})
+        token, ids = response.data['token'], [p['id'] for p in response.data['products']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertTrue(response.data['reset'])
+            self.assertEqual(response.data['token'], token)
+            ids += [p['id'] for p in response.data['products']]
+
+        self.assertEqual(ids, sorted(Product.objects.values_list('id', flat=True)))
+        self.assertEqual(self.client.get('/api/products/changes/', {'cursor': 'forged'}).status_code, 400)
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/products/changes/', {'since': 'forged'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_list_supports_conditional_get(self):
+        response = self.client.get('/api/products/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another page or filter is another representation.
+        self.assertNotEqual(self.client.get('/api/products/', {'category': 'Antibiotics'})['ETag'], etag)
+
+        Product.objects.filter(pk=self.amox.pk).update(quantity=1, updated_at=timezone.now())
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = make_user('Till1', 'cashier')
+        self.client = APIClient()
+
+    def _login(self, username, password='pass12345'):
+        hashes = []
+        original = PBKDF2PasswordHasher.encode
+
+        def counting_encode(hasher, *args, **kwargs):
+            hashes.append(1)
+            return original(hasher, *args, **kwargs)
+
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', counting_encode), \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/token/', {'username': username, 'password': password}, format='json')
+        return response, len(hashes), [q['sql'] for q in ctx.captured_queries]
+
+    def test_username_or_email_in_any_case(self):
+        for login in ('Till1', 'till1', 'TILL1@example.com'):
+            response, hashes, queries = self._login(login)
+            self.assertEqual(response.status_code, 200, login)
+            self.assertIn('access', response.data)
+            self.assertEqual(hashes, 1)
+            # User lookup, then a single last_login write
+            self.assertEqual(len(queries), 2, queries)
+            self.assertEqual(sum('"last_login"' in q and q.startswith('UPDATE') for q in queries), 1)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_non_ascii_logins(self):
+        user = User.objects.create_user(username='Émile', email='Émile@Example.com', password='pass12345')
+        for login in ('Émile', 'ÉMILE', 'Émile@Example.com', 'ÉMILE@example.com'):
+            self.assertEqual(authenticate(username=login, password='pass12345'), user, login)
+
+    def test_failed_logins_hash_once(self):
+        for login, password in (('till1', 'wrong'), ('nobody', 'pass12345')):
+            response, hashes, queries = self._login(login, password)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(hashes, 1)
+            self.assertEqual(len(queries), 1)
+
+    def test_ambiguous_email_matches_nobody(self):
+        User.objects.create_user(username='twin', email='till1@example.com', password='pass12345')
+        self.assertEqual(self._login('till1@example.com')[0].status_code, 401)
+        self.assertEqual(self._login('twin')[0].status_code, 200)
+
+    def test_lookup_uses_the_expression_indexes(self):
+        _, _, queries = self._login('till1')
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN SELECT id FROM auth_user WHERE LOWER(username) = %s OR LOWER(email) = %s',
+                           ['till1', 'till1'])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('auth_user_username_lower_idx', plan)
+        self.assertIn('auth_user_email_lower_idx', plan)
+        self.assertIn('LOWER("auth_user"."username") = ', queries[0])
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        call_command('seed_data', suppliers=2, products=30, promotions=2, restocks=5, sales=20,
+                     cashiers=2, batch_size=50, stdout=io.StringIO())
+
+    def test_reports_every_scenario_and_compares_with_baseline(self):
+        baseline = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        out = io.StringIO()
+        call_command('benchmark', requests=3, warmup=0, save_baseline=baseline, stdout=out)
+        with open(baseline) as f:
+            results = json.load(f)
+
+        self.assertEqual(set(results), set(SCENARIOS))
+        for name, result in results.items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreater(result['throughput'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+            self.assertGreater(result['queries'], 0)
+
+        # A baseline with fewer queries per request flags the run as a regression
+        results['catalog']['queries'] = 0.5
+        with open(baseline, 'w') as f:
+            json.dump(results, f)
+        with self.assertRaises(CommandError):
+            call_command('benchmark', requests=3, warmup=0, scenarios='catalog', baseline=baseline,
+                         fail_on_regression=True, stdout=io.StringIO())
+
+    def test_compare_tolerance(self):
+        baseline = {'catalog': {'throughput': 100.0, 'p50': 10.0, 'p95': 20.0, 'p99': 30.0, 'queries': 2}}
+        current = {'catalog': {'throughput': 90.0, 'p50': 11.0, 'p95': 30.0, 'p99': 30.0, 'queries': 2}}
+        regressed = {metric for _, metric, _, _, _, bad in compare(current, baseline, 0.2) if bad}
+        self.assertEqual(regressed, {'p95'})
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        metrics.reset()
+        self.admin = make_user('boss', 'admin')
+        self.cashier = make_user('till1', 'cashier')
+        supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = make_product(supplier, 'Amoxicillin', 20, '5.00')
+        self.client = APIClient()
+
+    def _timings(self, response):
+        parts = [part.strip().split(';') for part in response['Server-Timing'].split(',')]
+        return {name: dict(field.split('=', 1) for field in fields) for name, *fields in parts}
+
+    def test_server_timing_reports_queries_and_phases(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.cashier).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/sales/', {
+                'items': [{'product': self.product.id, 'quantity': 2, 'unit_price': '5.00'}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        timings = self._timings(response)
+        self.assertEqual(set(timings), {'db', 'auth', 'serializer', 'total'})
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        for name in ('auth', 'serializer'):
+            self.assertGreater(float(timings[name]['dur']), 0)
+        self.assertLess(float(timings['db']['dur']) + float(timings['serializer']['dur']),
+                        float(timings['total']['dur']))
+
+    def test_metrics_endpoint_serves_histograms(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+        body = response.content.decode()
+        self.assertIn('# TYPE vetpos_request_duration_seconds histogram', body)
+        self.assertIn('vetpos_request_duration_seconds_count{view="product-list",method="GET"} 2', body)
+        self.assertIn('vetpos_request_duration_seconds_bucket{view="product-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('vetpos_db_queries_count{view="product-list",method="GET"} 2', body)
+        self.assertIn('vetpos_phase_duration_seconds_count{view="product-list",method="GET",phase="serializer"} 2',
+                      body)
+
+    def test_metrics_access(self):
+        self.client.force_authenticate(self.cashier)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+
+
+class LockRetryTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = make_product(supplier, 'Amoxicillin', 20, '5.00')
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+
+    def _outside_transaction(self):
+        # TestCase wraps every test in a transaction, where retrying is refused.
+        return mock.patch('api.checkout.connection', mock.Mock(in_atomic_block=False))
+
+    def test_checkout_is_rerun_when_the_database_is_locked(self):
+        real_create = SaleCreateSerializer.create
+        calls = []
+
+        def flaky_create(serializer, validated_data):
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return real_create(serializer, validated_data)
+
+        with self._outside_transaction(), mock.patch('api.checkout.time.sleep') as sleep, \
+                mock.patch.object(SaleCreateSerializer, 'create', flaky_create):
+            response = self.client.post('/api/sales/', {
+                'items': [{'product': self.product.id, 'quantity': 2, 'unit_price': '5.00'}]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 18)
+
+    def test_retries_are_bounded(self):
+        func = mock.Mock(side_effect=OperationalError('database is locked'))
+        with self._outside_transaction(), mock.patch('api.checkout.time.sleep') as sleep:
+            with self.assertRaises(OperationalError):
+                retry_on_lock(func)
+        self.assertEqual(func.call_count, LOCK_RETRY_ATTEMPTS)
+        self.assertTrue(all(call.args[0] <= LOCK_RETRY_MAX_DELAY for call in sleep.call_args_list))
+
+    def test_other_errors_and_outer_transactions_are_not_retried(self):
+        func = mock.Mock(side_effect=OperationalError('no such table: inventory_sale'))
+        with self._outside_transaction(), self.assertRaises(OperationalError):
+            retry_on_lock(func)
+        self.assertEqual(func.call_count, 1)
+
+        func = mock.Mock(side_effect=OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            retry_on_lock(func)
+        self.assertEqual(func.call_count, 1)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_user_profile(request):
+    """user_profile as it was before it became async; the reference for AsyncReadViewTests."""
+    user = request.user
+    roles = user_roles(user)
+    return Response({
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'role': roles[0] if roles else None
+    })
+
+
+class SyncDashboardStatsView(APIView):
+    """DashboardStatsView as it was before it became async; the reference for AsyncReadViewTests."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        today = timezone.localdate()
+        all_time, today_rollup = read_dashboard_rollups(today)
+        low_stock_threshold = settings_registry.get_setting('low_stock_threshold')
+        expiry_warning_days = settings_registry.get_setting('expiry_warning_days')
+        return Response({
+            'total_revenue': all_time.revenue,
+            'products_in_stock': all_time.stock_units,
+            'sales_today': today_rollup.sales_count,
+            'low_stock_alerts': Product.objects.filter(quantity__lt=low_stock_threshold).count(),
+            'expiring_soon': Product.objects.filter(
+                quantity__gt=0,
+                expiry_date__gte=today,
+                expiry_date__lte=today + timedelta(days=expiry_warning_days),
+            ).count(),
+        })
+
+
+class AsyncReadViewTests(TestCase):
+    """The async read views must answer exactly like the synchronous views they replaced."""
+
+    def setUp(self):
+        clear_caches()
+        self.cashier = make_user('till1', 'cashier')
+        supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = make_product(supplier, 'Amoxicillin', 20, '5.00')
+        make_product(supplier, 'Ivermectin', 3, '9.00', batch_number='IV1')
+        self.token = f'Bearer {RefreshToken.for_user(self.cashier).access_token}'
+
+    def test_views_are_coroutines(self):
+        for url in ('/api/user/profile/', '/api/dashboard-stats/', '/api/products/', '/api/products.json',
+                    f'/api/products/{self.product.id}/', f'/api/products/{self.product.id}.json'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), url)
+
+    async def test_asgi_responses_match_the_synchronous_views(self):
+        product_list = ProductViewSet.as_view({'get': 'list'})
+        product_detail = ProductViewSet.as_view({'get': 'retrieve'})
+        cases = [
+            ('/api/user/profile/', sync_user_profile, {}),
+            ('/api/dashboard-stats/', SyncDashboardStatsView.as_view(), {}),
+            ('/api/products/?status=low-stock', product_list, {}),
+            ('/api/products/?ordering=-price&page_size=1', product_list, {}),
+            (f'/api/products/{self.product.id}/', product_detail, {'pk': self.product.id}),
+            ('/api/products/999999/', product_detail, {'pk': 999999}),
+        ]
+        async_client = AsyncClient()
+        for url, view, kwargs in cases:
+            request = APIRequestFactory().get(url, HTTP_AUTHORIZATION=self.token)
+            expected = (await sync_to_async(view)(request, **kwargs)).render()
+            response = await async_client.get(url, headers={'Authorization': self.token})
+            self.assertEqual(response.status_code, expected.status_code, url)
+            self.assertEqual(response.json(), json.loads(expected.content), url)
+            self.assertIn('Server-Timing', response)
+
+        response = await async_client.get('/api/products/')
+        self.assertEqual(response.status_code, 401)
+        for url in ('/api/products/', '/api/products.json'):
+            listing = await async_client.get(url, headers={'Authorization': self.token})
+            unchanged = await async_client.get(url, headers={
+                'Authorization': self.token, 'If-None-Match': listing['ETag']})
+            self.assertEqual(unchanged.status_code, 304, url)
+
+    async def test_writes_to_product_urls_stay_synchronous(self):
+        response = await AsyncClient().post('/api/products/', {}, content_type='application/json',
+                                           headers={'Authorization': self.token})
+        # Cashiers may not create products: the viewset's permission check answered.
+        self.assertEqual(response.status_code, 403)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('stock', 'inventory_manager')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = make_product(self.supplier, quantity=50)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _movements(self):
+        return list(StockMovement.objects.filter(product=self.product)
+                    .values_list('kind', 'quantity', 'reference').order_by('id'))
+
+    def test_every_stock_path_writes_the_ledger(self):
+        cashier = make_user('till1', 'cashier')
+        till = APIClient()
+        till.force_authenticate(cashier)
+        line = {'product': self.product.id, 'quantity': 2, 'unit_price': '2.50'}
+        sale = till.post('/api/sales/', {'items': [line, line]}, format='json').data
+        synced = till.post('/api/sales/sync/', {'sales': [{'items': [line]}]}, format='json').data['results'][0]
+        self.client.post('/api/products/restock/', {'supplier_id': self.supplier.id, 'items': [
+            {'product_id': self.product.id, 'quantity_added': 10, 'cost_per_unit': '1.20'}]}, format='json')
+        upload = SimpleUploadedFile('stock.csv', (
+            'name,category,batch_number,expiry_date,unit,quantity,price,supplier,cost_per_unit\n'
+            f'Amoxicillin,Antibiotics,B1,2030-01-01,Tablets,7,2.50,{self.supplier.id},1.10\n').encode())
+        self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.client.patch(f'/api/products/{self.product.id}/', {'quantity': 60}, format='json')
+
+        restock, imported = RestockHistory.objects.order_by('id')
+        self.assertEqual(self._movements(), [
+            (StockMovement.OPENING, 50, f'product:{self.product.id}'),
+            (StockMovement.SALE, -4, f"sale:{sale['id']}"),
+            (StockMovement.SALE, -2, f"sale:{synced['id']}"),
+            (StockMovement.RESTOCK, 10, f'restock:{restock.id}'),
+            (StockMovement.IMPORT, 7, f'restock:{imported.id}'),
+            (StockMovement.ADJUSTMENT, -1, f'product:{self.product.id}'),
+        ])
+        self.assertEqual(StockMovement.objects.get(kind=StockMovement.SALE, quantity=-4).user, cashier)
+        self.assertEqual(ledger.verify_ledger(), [])
+
+    def test_manual_edit_does_not_overwrite_a_concurrent_sale(self):
+        get_object = ProductViewSet.get_object
+        cashier = make_user('till1', 'cashier')
+
+        def sell_after_read(view):
+            product = get_object(view)
+            # A till's checkout commits after the edit read the product.
+            serializer = SaleCreateSerializer(data={'items': [
+                {'product': product.id, 'quantity': 3, 'unit_price': '2.50'}]})
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=cashier)
+            return product
+
+        with mock.patch.object(ProductViewSet, 'get_object', autospec=True, side_effect=sell_after_read):
+            self.client.patch(f'/api/products/{self.product.id}/', {'price': '3.00'}, format='json')
+            self.product.refresh_from_db()
+            self.assertEqual((self.product.quantity, self.product.price), (47, Decimal('3.00')))
+            self.client.patch(f'/api/products/{self.product.id}/', {'quantity': 40}, format='json')
+
+        # The edit sets 40 on top of the second sale, so the adjustment is from 44.
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 40)
+        self.assertEqual([(kind, quantity) for kind, quantity, _ in self._movements()[-2:]],
+                         [(StockMovement.SALE, -3), (StockMovement.ADJUSTMENT, -4)])
+        self.assertEqual(ledger.verify_ledger(), [])
+        self.assertEqual(read_dashboard_rollups()[0].stock_units, 40)
+
+    def test_rejected_checkout_leaves_no_movement(self):
+        till = APIClient()
+        till.force_authenticate(make_user('till1', 'cashier'))
+        response = till.post('/api/sales/', {'items': [
+            {'product': self.product.id, 'quantity': 500, 'unit_price': '2.50'}]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([kind for kind, _, _ in self._movements()], [StockMovement.OPENING])
+
+    def test_stock_at_reports_end_of_day_balances(self):
+        StockMovement.objects.update(created_at=timezone.now() - timedelta(days=3))
+        self.client.patch(f'/api/products/{self.product.id}/', {'quantity': 20}, format='json')
+        two_days_ago = (timezone.localdate() - timedelta(days=2)).isoformat()
+
+        response = self.client.get('/api/products/stock-at/', {'date': two_days_ago})
+        self.assertEqual(response.data['stock'], {str(self.product.id): 50})
+        response = self.client.get('/api/products/stock-at/', {
+            'date': timezone.localdate().isoformat(), 'product': f'{self.product.id},999'})
+        self.assertEqual(response.data['stock'], {str(self.product.id): 20, '999': 0})
+
+        self.assertEqual(self.client.get('/api/products/stock-at/').status_code, 400)
+        for future in ((timezone.localdate() + timedelta(days=1)).isoformat(), '9999-12-31'):
+            response = self.client.get('/api/products/stock-at/', {'date': future})
+            self.assertEqual(response.status_code, 400, future)
+            self.assertIn('date', response.data)
+        till = APIClient()
+        till.force_authenticate(make_user('till1', 'cashier'))
+        self.assertEqual(till.get('/api/products/stock-at/', {'date': two_days_ago}).status_code, 403)
+
+
+class ReorderSuggestionEndpointTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = make_user('stock', 'inventory_manager')
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.other = Supplier.objects.create(name='Vetco', email='vetco@example.com', phone='456')
+        fast = make_product(self.supplier, name='Fast', quantity=10)
+        slow = make_product(self.other, name='Slow', quantity=200)
+        sale = Sale.objects.create(total_amount=Decimal('1.00'))
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=fast, quantity=56, unit_price=Decimal('1.00')),
+            SaleItem(sale=sale, product=slow, quantity=28, unit_price=Decimal('1.00')),
+        ])
+        call_command('compute_reorder_suggestions', stdout=io.StringIO())
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_lists_medicines_to_reorder_most_urgent_first(self):
+        response = self.client.get('/api/reorder-suggestions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['name'], row['supplier_name'], row['days_of_cover'], row['suggested_quantity'])
+                          for row in response.data['results']], [('Fast', 'Acme', '5.0', 32)])
+
+        response = self.client.get('/api/reorder-suggestions/', {'all': 'true'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Fast', 'Slow'])
+        response = self.client.get('/api/reorder-suggestions/', {'all': 'true', 'supplier': self.other.id})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Slow'])
+        self.assertEqual(self.client.get('/api/reorder-suggestions/', {'supplier': 'x'}).status_code, 400)
+
+    def test_cashiers_cannot_read_suggestions(self):
+        till = APIClient()
+        till.force_authenticate(make_user('till1', 'cashier'))
+        self.assertEqual(till.get('/api/reorder-suggestions/').status_code, 403)
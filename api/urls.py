@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from rest_framework.urlpatterns import format_suffix_patterns
 from . import views
+from .async_views import split_reads
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
@@ -10,11 +12,28 @@ router.register(r'products', views.ProductViewSet, basename='product')
 router.register(r'restock-history', views.RestockHistoryViewSet, basename='restock-history')
 router.register(r'promotions', views.PromotionViewSet, basename='promotion')
 router.register(r'sales', views.SaleViewSet, basename='sale')
+router.register(r'reorder-suggestions', views.ReorderSuggestionViewSet, basename='reorder-suggestion')
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
     path('user/profile/', views.user_profile, name='user_profile'),
     path('dashboard-stats/', views.DashboardStatsView.as_view(), name='dashboard-stats'),
     path('settings/', views.SettingsView.as_view(), name='settings'),
+    path('reports/sales/', views.SalesReportView.as_view(), name='sales-report'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    # Product reads are async; writes to the same URLs stay on the viewset. The
+    # format-suffix variants (e.g. products.json) are routed the same way, ahead
+    # of the router's own.
+    *format_suffix_patterns([
+        path('products/', split_reads(
+            views.ProductListView.as_view(),
+            views.ProductViewSet.as_view({'get': 'list', 'post': 'create'}, basename='product', detail=False),
+        ), name='product-list'),
+        path('products/<int:pk>/', split_reads(
+            views.ProductDetailView.as_view(),
+            views.ProductViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+                                          'delete': 'destroy'}, basename='product', detail=True),
+        ), name='product-detail'),
+    ]),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,38 +1,99 @@
+import csv
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Sum, F, Count
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework.views import APIView
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.response import Response
 from rest_framework import viewsets, status, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from django.contrib.auth.models import User
 from .serializers import ( 
                           UserListSerializer, UserCreateSerializer, UserUpdateSerializer, 
                           SupplierSerializer, ProductSerializer, RestockSerializer, RestockHistorySerializer, 
-                          SaleCreateSerializer, SaleListSerializer, PromotionSerializer
+                          SaleCreateSerializer, SaleListSerializer, PromotionSerializer, SaleSyncSerializer,
+                          DeliverySerializer, ReorderSuggestionSerializer
                           )
-from inventory.models import Supplier, Product, RestockHistory, Sale, Setting, Promotion
+from . import exports, metrics
+from .async_views import AsyncAPIView, AsyncGenericAPIView
+from .authentication import (CachedJWTAuthentication, METRICS_SCRAPER, MetricsTokenAuthentication,
+                             auser_roles, has_role)
+from .imports import import_products
+from .restocks import ProductsMissing, apply_delivery
+from .checkout import InsufficientStock, retry_on_lock, sync_sales
+from .pagination import ProductPagination, ReorderSuggestionPagination, RestockHistoryPagination, SalePagination
+from inventory.models import Supplier, Product, RestockHistory, Sale, SaleItem, Promotion, ReorderSuggestion
+from inventory import catalog, ledger, reports, rollups, settings_registry
+from inventory.search import search_product_ids
+
+
+def date_param(params, name, errors):
+    """
+    Reads an optional YYYY-MM-DD query parameter; a malformed value is
+    recorded in `errors` and read as None.
+    """
+    if not params.get(name):
+        return None
+    try:
+        day = parse_date(params[name])
+    except ValueError:
+        day = None
+    if day is None:
+        errors[name] = ["Expected a date in YYYY-MM-DD format."]
+    return day
+
+
+def export_response(request, rows_for_range, filename):
+    """
+    Streams an export for `?start=&end=` (inclusive dates) as `?output=csv` (default) or ndjson.
+    """
+    params = request.query_params
+    errors = {}
+    start = date_param(params, 'start', errors)
+    end = date_param(params, 'end', errors)
+    output = params.get('output', 'csv')
+    if output not in exports.CONTENT_TYPES:
+        errors['output'] = ["Expected 'csv' or 'ndjson'."]
+    if errors:
+        raise ValidationError(errors)
+    columns, rows = rows_for_range(start, end)
+    return exports.streaming_export(columns, rows, output, filename,
+                                    asynchronous=isinstance(request._request, ASGIRequest))
 
 
 # Custom permission to only allow users in the 'admin' group
 class IsAdminRole(BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='admin').exists()
-
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def user_profile(request):
-    user = request.user
-    # Get the user's group (role). We assume one group per user for simplicity.
-    group = user.groups.first()
-    
-    return Response({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'role': group.name if group else None
-    })
+        return has_role(request.user, 'admin')
+
+class UserProfileView(AsyncAPIView):
+    """Returns the signed-in user and their role. Async, so terminals polling it hold no worker thread."""
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, *args, **kwargs):
+        user = request.user
+        # Get the user's group (role). We assume one group per user for simplicity.
+        roles = await auser_roles(user)
+
+        return Response({
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': roles[0] if roles else None
+        })
+
+
+user_profile = UserProfileView.as_view()
     
 
 # ViewSet for listing users
@@ -40,7 +101,7 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed.
     """
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.all().prefetch_related('groups').order_by('-date_joined')
     # Default serializer for listing users
     serializer_class = UserListSerializer
     permission_classes = [IsAuthenticated, IsAdminRole]
@@ -59,7 +120,7 @@ class IsAdminOrInventoryManager(BasePermission):
     Allows access only to admin or inventory manager users.
     """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name__in=['admin', 'inventory_manager']).exists()
+        return has_role(request.user, 'admin', 'inventory_manager')
     
     
 class IsAdminOrCashier(BasePermission):
@@ -67,7 +128,7 @@ class IsAdminOrCashier(BasePermission):
     Allows access only to admin or cashier users.
     """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name__in=['admin', 'cashier']).exists()
+        return has_role(request.user, 'admin', 'cashier')
     
 # More specific permission class for products
 class ProductAccessPermission(BasePermission):
@@ -78,10 +139,10 @@ class ProductAccessPermission(BasePermission):
     def has_permission(self, request, view):
         # Allow read access for any of the three roles
         if request.method in permissions.SAFE_METHODS:
-            return request.user.groups.filter(name__in=['admin', 'inventory_manager', 'cashier']).exists()
+            return has_role(request.user, 'admin', 'inventory_manager', 'cashier')
         
         # Restrict write access to inventory managers and admins
-        return request.user.groups.filter(name__in=['admin', 'inventory_manager']).exists()
+        return has_role(request.user, 'admin', 'inventory_manager')
     
 
    
@@ -90,39 +151,332 @@ class SupplierViewSet(viewsets.ModelViewSet):
     queryset = Supplier.objects.all().order_by('name')
     serializer_class = SupplierSerializer
     permission_classes = [IsAuthenticated, IsAdminOrInventoryManager]
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['name', 'restock_count', 'last_restock', 'total_spend']
+
+    def get_queryset(self):
+        """
+        Annotates restock count, last restock date and total spend in the list
+        query itself and, when listing, applies the optional filters:
+        - `min_orders`: at least this many restocks
+        - `min_spend`: at least this much spent
+        - `ordered_after`, `ordered_before`: inclusive ISO dates of the last restock
+        Sort with `?ordering=-total_spend` (or `restock_count`, `last_restock`, `name`).
+        """
+        queryset = super().get_queryset().with_order_stats()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        errors = {}
+        if params.get('min_orders'):
+            if not params['min_orders'].isdigit():
+                errors['min_orders'] = ["Expected a whole number."]
+            else:
+                queryset = queryset.filter(restock_count__gte=int(params['min_orders']))
+        if params.get('min_spend'):
+            try:
+                queryset = queryset.filter(total_spend__gte=settings_registry.parse_decimal(params['min_spend']))
+            except ValueError as exc:
+                errors['min_spend'] = [str(exc)]
+        bounds = exports.date_range_bounds(date_param(params, 'ordered_after', errors),
+                                           date_param(params, 'ordered_before', errors))
+        if bounds[0]:
+            queryset = queryset.filter(last_restock__gte=bounds[0])
+        if bounds[1]:
+            queryset = queryset.filter(last_restock__lt=bounds[1])
+        if errors:
+            raise ValidationError(errors)
+        return queryset
     
 
-class ProductViewSet(viewsets.ModelViewSet):
-    """
-    API endpoint that allows products to be viewed or edited.
-    """
+class ProductOrderingFilter(OrderingFilter):
+    """Sorts `?ordering=status` by Product.STATUSES (most urgent first), not alphabetically."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return [field.replace('status', 'status_rank') if field.lstrip('-') == 'status' else field
+                for field in ordering]
+
+
+class ProductQueryMixin:
+    """Product queryset, filters and ordering shared by ProductViewSet and the async read views."""
     queryset = Product.objects.all().select_related('supplier').order_by('name')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, ProductAccessPermission]
-    
+    pagination_class = ProductPagination
+    filter_backends = [ProductOrderingFilter]
+    ordering_fields = ['name', 'category', 'expiry_date', 'quantity', 'price', 'status']
+
+    def get_queryset(self):
+        return self.filter_products(
+            settings_registry.get_setting('low_stock_threshold'),
+            settings_registry.get_setting('expiry_warning_days'),
+        )
+
+    async def aget_queryset(self):
+        return self.filter_products(
+            await settings_registry.aget_setting('low_stock_threshold'),
+            await settings_registry.aget_setting('expiry_warning_days'),
+        )
+
+    def filter_products(self, low_stock_threshold, expiry_warning_days):
+        """
+        Annotates the stock status in the database and, when listing, applies the
+        optional filters:
+        - `status`: comma-separated statuses, e.g. `low-stock,out-of-stock`
+        - `category`, `supplier` (id)
+        - `expiry_after`, `expiry_before`: inclusive ISO dates
+        Sort with `?ordering=expiry_date` (or `-quantity`, `status`, ...).
+        """
+        today = timezone.localdate()
+        queryset = super().get_queryset().with_status(today, low_stock_threshold, expiry_warning_days)
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        errors = {}
+        if params.get('status'):
+            statuses = [value.strip() for value in params['status'].split(',') if value.strip()]
+            unknown = sorted(set(statuses) - set(Product.STATUSES))
+            if unknown:
+                errors['status'] = [f"Unknown status: {', '.join(unknown)}."]
+            queryset = queryset.with_statuses([status for status in statuses if status in Product.STATUSES],
+                                              today, low_stock_threshold, expiry_warning_days)
+        if params.get('category'):
+            queryset = queryset.filter(category=params['category'])
+        if params.get('supplier'):
+            if not params['supplier'].isdigit():
+                errors['supplier'] = ["Expected a supplier id."]
+            else:
+                queryset = queryset.filter(supplier_id=params['supplier'])
+        for param, lookup in (('expiry_after', 'expiry_date__gte'), ('expiry_before', 'expiry_date__lte')):
+            day = date_param(params, param, errors)
+            if day is not None:
+                queryset = queryset.filter(**{lookup: day})
+        if errors:
+            raise ValidationError(errors)
+        return queryset
+
+
+def not_modified(request, etag):
+    """A bodiless 304 when the client already holds `etag`, else None."""
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
+
+
+class ProductListView(ProductQueryMixin, AsyncGenericAPIView):
+    """
+    Async `GET /api/products/`: the same filters, ordering and keyset pages as
+    ProductViewSet.list, without holding a worker thread, plus the catalog ETag.
+    Writes to the same URL are served by ProductViewSet (see api/urls.py).
+    """
+    action = 'list'
+
+    async def get(self, request, *args, **kwargs):
+        # Terminals refreshing an unchanged catalog get a bodiless 304.
+        etag = await sync_to_async(catalog.catalog_etag)(request.get_full_path())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        queryset = self.filter_queryset(await self.aget_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        else:
+            response = Response(self.get_serializer([product async for product in queryset], many=True).data)
+        response['ETag'] = etag
+        return response
+
+
+class ProductDetailView(ProductQueryMixin, AsyncGenericAPIView):
+    """Async `GET /api/products/<id>/`, as ProductViewSet.retrieve."""
+    action = 'retrieve'
+
+    async def get(self, request, pk, *args, **kwargs):
+        queryset = self.filter_queryset(await self.aget_queryset())
+        try:
+            product = await queryset.aget(pk=pk)
+        except Product.DoesNotExist:
+            # Same message as get_object_or_404 in ProductViewSet.retrieve.
+            raise Http404('No Product matches the given query.')
+        self.check_object_permissions(request, product)
+        return Response(self.get_serializer(product).data)
+
+
+class ProductViewSet(ProductQueryMixin, viewsets.ModelViewSet):
+    """
+    API endpoint that allows products to be viewed or edited.
+    Plain list and retrieve requests are served by the async views above.
+    """
+
+    def perform_create(self, serializer):
+        # The stock ledger row for the initial quantity commits with the product.
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        # The product was read before this transaction began. Re-read its quantity
+        # under the lock, so a sale committed meanwhile is neither overwritten nor
+        # left out of the stock adjustment the post_save signal records.
+        with transaction.atomic():
+            product = serializer.instance
+            product.quantity = product._loaded_quantity = (
+                Product.objects.select_for_update().values_list('quantity', flat=True).get(pk=product.pk))
+            serializer.save()
+
+    @action(detail=False, methods=['get'], url_path='stock-at',
+            permission_classes=[IsAuthenticated, IsAdminOrInventoryManager])
+    def stock_at(self, request):
+        """
+        Stock on hand at the end of a past day, from the stock ledger:
+        `?date=YYYY-MM-DD` (today at the latest), optionally `&product=<id>,<id>`.
+        Returns {product_id: quantity}; without `product`, products with no stock
+        are left out.
+        """
+        params, errors = request.query_params, {}
+        day = date_param(params, 'date', errors)
+        if day is None and 'date' not in errors:
+            errors['date'] = ["This parameter is required."]
+        elif day is not None and day > timezone.localdate():
+            errors['date'] = ["Expected today or an earlier date."]
+        product_ids = None
+        if params.get('product'):
+            values = [value.strip() for value in params['product'].split(',') if value.strip()]
+            if not all(value.isdigit() for value in values):
+                errors['product'] = ["Expected comma-separated product ids."]
+            else:
+                product_ids = [int(value) for value in values]
+        if errors:
+            raise ValidationError(errors)
+
+        end_of_day = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        balances = ledger.stock_at(end_of_day - timedelta(microseconds=1), product_ids)
+        return Response({'date': day, 'stock': {str(pk): quantity for pk, quantity in balances.items()}})
+
+    @action(detail=False, methods=['get'], url_path='changes')
+    def changes(self, request):
+        """
+        Delta sync for terminals: `?since=<token>` returns the products created or
+        changed since the token was issued and the ids of deleted products, plus
+        a new token for the next call. A new day only resends the products whose
+        expiry status changed. Without a token, or when the token is too old or
+        the status thresholds changed, the whole catalog is returned with
+        `reset: true`. Products come in pages of `page_size` (default 500): follow
+        `next` until it is null, then keep the token, which is the same on every
+        page. Deltas overlap slightly, so a product may be sent twice; apply them
+        as upserts, and replace the local copy only after the last page of a reset.
+        """
+        params = request.query_params
+        try:
+            page_size = min(max(int(params.get('page_size', catalog.SYNC_PAGE_SIZE)), 1), catalog.MAX_SYNC_PAGE_SIZE)
+        except ValueError:
+            raise ValidationError({'page_size': ["Expected an integer."]})
+        if params.get('cursor'):
+            try:
+                since, issued, after = catalog.read_page_cursor(params['cursor'])
+            except ValueError as exc:
+                raise ValidationError({'cursor': [str(exc)]})
+        else:
+            since, issued, after = params.get('since') or None, None, 0
+        try:
+            reset, products, deleted, token = catalog.catalog_changes(self.get_queryset(), since, issued)
+        except ValueError as exc:
+            raise ValidationError({'since': [str(exc)]})
+
+        # Paged by id, which the sync's filters never reorder.
+        page = list(products.filter(pk__gt=after).order_by('pk')[:page_size + 1])
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            cursor = catalog.make_page_cursor(since, token, page[-1].pk)
+            next_url = replace_query_param(
+                remove_query_param(request.build_absolute_uri(), 'since'), 'cursor', cursor)
+        return Response({
+            'token': token,
+            'reset': reset,
+            'products': self.get_serializer(page, many=True).data,
+            # Deletions are sent with the first page only.
+            'deleted': [] if after else deleted,
+            'next': next_url,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Typeahead search over name, category and batch number.
+        - `GET /api/products/search/?q=amox&limit=10`: ranked top matches,
+          exact batch-number hits first.
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            raise ValidationError({'limit': ["Expected an integer."]})
+
+        ids = search_product_ids(query, limit)
+        products = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([products[pk] for pk in ids if pk in products], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_csv(self, request):
+        """
+        Bulk-imports products from a CSV upload in the `file` field, upserting on
+        (name, batch_number). Columns: name, category, batch_number, expiry_date,
+        unit, quantity (units received), price, supplier (id), cost_per_unit.
+        Returns counts and a per-row error report.
+        """
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            return Response({'file': ["A CSV file is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = import_products(uploaded, request.user)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            return Response({'file': [f"Could not read the CSV file: {exc}"]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='restock')
+    def restock_delivery(self, request):
+        """
+        Books a whole delivery atomically: {"supplier_id", "notes", "items": [{"product_id",
+        "quantity_added", "cost_per_unit", optional "supplier_id" and "notes"}]}.
+        Either every line is applied or none is. Returns the restocked products.
+        """
+        serializer = DeliverySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data['items']
+        try:
+            units = apply_delivery(lines, request.user)
+        except ProductsMissing:
+            return Response({'items': ["A product was deleted while the delivery was being booked."]},
+                            status=status.HTTP_409_CONFLICT)
+
+        products = self.get_queryset().filter(pk__in={line['product_id'] for line in lines})
+        return Response({
+            'restocked_units': units,
+            'products': ProductSerializer(products, many=True).data,
+        }, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'], url_path='restock')
     def restock(self, request, pk=None):
         product = self.get_object()
         serializer = RestockSerializer(data=request.data)
         if serializer.is_valid():
             data = serializer.validated_data
-            
-            # Update product quantity
-            product.quantity += data['quantity_added']
-            product.save()
-
-            # Create history record
-            RestockHistory.objects.create(
-                product=product,
-                user=request.user,
-                quantity_added=data['quantity_added'],
-                supplier_id=data['supplier_id'],
-                cost_per_unit=data['cost_per_unit'],
-                notes=data.get('notes', '')
-            )
-            
+
+            # Same path as a delivery: the quantity is added in the database, so a
+            # sale committed meanwhile is not overwritten.
+            try:
+                apply_delivery([{**data, 'product_id': product.id}], request.user)
+            except ProductsMissing:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+
             # Return the updated product data
-            return Response(ProductSerializer(product).data, status=status.HTTP_200_OK)
+            return Response(ProductSerializer(self.get_object()).data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -135,53 +489,132 @@ class RestockHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = RestockHistory.objects.all().select_related('product', 'supplier', 'user').order_by('-restock_date')
     serializer_class = RestockHistorySerializer
     permission_classes = [IsAuthenticated, IsAdminOrInventoryManager]
+    pagination_class = RestockHistoryPagination
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        - `GET /api/restock-history/export/?start=2026-01-01&end=2026-01-31&output=csv|ndjson`
+        """
+        return export_response(request, exports.restock_rows, 'restock-history')
     
 
-class DashboardStatsView(APIView):
+class ReorderSuggestionViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    Provides aggregated statistics for the main dashboard overview.
+    Reorder suggestions precomputed by `compute_reorder_suggestions`, most urgent
+    (fewest days of cover) first. Lists the medicines that need ordering;
+    `?all=true` includes those with enough cover, `?supplier=<id>` narrows to
+    one supplier.
     """
-    permission_classes = [IsAuthenticated]
+    queryset = ReorderSuggestion.objects.all().select_related('supplier').order_by('days_of_cover')
+    serializer_class = ReorderSuggestionSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrInventoryManager]
+    pagination_class = ReorderSuggestionPagination
 
-    def get(self, request, *args, **kwargs):
-        # 1. Total Revenue
-        total_revenue = Sale.objects.aggregate(total=Sum('total_amount'))['total'] or 0
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        if params.get('all', '').lower() not in settings_registry.TRUE_VALUES:
+            queryset = queryset.filter(suggested_quantity__gt=0)
+        if params.get('supplier'):
+            if not params['supplier'].isdigit():
+                raise ValidationError({'supplier': ["Expected a supplier id."]})
+            queryset = queryset.filter(supplier_id=params['supplier'])
+        return queryset
 
-        # 2. Products in Stock (sum of all quantities)
-        products_in_stock = Product.objects.aggregate(total=Sum('quantity'))['total'] or 0
 
-        # 3. Sales Today
-        today = timezone.now().date()
-        sales_today = Sale.objects.filter(created_at__date=today).count()
+class DashboardStatsView(AsyncAPIView):
+    """
+    Provides aggregated statistics for the main dashboard overview.
+    Async: the queries are awaited with the async ORM.
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, *args, **kwargs):
+        # 1-3. Total revenue, products in stock and sales today come from the
+        # rollup table, which is maintained as sales and restocks are written.
+        today = timezone.localdate()
+        all_time, today_rollup = await rollups.aread_dashboard_rollups(today)
 
-        # 4. Low Stock Alerts (e.g., quantity less than a threshold, here we use 10)
-        low_stock_threshold = 10
-        low_stock_alerts = Product.objects.filter(quantity__lt=low_stock_threshold).count()
+        # 4. Low Stock Alerts (quantity below the configured threshold)
+        low_stock_threshold = await settings_registry.aget_setting('low_stock_threshold')
+        low_stock_alerts = await Product.objects.filter(quantity__lt=low_stock_threshold).acount()
 
-        # 5. Expiring Soon (e.g., within the next 30 days)
-        # This requires an 'expiry_date' field on the Product model.
-        # We will add a placeholder for now and can implement this later.
-        expiring_soon = 0 # Placeholder    
+        # 5. Expiring Soon (in stock and expiring within the configured warning window)
+        expiry_warning_days = await settings_registry.aget_setting('expiry_warning_days')
+        expiring_soon = await Product.objects.filter(
+            quantity__gt=0,
+            expiry_date__gte=today,
+            expiry_date__lte=today + timedelta(days=expiry_warning_days),
+        ).acount()
         
         data = {
-            'total_revenue': total_revenue,
-            'products_in_stock': products_in_stock,
-            'sales_today': sales_today,
+            'total_revenue': all_time.revenue,
+            'products_in_stock': all_time.stock_units,
+            'sales_today': today_rollup.sales_count,
             'low_stock_alerts': low_stock_alerts,
             'expiring_soon': expiring_soon,
         }
         return Response(data, status=status.HTTP_200_OK)
 
 
+class SalesReportView(APIView):
+    """
+    Sales metrics per day, week or month, optionally split by product, category or cashier.
+    - `period`: day (default), week or month; the range is widened to whole periods
+    - `group_by`: product, category or cashier (default: totals only)
+    - `start`, `end`: inclusive ISO dates; default to the 30 days ending today
+    Each row carries sales_count, units, revenue, discounts and tax. Sale-level
+    discounts and tax are split across products in proportion to line value.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrInventoryManager]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        errors = {}
+        period = params.get('period', 'day')
+        if period not in reports.PERIODS:
+            errors['period'] = [f"Expected one of: {', '.join(reports.PERIODS)}."]
+        group_by = params.get('group_by', 'none')
+        if group_by not in reports.GROUPINGS:
+            errors['group_by'] = [f"Expected one of: {', '.join(reports.GROUPINGS)}."]
+        end = date_param(params, 'end', errors) or timezone.localdate()
+        start = date_param(params, 'start', errors) or end - timedelta(days=29)
+        if not errors and end > reports.LATEST_END:
+            errors['end'] = [f"Must not be after {reports.LATEST_END.isoformat()}."]
+        if not errors and start > end:
+            errors['start'] = ["Must not be after end."]
+        if not errors and len(reports.bucket_starts(start, end, period)) > reports.MAX_BUCKETS:
+            errors['start'] = [f"The range spans more than {reports.MAX_BUCKETS} {period} periods."]
+        if errors:
+            raise ValidationError(errors)
+
+        return Response({
+            'period': period,
+            'group_by': group_by,
+            'start': start,
+            'end': end,
+            'results': reports.sales_report(start, end, period, group_by),
+        }, status=status.HTTP_200_OK)
+
+
 # ViewSet for Sales at the end of the file
 class SaleViewSet(viewsets.ModelViewSet):
     """
     API endpoint for creating and viewing sales.
     - `POST /api/sales/`: Creates a new sale.
-    - `GET /api/sales/`: Lists all past sales.
+    - `GET /api/sales/`: Lists past sales, newest first, one cursor page at a time.
+    - `POST /api/sales/sync/`: Replays a batch of sales queued offline.
+    - `GET /api/sales/export/`: Streams sale lines as CSV or NDJSON (admins only).
     """
-    queryset = Sale.objects.all().order_by('-created_at')
+    # Items and their product names are fetched for the whole page in one query
+    queryset = Sale.objects.all().select_related('user').prefetch_related(
+        Prefetch('items', queryset=SaleItem.objects.select_related('product'))
+    ).order_by('-created_at')
     permission_classes = [IsAuthenticated, IsAdminOrCashier]
+    pagination_class = SalePagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -189,8 +622,33 @@ class SaleViewSet(viewsets.ModelViewSet):
         return SaleListSerializer
 
     def perform_create(self, serializer):
-        # When a new sale is created, assign the current user to it.
-        serializer.save(user=self.request.user)
+        # When a new sale is created, assign the current user to it. The whole
+        # transaction is rerun if another till held the write lock for too long.
+        retry_on_lock(lambda: serializer.save(user=self.request.user))
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[IsAuthenticated, IsAdminRole])
+    def export(self, request):
+        """
+        Streams sale lines for accounting, one row per sale item.
+        - `GET /api/sales/export/?start=2026-01-01&end=2026-01-31&output=csv|ndjson`
+        """
+        return export_response(request, exports.sale_item_rows, 'sales')
+
+    @action(detail=False, methods=['post'], url_path='sync')
+    def sync(self, request):
+        """
+        Replays sales queued by a terminal while it was offline.
+        - `POST /api/sales/sync/` with `{"sales": [...]}`: returns one result per sale,
+          either accepted (with the new sale id) or rejected with the reason.
+        """
+        serializer = SaleSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            results = retry_on_lock(lambda: sync_sales(serializer.validated_data['sales'], request.user))
+        except InsufficientStock as exc:
+            # Stock kept moving under us on every attempt; the till can retry the batch.
+            return Response({'detail': exc.messages()}, status=status.HTTP_409_CONFLICT)
+        return Response({'results': results}, status=status.HTTP_200_OK)
         
 
 class SettingsView(APIView):
@@ -202,27 +660,45 @@ class SettingsView(APIView):
     permission_classes = [IsAuthenticated, IsAdminRole]
 
     def get(self, request, *args, **kwargs):
-        settings = Setting.objects.all()
-        # Convert list of setting objects into a single dictionary
-        data = {setting.key: setting.value for setting in settings}
-        return Response(data, status=status.HTTP_200_OK)
+        # Served from the process-local settings cache as a key-value object
+        return Response(settings_registry.all_settings(), status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         settings_data = request.data
-        for key, value in settings_data.items():
-            # Update setting if it exists, or create it if it's new
-            Setting.objects.update_or_create(
-                key=key,
-                defaults={'value': str(value)}
-            )
+        if not isinstance(settings_data, dict):
+            return Response({"detail": "Expected an object of setting keys and values."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Typed settings (tax rate, thresholds) must parse before anything is written
+        errors = settings_registry.validate_settings(settings_data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        # Update existing settings and create new ones in a single upsert
+        settings_registry.save_settings(settings_data)
         return Response({"message": "Settings updated successfully"}, status=status.HTTP_200_OK)
     
+
+class IsMetricsScraper(BasePermission):
+    def has_permission(self, request, view):
+        return request.auth == METRICS_SCRAPER
+
+
+class MetricsView(APIView):
+    """
+    Serves the request histograms in the Prometheus text format. Readable by
+    admins and by scrapers presenting settings.METRICS_TOKEN.
+    """
+    authentication_classes = [MetricsTokenAuthentication, CachedJWTAuthentication]
+    permission_classes = [IsMetricsScraper | IsAdminRole]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    
     
 class PromotionViewSet(viewsets.ModelViewSet):
     """
     API endpoint for creating and managing promotions.
     Only accessible by Admins and Inventory Managers.
     """
-    queryset = Promotion.objects.all().order_by('-start_date')
+    queryset = Promotion.objects.all().prefetch_related('products').order_by('-start_date')
     serializer_class = PromotionSerializer
     permission_classes = [IsAuthenticated, IsAdminOrInventoryManager]
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    from .search import create_search_index
+    create_search_index(connections[using])
 
 
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        # Keeps the dashboard rollups in step with product, sale and restock changes.
+        import inventory.signals
+        # The product search index is an SQLite FTS5 table that the model layer
+        # does not describe, so it is (re)created after every migrate.
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,37 @@
+from uuid import uuid4
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _versions():
+    return caches['versions']
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def current_version(name):
+    """
+    Returns the current version token of a process-local cache named `name`.
+
+    Versions live in the 'versions' cache, which every worker process reads (the
+    default cache is per process), so a bump made by one worker is seen by every
+    worker on its next read. If the token is missing a new one is issued, which
+    simply makes every worker rebuild once.
+    """
+    versions = _versions()
+    version = versions.get(_version_key(name))
+    if version is None:
+        versions.add(_version_key(name), uuid4().hex, None)
+        version = versions.get(_version_key(name))
+    return version
+
+
+def bump_version(name):
+    """
+    Invalidates every worker's copy of `name` once the current transaction commits.
+    Bumping earlier would let another worker rebuild from the old rows and keep
+    that stale copy under the new version.
+    """
+    transaction.on_commit(lambda: _versions().set(_version_key(name), uuid4().hex, None))
@@ -0,0 +1,138 @@
+import hashlib
+from datetime import date, datetime, timedelta
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import Product, ProductTombstone, Supplier
+from .settings_registry import get_setting
+
+TOKEN_SALT = 'inventory.catalog.sync'
+
+# Changes stamped up to this long before a sync token are sent again with the
+# next delta. A write transaction takes its timestamp before it commits, so a
+# slow one can commit with an updated_at earlier than a token already issued.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# Tombstones are kept this long; terminals whose token is older resync in full.
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+# Products per page of a catalog sync, by default and at most
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+
+
+def _status_inputs(today):
+    # Product status depends on the date and two settings as well as the row
+    # itself. The date is compared separately (see _expiry_crossings).
+    return [today.isoformat(), get_setting('low_stock_threshold'), get_setting('expiry_warning_days')]
+
+
+def make_token(now, today):
+    return signing.dumps({'t': now.isoformat(), 's': _status_inputs(today)}, salt=TOKEN_SALT)
+
+
+def read_token(token):
+    """Returns (timestamp, status inputs) stored in a sync token, or None if it is invalid."""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT)
+        return datetime.fromisoformat(data['t']), data['s']
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def _expiry_crossings(since_day, today, expiry_warning_days):
+    """
+    Products whose date-dependent status changed between `since_day` and
+    `today`: those that expired, and those that entered the expiring-soon window.
+    """
+    warning = timedelta(days=expiry_warning_days)
+    return (Q(expiry_date__gte=since_day, expiry_date__lt=today)
+            | Q(expiry_date__gt=since_day + warning, expiry_date__lte=today + warning))
+
+
+def catalog_changes(queryset, token, issued=None):
+    """
+    Returns (reset, products, deleted_ids, new_token) for a terminal that last
+    synced with `token` (None for a first sync). `queryset` is the product
+    queryset to serve from. When `reset` is True the products are the whole
+    catalog and the terminal should replace its copy; otherwise they are the
+    products created or changed since the token, plus those whose status moved
+    with the date, and `deleted_ids` the products deleted since. A sync running
+    into a new day only resends the products whose expiry status changed; a
+    change to the status settings resets. Pass the `issued` token of the first
+    page to answer later pages of the same sync consistently. Raises ValueError
+    for a token this server did not issue.
+    """
+    if issued is None:
+        now, today = timezone.now(), timezone.localdate()
+        new_token = make_token(now, today)
+    else:
+        new_token = issued
+        now, (today_iso, *_) = read_token(issued)
+        today = date.fromisoformat(today_iso)
+    if token is None:
+        return True, queryset, [], new_token
+
+    parsed = read_token(token)
+    if parsed is None:
+        raise ValueError("Invalid sync token.")
+    issued_at, (since_day, *settings) = parsed
+    if settings != _status_inputs(today)[1:] or issued_at < now - TOMBSTONE_RETENTION:
+        return True, queryset, [], new_token
+
+    since = issued_at - SYNC_OVERLAP
+    # A renamed supplier changes supplier_name on all of its products.
+    changed = Q(updated_at__gte=since) | Q(supplier__updated_at__gte=since)
+    since_day = date.fromisoformat(since_day)
+    if since_day < today:
+        changed |= _expiry_crossings(since_day, today, settings[1])
+    products = queryset.filter(changed)
+    deleted = list(ProductTombstone.objects.filter(deleted_at__gte=since)
+                   .values_list('product_id', flat=True).distinct())
+    return False, products, deleted, new_token
+
+
+def make_page_cursor(since, issued, after):
+    """Signed cursor for the next page of a catalog sync: its `since` token, first-page token and last id sent."""
+    return signing.dumps({'s': since, 'i': issued, 'a': after}, salt=TOKEN_SALT)
+
+
+def read_page_cursor(cursor):
+    """Returns (since, issued, after) from a page cursor. Raises ValueError if it is invalid."""
+    try:
+        data = signing.loads(cursor, salt=TOKEN_SALT)
+        return data['s'], data['i'], int(data['a'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise ValueError("Invalid page cursor.")
+
+
+def catalog_etag(variant):
+    """
+    Returns an ETag for the product list that changes whenever any product,
+    supplier or product deletion does. `variant` distinguishes responses that
+    differ for the same catalog, e.g. the query string.
+    """
+    # One round trip of index lookups: newest product change, number of products
+    # changed within SYNC_OVERLAP (a change committed late with an older timestamp
+    # leaves the maximum alone but still moves this count), newest supplier
+    # change and newest deletion.
+    product, supplier, tombstone = (model._meta.db_table for model in (Product, Supplier, ProductTombstone))
+    recent = Product._meta.get_field('updated_at').get_db_prep_value(
+        timezone.now() - SYNC_OVERLAP, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT (SELECT MAX(updated_at) FROM {product}),
+                       (SELECT COUNT(*) FROM {product} WHERE updated_at >= %s),
+                       (SELECT MAX(updated_at) FROM {supplier}),
+                       (SELECT MAX(deleted_at) FROM {tombstone})""",
+            [recent],
+        )
+        parts = [variant, *cursor.fetchone(), *_status_inputs(timezone.localdate())]
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def record_deletion(product_id):
+    now = timezone.now()
+    ProductTombstone.objects.filter(deleted_at__lt=now - TOMBSTONE_RETENTION).delete()
+    ProductTombstone.objects.create(product_id=product_id)
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from .models import Product, StockMovement, StockSnapshot
+
+
+def movements(kind, quantities, reference='', user=None):
+    """Unsaved ledger rows for {product_id: signed quantity}; zero quantities are skipped."""
+    return [
+        StockMovement(product_id=product_id, kind=kind, quantity=quantity, reference=reference, user=user)
+        for product_id, quantity in quantities.items()
+        if quantity
+    ]
+
+
+def restock_movements(kind, restocks):
+    """Ledger rows for saved RestockHistory rows, one per delivery line."""
+    return [
+        StockMovement(product_id=restock.product_id, kind=kind, quantity=restock.quantity_added,
+                      reference=f'restock:{restock.pk}', user=restock.user)
+        for restock in restocks
+    ]
+
+
+def record(rows):
+    """
+    Appends ledger rows. Call in the transaction that changes Product.quantity,
+    so the ledger and the stock commit or roll back together.
+    """
+    rows = [row for row in rows if row.quantity]
+    if rows:
+        StockMovement.objects.bulk_create(rows)
+
+
+def _latest_run(when=None):
+    """(taken_at, last_movement_id) of the newest snapshot run at or before `when`, or None."""
+    runs = StockSnapshot.objects.order_by('-taken_at')
+    if when is not None:
+        runs = runs.filter(taken_at__lte=when)
+    return runs.values_list('taken_at', 'last_movement_id').first()
+
+
+def stock_at(when=None, product_ids=None):
+    """
+    Returns {product_id: quantity} as of `when` (now if None), for the given
+    products or for every product holding stock. Costs one read of the newest
+    snapshot run before `when` plus a sum over the movements written since it.
+    """
+    run = _latest_run(when)
+    snapshots = StockSnapshot.objects.none()
+    deltas = StockMovement.objects.all()
+    if run is not None:
+        taken_at, last_movement_id = run
+        snapshots = StockSnapshot.objects.filter(taken_at=taken_at)
+        # Movements are committed one writer at a time, so ids follow commit
+        # order and the snapshot covers exactly the ids up to its watermark.
+        deltas = deltas.filter(id__gt=last_movement_id)
+    if when is not None:
+        deltas = deltas.filter(created_at__lte=when)
+    if product_ids is not None:
+        snapshots = snapshots.filter(product_id__in=product_ids)
+        deltas = deltas.filter(product_id__in=product_ids)
+
+    balances = dict(snapshots.values_list('product_id', 'quantity'))
+    for product_id, total in deltas.values_list('product_id').annotate(total=Sum('quantity')).order_by():
+        balances[product_id] = balances.get(product_id, 0) + total
+    if product_ids is not None:
+        return {product_id: balances.get(product_id, 0) for product_id in product_ids}
+    return {product_id: quantity for product_id, quantity in balances.items() if quantity}
+
+
+def take_snapshot():
+    """
+    Writes a snapshot run with every product's current ledger balance, built from
+    the previous run plus the movements since. Returns the number of rows written,
+    or None when nothing moved since the previous run.
+    """
+    with transaction.atomic():
+        last_movement_id = StockMovement.objects.aggregate(last=Max('id'))['last'] or 0
+        previous = _latest_run()
+        if previous is not None and previous[1] == last_movement_id:
+            return None
+        balances = stock_at()
+        taken_at = timezone.now()
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(product_id=product_id, taken_at=taken_at, quantity=quantity,
+                          last_movement_id=last_movement_id)
+            for product_id, quantity in balances.items()
+        ], batch_size=1000)
+        return len(balances)
+
+
+def open_balances():
+    """
+    Carries the current quantity of every product without ledger rows into the
+    ledger as an opening balance, for stock that predates the ledger or was
+    bulk-loaded around it. Returns the number of products opened.
+    """
+    with transaction.atomic():
+        products = Product.objects.filter(movements__isnull=True, quantity__gt=0).values_list('id', 'quantity')
+        rows = [StockMovement(product_id=product_id, kind=StockMovement.OPENING, quantity=quantity)
+                for product_id, quantity in products]
+        StockMovement.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def verify_ledger():
+    """
+    Returns [(product_id, name, quantity, ledger_quantity)] for every product whose
+    quantity differs from its ledger balance. Empty when the two agree.
+    """
+    with transaction.atomic():
+        balances = stock_at()
+        products = list(Product.objects.values_list('id', 'name', 'quantity').order_by('id'))
+    return [
+        (product_id, name, quantity, balances.get(product_id, 0))
+        for product_id, name, quantity in products
+        if quantity != balances.get(product_id, 0)
+    ]
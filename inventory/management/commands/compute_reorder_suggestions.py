@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from inventory.models import ReorderRun
+from inventory.reorder import compute_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes the reorder suggestions from recent sales velocity, reading only "
+        "the sale items written since the last run. Run periodically, e.g. nightly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recount the whole velocity window, e.g. after sales were edited or deleted.")
+
+    def handle(self, *args, **options):
+        rows = compute_suggestions(rebuild=options['rebuild'])
+        run = ReorderRun.objects.order_by('-id').first()
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {run.items_scanned} new sale items; wrote {rows} reorder suggestions."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the dashboard rollup counters from the sale, restock and product tables."
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows."))
@@ -0,0 +1,189 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from inventory import ledger
+from inventory.models import Product, Promotion, RestockHistory, Sale, SaleItem, Supplier
+from inventory.rollups import rebuild_rollups
+
+# Password of every seeded user, so the benchmark can log in as them
+SEED_PASSWORD = 'bench-pass-123'
+
+CATEGORIES = {
+    'Antibiotics': ['Amoxicillin', 'Doxycycline', 'Enrofloxacin', 'Cefalexin', 'Oxytetracycline', 'Tylosin'],
+    'NSAIDs': ['Meloxicam', 'Carprofen', 'Ketoprofen', 'Flunixin', 'Robenacoxib'],
+    'Antiparasitics': ['Ivermectin', 'Albendazole', 'Fenbendazole', 'Praziquantel', 'Levamisole', 'Fipronil'],
+    'Vaccines': ['Rabies Vaccine', 'Newcastle Vaccine', 'Gumboro Vaccine', 'Anthrax Vaccine', 'LSD Vaccine'],
+    'Supplements': ['Multivitamin', 'Calcium Borogluconate', 'Iron Dextran', 'Vitamin AD3E', 'Electrolytes'],
+    'Antiseptics': ['Povidone Iodine', 'Chlorhexidine', 'Gentian Violet', 'Hydrogen Peroxide'],
+}
+STRENGTHS = ['5%', '10%', '20%', '50mg', '100mg', '250mg', '500mg', '1g']
+UNITS = ['Tablets', 'ml', 'Bottles', 'Vials', 'Sachets', 'Doses']
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds the database with synthetic suppliers, products, promotions, restocks "
+        "and a sales history at the given scale, for load testing and benchmarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suppliers', type=int, default=50)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--promotions', type=int, default=100)
+        parser.add_argument('--restocks', type=int, default=20000)
+        parser.add_argument('--sales', type=int, default=100000)
+        parser.add_argument('--cashiers', type=int, default=40)
+        parser.add_argument('--days', type=int, default=365, help="Spread the sales over this many past days.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, for repeatable data sets.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        users = self._users(options['cashiers'])
+        suppliers = self._suppliers(options['suppliers'])
+        products = self._products(options['products'], suppliers)
+        self._promotions(options['promotions'], products)
+        self._restocks(options['restocks'], products, users)
+        self._sales(options['sales'], products, users, options['days'])
+
+        # Seeded history is bulk-written around the ledger, which starts from today's stock.
+        ledger.open_balances()
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(suppliers)} suppliers, {len(products)} products, {options['promotions']} promotions, "
+            f"{options['restocks']} restocks and {options['sales']} sales. Users log in with '{SEED_PASSWORD}'."
+        ))
+
+    def _log(self, message):
+        self.stdout.write(message)
+
+    def _users(self, cashiers):
+        # One hash for every account: PBKDF2 per user would dominate small seeds.
+        password = make_password(SEED_PASSWORD)
+        roles = [('seed_admin', 'admin'), ('seed_manager', 'inventory_manager')]
+        roles += [(f'seed_cashier{i}', 'cashier') for i in range(1, cashiers + 1)]
+        existing = set(User.objects.filter(username__in=[name for name, _ in roles]).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=name, email=f'{name}@example.com', password=password)
+            for name, _ in roles if name not in existing
+        ])
+        by_name = User.objects.in_bulk([name for name, _ in roles], field_name='username')
+        for role in {role for _, role in roles}:
+            group, _ = Group.objects.get_or_create(name=role)
+            group.user_set.add(*[by_name[name] for name, r in roles if r == role])
+        self._log(f"Users: {len(roles)} (admin: seed_admin, manager: seed_manager)")
+        return [by_name[name] for name, role in roles if role == 'cashier'] or [by_name['seed_admin']]
+
+    def _suppliers(self, count):
+        start = Supplier.objects.count()
+        Supplier.objects.bulk_create([
+            Supplier(name=f'Supplier {start + i}', contact_person=f'Contact {start + i}',
+                     email=f'supplier{start + i}@example.com', phone=f'+2567{self.random.randint(10**7, 10**8 - 1)}')
+            for i in range(count)
+        ], batch_size=self.batch_size)
+        self._log(f"Suppliers: {count}")
+        return list(Supplier.objects.values_list('id', flat=True))
+
+    def _products(self, count, suppliers):
+        today = timezone.localdate()
+        names = [(category, name) for category, drugs in CATEGORIES.items() for name in drugs]
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for i in range(start, min(count, start + self.batch_size)):
+                category, name = self.random.choice(names)
+                # Mostly healthy stock, with some expired, expiring, empty and low rows.
+                expiry = today + timedelta(days=self.random.choice([-30, 20] + [365] * 8) + self.random.randint(0, 400))
+                quantity = self.random.choice([0, 3, 8] + [self.random.randint(20, 500)] * 7)
+                batch.append(Product(
+                    name=f'{name} {self.random.choice(STRENGTHS)}', category=category,
+                    batch_number=f'{name[:3].upper()}{i:07d}', expiry_date=expiry,
+                    unit=self.random.choice(UNITS), quantity=quantity,
+                    price=Decimal(self.random.randint(50, 50000)) / 100,
+                    supplier_id=self.random.choice(suppliers),
+                ))
+            with transaction.atomic():
+                Product.objects.bulk_create(batch)
+        self._log(f"Products: {count}")
+        return list(Product.objects.values_list('id', 'price', 'supplier_id'))
+
+    def _promotions(self, count, products):
+        today = timezone.localdate()
+        promotions = Promotion.objects.bulk_create([
+            Promotion(
+                name=f'Promotion {i}', promotion_type='product_percentage',
+                value=Decimal(self.random.choice([5, 10, 15, 20, 25])),
+                start_date=today - timedelta(days=self.random.randint(0, 60)),
+                end_date=today + timedelta(days=self.random.randint(-10, 60)),
+                is_active=self.random.random() < 0.8,
+            )
+            for i in range(count)
+        ], batch_size=self.batch_size)
+        links = [
+            Promotion.products.through(promotion_id=promotion.id, product_id=product_id)
+            for promotion in promotions
+            for product_id in {self.random.choice(products)[0] for _ in range(self.random.randint(1, 20))}
+        ]
+        Promotion.products.through.objects.bulk_create(links, batch_size=self.batch_size)
+        self._log(f"Promotions: {count}")
+
+    def _restocks(self, count, products, users):
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            picks = [self.random.choice(products) for _ in range(size)]
+            with transaction.atomic():
+                rows = RestockHistory.objects.bulk_create([
+                    RestockHistory(
+                        product_id=product_id, supplier_id=supplier_id, user=self.random.choice(users),
+                        quantity_added=self.random.randint(10, 500),
+                        cost_per_unit=(price * Decimal('0.6')).quantize(Decimal('0.01')), notes='Seeded',
+                    )
+                    for product_id, price, supplier_id in picks
+                ])
+                self._backdate(RestockHistory, 'restock_date', rows, 365)
+        self._log(f"Restocks: {count}")
+
+    def _backdate(self, model, field, rows, days):
+        """auto_now_add overrides timestamps on insert, so they are spread out afterwards."""
+        midnight = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        column = model._meta.get_field(field)
+        params = []
+        for row in rows:
+            # A past day, during opening hours (08:00-20:00)
+            moment = (midnight - timedelta(days=self.random.randint(1, days))
+                      + timedelta(seconds=self.random.randint(8 * 3600, 20 * 3600)))
+            params.append((column.get_db_prep_save(moment, connection), row.pk))
+        with connection.cursor() as cursor:
+            cursor.executemany(f'UPDATE {model._meta.db_table} SET {column.column} = %s WHERE id = %s', params)
+
+    def _sales(self, count, products, users, days):
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            sales, lines = [], []
+            for _ in range(size):
+                basket = [(self.random.choice(products)[:2], self.random.choice([1, 1, 1, 2, 2, 3, 5]))
+                          for _ in range(self.random.choice([1, 1, 2, 2, 3, 4]))]
+                subtotal = sum((price * quantity for (_, price), quantity in basket), Decimal('0'))
+                discount = (subtotal * Decimal('0.05')).quantize(Decimal('0.01')) if self.random.random() < 0.1 else 0
+                sales.append(Sale(user=self.random.choice(users), subtotal=subtotal,
+                                  discount_type='percentage' if discount else 'none',
+                                  discount_value=Decimal('5') if discount else 0,
+                                  discount_amount=discount, total_amount=subtotal - discount))
+                lines.append(basket)
+            with transaction.atomic():
+                Sale.objects.bulk_create(sales)
+                SaleItem.objects.bulk_create([
+                    SaleItem(sale=sale, product_id=product_id, quantity=quantity, unit_price=price)
+                    for sale, basket in zip(sales, lines)
+                    for (product_id, price), quantity in basket
+                ])
+                self._backdate(Sale, 'created_at', sales, days)
+            if (start // self.batch_size) % 20 == 19:
+                self._log(f"Sales: {start + size}/{count}")
+        self._log(f"Sales: {count}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from inventory.ledger import take_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Records every product's stock ledger balance as a snapshot, so stock-at-date "
+        "queries only replay the movements since. Run periodically, e.g. nightly from cron."
+    )
+
+    def handle(self, *args, **options):
+        rows = take_snapshot()
+        if rows is None:
+            self.stdout.write("No stock movements since the last snapshot.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Snapshot of {rows} product balances taken."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.ledger import open_balances, verify_ledger
+
+# Mismatches listed before the rest are summarised
+MAX_REPORTED = 50
+
+
+class Command(BaseCommand):
+    help = "Checks that every product's quantity matches its stock ledger balance."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--open-missing', action='store_true',
+                            help="First carry stock of products without ledger rows in as opening balances.")
+
+    def handle(self, *args, **options):
+        if options['open_missing']:
+            self.stdout.write(f"Opened {open_balances()} product balances.")
+        mismatches = verify_ledger()
+        for product_id, name, quantity, balance in mismatches[:MAX_REPORTED]:
+            self.stdout.write(f"{product_id} {name}: quantity {quantity}, ledger {balance} ({quantity - balance:+d})")
+        if len(mismatches) > MAX_REPORTED:
+            self.stdout.write(f"... and {len(mismatches) - MAX_REPORTED} more.")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} product(s) disagree with the stock ledger.")
+        self.stdout.write(self.style.SUCCESS("Every product's quantity matches the stock ledger."))
@@ -1,5 +1,28 @@
+from datetime import timedelta
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+
+class SupplierQuerySet(models.QuerySet):
+    def with_order_stats(self):
+        """
+        Annotates each supplier with `restock_count`, `last_restock` and
+        `total_spend` (quantity x cost over its RestockHistory), grouped in the
+        same query that loads the suppliers.
+        """
+        spend = models.ExpressionWrapper(
+            models.F('restocks__quantity_added') * models.F('restocks__cost_per_unit'),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        )
+        return self.annotate(
+            restock_count=models.Count('restocks'),
+            last_restock=models.Max('restocks__restock_date'),
+            total_spend=Coalesce(
+                models.Sum(spend), models.Value(0), output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
 
 class Supplier(models.Model):
     name = models.CharField(max_length=255)
@@ -11,9 +34,57 @@ class Supplier(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = SupplierQuerySet.as_manager()
+
     def __str__(self):
         return self.name
    
+class ProductQuerySet(models.QuerySet):
+    @staticmethod
+    def status_conditions(today, low_stock_threshold, expiry_warning_days):
+        """
+        Returns {status: Q} in Product.STATUSES order. The conditions are mutually
+        exclusive and only compare `quantity` and `expiry_date` against constants,
+        so filtering on a status can use the quantity and expiry indexes.
+        """
+        warning_day = today + timedelta(days=expiry_warning_days)
+        stocked = max(low_stock_threshold, 1)
+        return {
+            'expired': models.Q(expiry_date__lt=today),
+            'out-of-stock': models.Q(quantity=0, expiry_date__gte=today),
+            'low-stock': models.Q(quantity__gt=0, quantity__lt=low_stock_threshold, expiry_date__gte=today),
+            'expiring-soon': models.Q(quantity__gte=stocked, expiry_date__gte=today, expiry_date__lte=warning_day),
+            'in-stock': models.Q(quantity__gte=stocked, expiry_date__gt=warning_day),
+        }
+
+    def with_status(self, today, low_stock_threshold, expiry_warning_days):
+        """
+        Annotates each product with `status`, computed in the database with the
+        same precedence as ProductSerializer.get_status, and `status_rank`, its
+        position in Product.STATUSES for sorting.
+        """
+        conditions = self.status_conditions(today, low_stock_threshold, expiry_warning_days)
+        return self.annotate(
+            status=models.Case(
+                *[models.When(condition, then=models.Value(status)) for status, condition in conditions.items()],
+                output_field=models.CharField(),
+            ),
+            status_rank=models.Case(
+                *[models.When(condition, then=models.Value(rank))
+                  for rank, condition in enumerate(conditions.values())],
+                output_field=models.IntegerField(),
+            ),
+        )
+
+    def with_statuses(self, statuses, today, low_stock_threshold, expiry_warning_days):
+        """Keeps the products whose status is one of `statuses`."""
+        conditions = self.status_conditions(today, low_stock_threshold, expiry_warning_days)
+        matching = models.Q(pk__in=[])
+        for status in statuses:
+            matching |= conditions[status]
+        return self.filter(matching)
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     category = models.CharField(max_length=100)
@@ -28,10 +99,57 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    # Stock statuses, in the order they take precedence
+    STATUSES = ('expired', 'out-of-stock', 'low-stock', 'expiring-soon', 'in-stock')
+
+    class Meta:
+        indexes = [
+            # Catalog listing and keyset pagination: ORDER BY name, id
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            # Supplier filter, in catalog order
+            models.Index(fields=['supplier', 'name', 'id'], name='product_supplier_name_idx'),
+            # Category filter, in catalog order
+            models.Index(fields=['category', 'name', 'id'], name='product_category_name_idx'),
+            # Expiry range filters and the dashboard's expiring-soon count
+            models.Index(fields=['expiry_date', 'quantity'], name='product_expiry_idx'),
+            # Checkout's first-expiry-first-out batch allocation (see api/checkout.py)
+            models.Index(fields=['name', 'unit', 'expiry_date', 'id'], name='product_fefo_idx',
+                         condition=models.Q(quantity__gt=0)),
+            # Exact batch-number lookups (search, imports)
+            models.Index(fields=['batch_number'], name='product_batch_idx'),
+            # Low-stock count and stock sorting
+            models.Index(fields=['quantity', 'expiry_date'], name='product_quantity_idx'),
+            # Delta catalog sync and the catalog ETag (see inventory/catalog.py)
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} (Batch: {self.batch_number})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored quantity so saves can report the stock delta to the rollups,
+        # and the category, whose changes regroup past sales in the reports.
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        instance._loaded_category = instance.__dict__.get('category')
+        return instance
    
 
+class ProductTombstone(models.Model):
+    """
+    Records a deleted product so terminals syncing the catalog incrementally
+    can drop it. Written by a post_delete signal; old rows are pruned.
+    """
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Product {self.product_id} deleted on {self.deleted_at.strftime('%Y-%m-%d')}"
+
+
 class RestockHistory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='restock_history')
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='restocks')
@@ -41,6 +159,12 @@ class RestockHistory(models.Model):
     notes = models.TextField(blank=True)
     restock_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Restock history listing and keyset pagination: ORDER BY -restock_date, id
+            models.Index(fields=['-restock_date', 'id'], name='restock_date_id_idx'),
+        ]
+
     def __str__(self):
         return f"Restocked {self.quantity_added} of {self.product.name} on {self.restock_date.strftime('%Y-%m-%d')}"
    
@@ -64,6 +188,13 @@ class Promotion(models.Model):
     products = models.ManyToManyField(Product, related_name='promotions')
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Checkout's "running today" lookup only ever wants active promotions
+            models.Index(fields=['end_date', 'start_date'], name='promotion_active_range_idx',
+                         condition=models.Q(is_active=True)),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.value}%)"
    
@@ -77,7 +208,22 @@ class Sale(models.Model):
     tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the server, except for sales replayed by an offline terminal, which
+    # keep the time they were rung up (see api/checkout.py:sync_sales).
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Terminal-side reference of a replayed offline sale, unique per cashier, so a
+    # retried sync returns the sale booked the first time instead of booking it again.
+    client_id = models.CharField(max_length=100, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Sales listing and keyset pagination: ORDER BY -created_at, id
+            models.Index(fields=['-created_at', 'id'], name='sale_created_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], condition=~models.Q(client_id=''),
+                                    name='sale_user_client_id_unique'),
+        ]
 
     def __str__(self):
         return f"Sale {self.id} on {self.created_at.strftime('%Y-%m-%d')}"
@@ -89,4 +235,121 @@ class SaleItem(models.Model):
     unit_price = models.DecimalField(max_digits=10, decimal_places=2) # Price at the time of sale
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} in Sale {self.sale.id}"
\ No newline at end of file
+        return f"{self.quantity} x {self.product.name} in Sale {self.sale.id}"
+
+
+class StatsRollup(models.Model):
+    """
+    Running dashboard counters, kept up to date in the same transaction as the
+    sale or stock change that moves them (see inventory/rollups.py).
+    There is one row per calendar day plus a single all-time row.
+    """
+    ALL_TIME = 'all-time'
+
+    key = models.CharField(max_length=10, unique=True) # ISO date, or ALL_TIME
+    sales_count = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_sold = models.BigIntegerField(default=0)
+    units_restocked = models.BigIntegerField(default=0)
+    # Units currently on hand; only maintained on the all-time row.
+    stock_units = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Rollup {self.key}: {self.sales_count} sales, {self.revenue} revenue"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only stock ledger: one signed row per product for every sale, restock,
+    import or manual adjustment, written in the same transaction as the change
+    to Product.quantity (see inventory/ledger.py). Rows are never updated.
+    """
+    SALE = 'sale'
+    RESTOCK = 'restock'
+    IMPORT = 'import'
+    ADJUSTMENT = 'adjustment'
+    # Balance carried in for products that predate the ledger
+    OPENING = 'opening'
+    KINDS = [(SALE, 'Sale'), (RESTOCK, 'Restock'), (IMPORT, 'Import'),
+             (ADJUSTMENT, 'Adjustment'), (OPENING, 'Opening balance')]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    quantity = models.IntegerField() # Signed: negative when stock leaves
+    reference = models.CharField(max_length=50, blank=True) # e.g. 'sale:42', 'restock:7'
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.quantity:+d} {self.product.name} ({self.kind})"
+
+
+class StockSnapshot(models.Model):
+    """
+    Per-product stock balance taken periodically (see `snapshot_stock`). Every
+    row of a run shares `taken_at` and covers the ledger up to and including
+    movement `last_movement_id`; products with no stock are left out.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots')
+    taken_at = models.DateTimeField(db_index=True)
+    quantity = models.BigIntegerField()
+    last_movement_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.quantity} {self.product.name} at {self.taken_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ProductDailySales(models.Model):
+    """
+    Units of a product sold per local day, folded in from SaleItem by the reorder
+    job (see inventory/reorder.py). Only the days inside the velocity window are kept.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField(db_index=True)
+    units = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='product_daily_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.units} x {self.product.name} on {self.day}"
+
+
+class ReorderRun(models.Model):
+    """One run of the reorder job; the newest holds the watermark the next run reads SaleItem from."""
+    last_sale_item_id = models.BigIntegerField(default=0)
+    items_scanned = models.PositiveIntegerField(default=0)
+    ran_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reorder run {self.id} at {self.ran_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ReorderSuggestion(models.Model):
+    """
+    Precomputed reorder advice for one medicine (every batch sharing a name and
+    unit) that sold during the velocity window. Replaced wholesale by each run.
+    """
+    name = models.CharField(max_length=255)
+    unit = models.CharField(max_length=50)
+    # Supplier of the newest batch
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, related_name='reorder_suggestions')
+    quantity = models.PositiveIntegerField() # Sellable (unexpired) units on hand
+    daily_velocity = models.DecimalField(max_digits=12, decimal_places=3) # Units sold per day
+    days_of_cover = models.DecimalField(max_digits=12, decimal_places=1)
+    lead_time_days = models.PositiveIntegerField()
+    suggested_quantity = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Listing, most urgent first, and keyset pagination: ORDER BY days_of_cover, id
+            models.Index(fields=['days_of_cover', 'id'], name='reorder_cover_id_idx'),
+            # Supplier filter, most urgent first
+            models.Index(fields=['supplier', 'days_of_cover', 'id'], name='reorder_supplier_cover_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reorder {self.suggested_quantity} {self.unit} of {self.name}"
@@ -0,0 +1,55 @@
+from django.utils import timezone
+from . import caching
+from .models import Promotion
+
+INDEX_NAME = 'promotion-index'
+
+# (version, day, {product_id: promotion}) for this process.
+_index = None
+
+
+def _preferred(candidate, current):
+    """
+    Overlap rule: when several running promotions cover a product, the largest
+    discount wins, and between equal discounts the oldest promotion (lowest id).
+    """
+    if current is None:
+        return candidate
+    if (candidate.value, -candidate.id) > (current.value, -current.id):
+        return candidate
+    return current
+
+
+def build_promotion_index(day):
+    """Maps product id -> the promotion that applies to it on `day`."""
+    promotions = Promotion.objects.filter(
+        is_active=True,
+        start_date__lte=day,
+        end_date__gte=day
+    ).prefetch_related('products')
+
+    index = {}
+    for promo in promotions:
+        for product in promo.products.all():
+            index[product.id] = _preferred(promo, index.get(product.id))
+    return index
+
+
+def active_promotions_by_product():
+    """
+    Returns today's product -> promotion index, rebuilt only after a promotion or
+    its products change, or when the date rolls over. A warm index costs one
+    cache read and no database queries.
+    """
+    global _index
+    version = caching.current_version(INDEX_NAME)
+    today = timezone.localdate()
+    index = _index
+    if index is None or index[0] != version or index[1] != today:
+        index = (version, today, build_promotion_index(today))
+        _index = index
+    return index[2]
+
+
+def invalidate_promotion_index():
+    caching.bump_version(INDEX_NAME)
@@ -0,0 +1,124 @@
+import math
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Product, ProductDailySales, ReorderRun, ReorderSuggestion, RestockHistory, SaleItem
+from .settings_registry import get_setting
+
+# Deliveries older than this are ignored when estimating a supplier's lead time.
+LEAD_TIME_LOOKBACK_DAYS = 180
+
+
+def fold_sales(window_start):
+    """
+    Adds the SaleItems written since the last run to the per-day sales table and
+    drops days before `window_start`. Returns (last_sale_item_id, items_scanned).
+    """
+    previous = ReorderRun.objects.order_by('-id').values_list('last_sale_item_id', flat=True).first() or 0
+    # Sale items are committed one writer at a time, so ids follow commit order
+    # and everything up to the watermark has been counted exactly once.
+    last = SaleItem.objects.aggregate(last=Max('id'))['last'] or 0
+    new_items = SaleItem.objects.filter(id__gt=previous, id__lte=last)
+    scanned = new_items.count()
+
+    start = timezone.make_aware(datetime.combine(window_start, time.min))
+    per_day = (new_items.filter(sale__created_at__gte=start)
+               .annotate(day=TruncDate('sale__created_at'))
+               .values_list('product_id', 'day').annotate(units=Sum('quantity')).order_by())
+    totals = {(product_id, day): units for product_id, day, units in per_day}
+
+    # New items almost always land on today, so only a few days' rows are read back.
+    existing = ProductDailySales.objects.filter(day__in={day for _, day in totals})
+    to_update = []
+    for row in existing:
+        units = totals.pop((row.product_id, row.day), None)
+        if units is not None:
+            row.units += units
+            to_update.append(row)
+    ProductDailySales.objects.bulk_update(to_update, ['units'], batch_size=500)
+    ProductDailySales.objects.bulk_create([
+        ProductDailySales(product_id=product_id, day=day, units=units)
+        for (product_id, day), units in totals.items()
+    ], batch_size=1000)
+    ProductDailySales.objects.filter(day__lt=window_start).delete()
+    return last, scanned
+
+
+def supplier_lead_times(today, default):
+    """
+    Returns {supplier_id: days} estimated from RestockHistory. Deliveries are
+    recorded on arrival without an order date, so a supplier's lead time is taken
+    as the average gap between its delivery days: how long a reorder placed now
+    waits for the next delivery. Suppliers with fewer than two delivery days get
+    `default`.
+    """
+    since = timezone.make_aware(datetime.combine(today - timedelta(days=LEAD_TIME_LOOKBACK_DAYS), time.min))
+    deliveries = (RestockHistory.objects.filter(restock_date__gte=since, supplier__isnull=False)
+                  .values_list('supplier_id')
+                  .annotate(first=Min('restock_date'), last=Max('restock_date'),
+                            days=Count(TruncDate('restock_date'), distinct=True))
+                  .order_by())
+    lead_times = {}
+    for supplier_id, first, last, days in deliveries:
+        if days > 1:
+            lead_times[supplier_id] = max(1, round((last - first) / timedelta(days=1) / (days - 1)))
+    return lead_times
+
+
+def compute_suggestions(rebuild=False):
+    """
+    Refreshes the reorder suggestions: folds new sales into the per-day table,
+    then rewrites one ReorderSuggestion per medicine sold within the velocity
+    window. Velocity is units sold per day over the window; the suggested
+    quantity covers the supplier's lead time plus `reorder_cover_days`, less
+    the sellable stock on hand. With `rebuild`, the per-day table is refilled
+    from the whole window instead of from the last run.
+    Returns the number of suggestions written.
+    """
+    today = timezone.localdate()
+    window_days = max(1, get_setting('reorder_velocity_days'))
+    window_start = today - timedelta(days=window_days - 1)
+    cover_days = get_setting('reorder_cover_days')
+    default_lead_time = get_setting('reorder_lead_time_days')
+
+    with transaction.atomic():
+        if rebuild:
+            ProductDailySales.objects.all().delete()
+            ReorderRun.objects.all().delete()
+        last, scanned = fold_sales(window_start)
+
+        sold = (ProductDailySales.objects.filter(day__gte=window_start)
+                .values_list('product__name', 'product__unit').annotate(units=Sum('units')).order_by())
+        velocities = {(name, unit): Decimal(units) / window_days for name, unit, units in sold if units}
+        stock = (Product.objects.filter(name__in={name for name, _ in velocities})
+                 .values_list('name', 'unit')
+                 .annotate(quantity=Sum('quantity', filter=Q(expiry_date__gte=today), default=0), newest=Max('id'))
+                 .order_by())
+        stock = {(name, unit): (quantity, newest) for name, unit, quantity, newest in stock}
+        suppliers = dict(Product.objects.filter(pk__in=[newest for _, newest in stock.values()])
+                         .values_list('id', 'supplier_id'))
+        lead_times = supplier_lead_times(today, default_lead_time)
+
+        now = timezone.now()
+        suggestions = []
+        for (name, unit), velocity in velocities.items():
+            if (name, unit) not in stock:
+                continue
+            quantity, newest = stock[name, unit]
+            supplier_id = suppliers.get(newest)
+            lead_time = lead_times.get(supplier_id, default_lead_time)
+            needed = math.ceil(velocity * (lead_time + cover_days))
+            suggestions.append(ReorderSuggestion(
+                name=name, unit=unit, supplier_id=supplier_id, quantity=quantity,
+                daily_velocity=velocity.quantize(Decimal('0.001')),
+                days_of_cover=(quantity / velocity).quantize(Decimal('0.1')),
+                lead_time_days=lead_time, suggested_quantity=max(0, needed - quantity), computed_at=now,
+            ))
+
+        ReorderSuggestion.objects.all().delete()
+        ReorderSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+        ReorderRun.objects.create(last_sale_item_id=last, items_scanned=scanned)
+    return len(suggestions)
@@ -0,0 +1,166 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Case, Count, DateField, DecimalField, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from . import caching
+from .models import Product, SaleItem
+
+CACHE_NAME = 'sales-reports'
+
+PERIODS = ('day', 'week', 'month')
+
+# Upper bound on buckets per report (three years of days)
+MAX_BUCKETS = 1100
+
+# Latest report end: the bucket after it (at most a month on) must still be a date.
+LATEST_END = date.max - timedelta(days=31)
+
+# group_by -> SaleItem lookup used as the row key (None: one row per bucket)
+GROUPINGS = {
+    'none': None,
+    'product': 'product_id',
+    'category': 'product__category',
+    'cashier': 'sale__user_id',
+}
+
+METRICS = ('sales_count', 'units', 'revenue', 'discounts', 'tax')
+
+CENT = Decimal('0.01')
+
+
+def bucket_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, period):
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_starts(start, end, period):
+    """Starts of every bucket overlapping the inclusive date range [start, end]."""
+    current = bucket_start(start, period)
+    starts = []
+    while current <= end:
+        starts.append(current)
+        current = next_bucket(current, period)
+    return starts
+
+
+def _share(amount):
+    # Sale-level amounts are split across the sale's lines in proportion to each
+    # line's share of the subtotal, so per-product and per-category rows add up
+    # to the sale totals. Free sales (subtotal 0) contribute nothing.
+    return Case(
+        When(sale__subtotal=0, then=Value(Decimal('0'))),
+        default=ExpressionWrapper(
+            F('quantity') * F('unit_price') * amount / F('sale__subtotal'),
+            output_field=DecimalField(max_digits=14, decimal_places=6),
+        ),
+        output_field=DecimalField(max_digits=14, decimal_places=6),
+    )
+
+
+def _aggregate(first, last, period, group_by):
+    """
+    Aggregates the buckets from `first` up to (not including) `last` with a single
+    grouped query. Returns {bucket_start: [row, ...]} including empty buckets.
+    """
+    lower = timezone.make_aware(datetime.combine(first, time.min))
+    upper = timezone.make_aware(datetime.combine(last, time.min))
+    group_field = GROUPINGS[group_by]
+    columns = ['bucket'] + ([group_field] if group_field else [])
+    rows = (
+        SaleItem.objects.filter(sale__created_at__gte=lower, sale__created_at__lt=upper)
+        .annotate(bucket=Trunc('sale__created_at', period, output_field=DateField(),
+                               tzinfo=timezone.get_current_timezone()))
+        .values(*columns)
+        .annotate(
+            sales_count=Count('sale', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(_share(F('sale__total_amount'))),
+            discounts=Sum(_share(F('sale__promotion_discount_amount') + F('sale__discount_amount'))),
+            tax=Sum(_share(F('sale__tax_amount'))),
+        )
+        .order_by(*columns)
+    )
+
+    buckets = {start: [] for start in bucket_starts(first, last - timedelta(days=1), period)}
+    for row in rows:
+        buckets[row['bucket']].append({
+            'key': row[group_field] if group_field else None,
+            'sales_count': row['sales_count'],
+            'units': row['units'],
+            **{metric: Decimal(row[metric] or 0).quantize(CENT) for metric in ('revenue', 'discounts', 'tax')},
+        })
+    return buckets
+
+
+def _cache_key(version, period, group_by, start):
+    return f'sales-report:{version}:{period}:{group_by}:{start.isoformat()}'
+
+
+def _labels(group_by, keys):
+    keys = [key for key in keys if key is not None]
+    if group_by == 'product':
+        return dict(Product.objects.filter(pk__in=keys).values_list('id', 'name'))
+    if group_by == 'cashier':
+        return dict(get_user_model().objects.filter(pk__in=keys).values_list('id', 'username'))
+    return {key: key for key in keys}
+
+
+def sales_report(start, end, period='day', group_by='none'):
+    """
+    Returns sales metrics for the inclusive date range [start, end], one row per
+    bucket (and group). The range is widened to whole buckets.
+
+    Buckets that ended before today never change again, so they are computed
+    once and kept in the cache without expiry; only buckets reaching today or
+    later are aggregated on every request. All missing buckets are computed
+    with one grouped query. Edits to past sales invalidate the cached buckets
+    (see invalidate_sales_reports).
+    """
+    starts = bucket_starts(start, end, period)
+    if not starts:
+        return []
+    today = timezone.localdate()
+    closed = [s for s in starts if next_bucket(s, period) <= today]
+    open_ = [s for s in starts if next_bucket(s, period) > today]
+
+    version = caching.current_version(CACHE_NAME)
+    keys = {s: _cache_key(version, period, group_by, s) for s in closed}
+    cached = cache.get_many(keys.values())
+    buckets = {s: cached[key] for s, key in keys.items() if key in cached}
+
+    missing = [s for s in closed if s not in buckets]
+    if missing:
+        computed = _aggregate(missing[0], next_bucket(missing[-1], period), period, group_by)
+        cache.set_many({keys[s]: rows for s, rows in computed.items() if s in keys}, None)
+        buckets.update(computed)
+    if open_:
+        buckets.update(_aggregate(open_[0], next_bucket(open_[-1], period), period, group_by))
+
+    labels = _labels(group_by, {row['key'] for s in starts for row in buckets[s]})
+    results = []
+    for s in starts:
+        for row in buckets[s]:
+            results.append({
+                'period_start': s,
+                **({'key': row['key'], 'label': labels.get(row['key'])} if group_by != 'none' else {}),
+                **{metric: row[metric] for metric in METRICS},
+            })
+    return results
+
+
+def invalidate_sales_reports():
+    caching.bump_version(CACHE_NAME)
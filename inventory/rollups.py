@@ -0,0 +1,120 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Product, RestockHistory, Sale, SaleItem, StatsRollup
+
+
+def day_key(day):
+    return day.isoformat()
+
+
+def _bump(key, **deltas):
+    """Adds `deltas` to the counters of one rollup row, creating the row on first use."""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if StatsRollup.objects.filter(key=key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            StatsRollup.objects.create(key=key, **deltas)
+    except IntegrityError:
+        # Another transaction created the row first.
+        StatsRollup.objects.filter(key=key).update(**increments)
+
+
+def record_sales(sales):
+    """
+    Adds newly created sales to the rollups. `sales` is an iterable of
+    (sale, units_sold) pairs; the units sold are also taken off the stock on hand.
+    """
+    per_day = defaultdict(lambda: {'sales_count': 0, 'revenue': Decimal('0'), 'units_sold': 0})
+    for sale, units in sales:
+        counters = per_day[day_key(timezone.localdate(sale.created_at))]
+        counters['sales_count'] += 1
+        counters['revenue'] += Decimal(sale.total_amount)
+        counters['units_sold'] += units
+
+    totals = {
+        field: sum(counters[field] for counters in per_day.values())
+        for field in ('sales_count', 'revenue', 'units_sold')
+    }
+    for key, counters in per_day.items():
+        _bump(key, **counters)
+    _bump(StatsRollup.ALL_TIME, stock_units=-totals['units_sold'], **totals)
+
+
+def record_sale_deleted(sale, units_sold):
+    """Takes a deleted sale, and the `units_sold` on its items, back out of the rollups."""
+    day = day_key(timezone.localdate(sale.created_at))
+    for key in (day, StatsRollup.ALL_TIME):
+        _bump(key, sales_count=-1, revenue=-Decimal(sale.total_amount), units_sold=-units_sold)
+
+
+def record_restock(units):
+    _bump(day_key(timezone.localdate()), units_restocked=units)
+    _bump(StatsRollup.ALL_TIME, units_restocked=units)
+
+
+def record_stock_change(delta):
+    """Records a change to the units on hand that is neither a sale nor a restock (e.g. a manual edit)."""
+    _bump(StatsRollup.ALL_TIME, stock_units=delta)
+
+
+def read_dashboard_rollups(today=None):
+    """Returns (all_time, today) rollup rows with one query; missing rows read as zeroes."""
+    today_key = day_key(today or timezone.localdate())
+    rows = {r.key: r for r in StatsRollup.objects.filter(key__in=[StatsRollup.ALL_TIME, today_key])}
+    return _dashboard_rows(rows, today_key)
+
+
+async def aread_dashboard_rollups(today=None):
+    """Async version of read_dashboard_rollups()."""
+    today_key = day_key(today or timezone.localdate())
+    rows = {r.key: r async for r in StatsRollup.objects.filter(key__in=[StatsRollup.ALL_TIME, today_key])}
+    return _dashboard_rows(rows, today_key)
+
+
+def _dashboard_rows(rows, today_key):
+    return (
+        rows.get(StatsRollup.ALL_TIME) or StatsRollup(key=StatsRollup.ALL_TIME),
+        rows.get(today_key) or StatsRollup(key=today_key),
+    )
+
+
+def rebuild_rollups():
+    """Recomputes every rollup row from the Sale, SaleItem, RestockHistory and Product tables."""
+    rows = defaultdict(dict)
+
+    daily_sales = (Sale.objects.annotate(day=TruncDate('created_at')).values('day')
+                   .annotate(count=Count('id'), revenue=Sum('total_amount')).order_by())
+    for row in daily_sales:
+        rows[day_key(row['day'])].update(sales_count=row['count'], revenue=row['revenue'] or 0)
+
+    daily_units = (SaleItem.objects.annotate(day=TruncDate('sale__created_at')).values('day')
+                   .annotate(units=Sum('quantity')).order_by())
+    for row in daily_units:
+        rows[day_key(row['day'])]['units_sold'] = row['units'] or 0
+
+    daily_restocks = (RestockHistory.objects.annotate(day=TruncDate('restock_date')).values('day')
+                      .annotate(units=Sum('quantity_added')).order_by())
+    for row in daily_restocks:
+        rows[day_key(row['day'])]['units_restocked'] = row['units'] or 0
+
+    totals = {
+        field: sum((counters.get(field, 0) for counters in rows.values()), 0)
+        for field in ('sales_count', 'revenue', 'units_sold', 'units_restocked')
+    }
+    totals['stock_units'] = Product.objects.aggregate(total=Sum('quantity'))['total'] or 0
+    rows[StatsRollup.ALL_TIME] = totals
+
+    with transaction.atomic():
+        StatsRollup.objects.all().delete()
+        StatsRollup.objects.bulk_create(
+            [StatsRollup(key=key, **counters) for key, counters in rows.items()], batch_size=500
+        )
+    return len(rows)
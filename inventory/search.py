@@ -0,0 +1,106 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Product
+
+SEARCH_TABLE = 'inventory_product_search'
+
+# bm25 column weights for (name, category, batch_number)
+RANK_WEIGHTS = (10.0, 2.0, 5.0)
+
+# Upper bound on the matches scored per query (see search_product_ids)
+RANK_CANDIDATES = 1000
+
+# An external-content FTS5 index over the product columns cashiers search by.
+# Triggers keep it in step with every write to inventory_product, including
+# bulk_create() and queryset.update(), which bypass model signals.
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, category, batch_number,
+        content='inventory_product', content_rowid='id',
+        tokenize='unicode61', prefix='1 2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, name, category, batch_number)
+        VALUES (new.id, new.name, new.category, new.batch_number);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, category, batch_number)
+        VALUES ('delete', old.id, old.name, old.category, old.batch_number);
+    END""",
+    # Recreated so databases indexed before the WHEN clause pick it up.
+    "DROP TRIGGER IF EXISTS product_search_update",
+    # Imports rewrite these columns with unchanged values; skip reindexing then.
+    f"""CREATE TRIGGER product_search_update
+    AFTER UPDATE OF name, category, batch_number ON inventory_product
+    WHEN old.name IS NOT new.name OR old.category IS NOT new.category
+        OR old.batch_number IS NOT new.batch_number BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, category, batch_number)
+        VALUES ('delete', old.id, old.name, old.category, old.batch_number);
+        INSERT INTO {SEARCH_TABLE}(rowid, name, category, batch_number)
+        VALUES (new.id, new.name, new.category, new.batch_number);
+    END""",
+]
+
+
+def uses_fts(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def create_search_index(using=connection):
+    """Creates the FTS table and its triggers if missing, indexing existing products."""
+    if not uses_fts(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+        exists = cursor.fetchone() is not None
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        if not exists:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def _match_expression(terms):
+    # Each word must appear as a prefix of some token; quoting keeps FTS5 syntax
+    # characters in user input from being interpreted.
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_product_ids(query, limit):
+    """
+    Returns up to `limit` product ids matching `query` by name, category or batch
+    number prefix. Products whose batch number equals the query come first, the
+    rest are ordered by bm25 relevance.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+
+    # Batch numbers are printed in upper case but often typed in lower case.
+    query = query.strip()
+    exact = list(Product.objects.filter(batch_number__in={query, query.upper()})
+                 .order_by('id').values_list('id', flat=True)[:limit])
+
+    if not uses_fts():
+        condition = Q()
+        for term in terms:
+            condition &= (Q(name__icontains=term) | Q(category__icontains=term)
+                          | Q(batch_number__icontains=term))
+        ranked = Product.objects.filter(condition).order_by('name', 'id').values_list('id', flat=True)
+        ranked = list(ranked[:limit + len(exact)])
+    else:
+        with connection.cursor() as cursor:
+            # bm25 is only computed for the first RANK_CANDIDATES matches, so very
+            # broad prefixes ("a") stay cheap; once the query narrows below the cap,
+            # the ranking covers every match.
+            cursor.execute(
+                f"""SELECT rowid FROM (
+                        SELECT rowid, bm25({SEARCH_TABLE}, %s, %s, %s) AS score
+                        FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT %s
+                    ) ORDER BY score, rowid LIMIT %s""",
+                [*RANK_WEIGHTS, _match_expression(terms), RANK_CANDIDATES, limit + len(exact)],
+            )
+            ranked = [row[0] for row in cursor.fetchall()]
+
+    seen = set(exact)
+    return (exact + [pk for pk in ranked if pk not in seen])[:limit]
@@ -0,0 +1,133 @@
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from . import caching
+from .models import Setting
+
+CACHE_NAME = 'settings'
+
+TRUE_VALUES = {'true', '1', 'yes', 'on'}
+FALSE_VALUES = {'false', '0', 'no', 'off'}
+
+
+def parse_decimal(value):
+    try:
+        result = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"'{value}' is not a valid decimal.")
+    if not result.is_finite():
+        raise ValueError(f"'{value}' is not a valid decimal.")
+    return result
+
+
+def parse_int(value):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"'{value}' is not a valid integer.")
+
+
+def parse_count(value):
+    result = parse_int(value)
+    if result < 0:
+        raise ValueError(f"'{value}' must be greater than or equal to 0.")
+    return result
+
+
+def parse_bool(value):
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"'{value}' is not a valid boolean.")
+
+
+# Typed settings known to the backend: key -> (parser, default).
+# Keys not listed here are stored and returned as plain strings.
+REGISTRY = {
+    'tax_rate': (parse_decimal, Decimal('0')),            # percent
+    'low_stock_threshold': (parse_count, 10),             # units
+    'expiry_warning_days': (parse_count, 30),             # days
+    # Reorder suggestions (see inventory/reorder.py)
+    'reorder_velocity_days': (parse_count, 28),           # days of sales averaged
+    'reorder_cover_days': (parse_count, 14),              # days of stock to order beyond the lead time
+    'reorder_lead_time_days': (parse_count, 7),           # for suppliers without enough deliveries
+}
+
+# (version, {key: raw value}) for this process.
+_cache = None
+
+
+def _raw_settings():
+    global _cache
+    version = caching.current_version(CACHE_NAME)
+    cached = _cache
+    if cached is None or cached[0] != version:
+        cached = (version, dict(Setting.objects.values_list('key', 'value')))
+        _cache = cached
+    return cached[1]
+
+
+async def _araw_settings():
+    global _cache
+    version = caching.current_version(CACHE_NAME)
+    cached = _cache
+    if cached is None or cached[0] != version:
+        cached = (version, {key: value async for key, value in Setting.objects.values_list('key', 'value')})
+        _cache = cached
+    return cached[1]
+
+
+def all_settings():
+    """Returns every stored setting as {key: raw string value}."""
+    return dict(_raw_settings())
+
+
+def get_setting(key):
+    """
+    Returns the typed value of a registered setting from the process-local cache,
+    falling back to its default when it is missing or cannot be parsed.
+    """
+    return _typed(key, _raw_settings().get(key))
+
+
+async def aget_setting(key):
+    """Async version of get_setting(), for views running on the event loop."""
+    return _typed(key, (await _araw_settings()).get(key))
+
+
+def _typed(key, raw):
+    parser, default = REGISTRY[key]
+    if raw is None:
+        return default
+    try:
+        return parser(raw)
+    except ValueError:
+        return default
+
+
+def validate_settings(data):
+    """Returns {key: error} for registered keys whose value does not parse."""
+    errors = {}
+    for key, value in data.items():
+        if key in REGISTRY:
+            try:
+                REGISTRY[key][0](value)
+            except ValueError as exc:
+                errors[key] = [str(exc)]
+    return errors
+
+
+def save_settings(data):
+    """
+    Writes all given settings with a single upsert and makes every worker reload
+    them once the transaction commits.
+    """
+    rows = [Setting(key=str(key), value=str(value)) for key, value in data.items()]
+    with transaction.atomic():
+        Setting.objects.bulk_create(rows, update_conflicts=True, unique_fields=['key'], update_fields=['value'])
+        invalidate_settings()
+
+
+def invalidate_settings():
+    caching.bump_version(CACHE_NAME)
@@ -0,0 +1,92 @@
+from django.db.models import Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import catalog, ledger, rollups
+from .models import Product, Promotion, RestockHistory, Sale, SaleItem, Setting, StockMovement
+from .promotions import invalidate_promotion_index
+from .reports import invalidate_sales_reports
+from .settings_registry import invalidate_settings
+
+# Sales and bulk stock updates report to the rollups explicitly where they are
+# written (bulk_create and queryset.update() do not send model signals); these
+# receivers cover changes made through individual model instances.
+
+
+@receiver(post_save, sender=Product)
+def track_product_stock(sender, instance, created, **kwargs):
+    """
+    Reports manual stock edits (create, update, restock) to the stock-on-hand
+    rollup and the stock ledger. Save inside a transaction so the ledger row
+    commits with the edit.
+    """
+    previous = 0 if created else getattr(instance, '_loaded_quantity', None)
+    if previous is not None and instance.quantity != previous:
+        delta = instance.quantity - previous
+        rollups.record_stock_change(delta)
+        kind = StockMovement.OPENING if created else StockMovement.ADJUSTMENT
+        ledger.record(ledger.movements(kind, {instance.pk: delta}, f'product:{instance.pk}'))
+    instance._loaded_quantity = instance.quantity
+
+
+@receiver(post_save, sender=Product)
+def invalidate_reports_on_recategorise(sender, instance, created, **kwargs):
+    """
+    Category reports group past sales by the product's current category.
+    """
+    previous = getattr(instance, '_loaded_category', None)
+    if not created and previous is not None and instance.category != previous:
+        invalidate_sales_reports()
+    instance._loaded_category = instance.category
+
+
+@receiver(post_delete, sender=Product)
+def track_product_deleted(sender, instance, **kwargs):
+    rollups.record_stock_change(-instance.quantity)
+    # Leaves a tombstone for terminals syncing the catalog incrementally.
+    catalog.record_deletion(instance.pk)
+
+
+@receiver(post_save, sender=RestockHistory)
+def track_restock(sender, instance, created, **kwargs):
+    if created:
+        rollups.record_restock(instance.quantity_added)
+
+
+@receiver(pre_delete, sender=Sale)
+def track_sale_deleted(sender, instance, **kwargs):
+    # Before the delete, while the sale's items (removed with it) can still be counted.
+    units = instance.items.aggregate(units=Sum('quantity'))['units'] or 0
+    rollups.record_sale_deleted(instance, units)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=SaleItem)
+def invalidate_reports_on_sale_edit(sender, created=False, **kwargs):
+    """
+    New sales only land in the open period, but editing or deleting a past sale
+    changes buckets the sales reports have cached as final.
+    """
+    if not created:
+        invalidate_sales_reports()
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(m2m_changed, sender=Promotion.products.through)
+def invalidate_promotions(sender, **kwargs):
+    """
+    Any change to a promotion or its products rebuilds the checkout promotion index.
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate_promotion_index()
+
+
+@receiver(post_save, sender=Setting)
+@receiver(post_delete, sender=Setting)
+def invalidate_settings_cache(sender, **kwargs):
+    """
+    Settings edited outside SettingsView (e.g. in the admin) still reach every worker.
+    """
+    invalidate_settings()
@@ -1,3 +1,207 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import ledger
+from .models import (Supplier, Product, ProductDailySales, ReorderRun, ReorderSuggestion, RestockHistory, Sale, SaleItem,
+                     StatsRollup, StockMovement, StockSnapshot)
+from .reorder import compute_suggestions
+from .rollups import read_dashboard_rollups, rebuild_rollups, record_sales
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = Product.objects.create(
+            name='Paracetamol', category='Analgesics', batch_number='P1', unit='Tablets',
+            expiry_date=timezone.localdate() + timedelta(days=365), quantity=40,
+            price=Decimal('1.00'), supplier=self.supplier,
+        )
+
+    def _snapshot(self):
+        all_time, today = read_dashboard_rollups()
+        return all_time.revenue, all_time.stock_units, all_time.sales_count, today.sales_count, all_time.units_restocked
+
+    def _sales_counters(self):
+        return {row.key: (row.sales_count, row.revenue, row.units_sold) for row in StatsRollup.objects.all()}
+
+    def test_manual_stock_edits_and_restocks_are_tracked(self):
+        self.product.quantity = 55
+        self.product.save()
+        RestockHistory.objects.create(product=self.product, quantity_added=15, cost_per_unit=Decimal('0.5'))
+        Product.objects.get(pk=self.product.pk).delete()
+
+        all_time, today = read_dashboard_rollups()
+        self.assertEqual(all_time.stock_units, 0)
+        self.assertEqual(today.units_restocked, 15)
+
+    def test_reconcile_rebuilds_the_same_counters(self):
+        sale = Sale.objects.create(total_amount=Decimal('12.50'))
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=5, unit_price=Decimal('2.50'))
+        Product.objects.filter(pk=self.product.pk).update(quantity=35)
+        record_sales([(sale, 5)])
+        RestockHistory.objects.create(product=self.product, quantity_added=3, cost_per_unit=Decimal('0.5'))
+        incremental = self._snapshot()
+
+        StatsRollup.objects.all().delete()
+        call_command('reconcile_rollups', stdout=StringIO())
+
+        self.assertEqual(self._snapshot(), incremental)
+        self.assertEqual(incremental, (Decimal('12.50'), 35, 1, 1, 3))
+
+
+    def test_deleting_a_sale_takes_back_its_units(self):
+        sales = []
+        for quantity in (5, 2):
+            sale = Sale.objects.create(total_amount=Decimal('2.50') * quantity)
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=quantity, unit_price=Decimal('2.50'))
+            sales.append((sale, quantity))
+        record_sales(sales)
+        sales[0][0].delete()
+
+        incremental = self._sales_counters()
+        rebuild_rollups()
+        self.assertEqual(incremental, self._sales_counters())
+        self.assertEqual(incremental[StatsRollup.ALL_TIME], (1, Decimal('5.00'), 2))
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        self.product = Product.objects.create(
+            name='Paracetamol', category='Analgesics', batch_number='P1', unit='Tablets',
+            expiry_date=timezone.localdate() + timedelta(days=365), quantity=40,
+            price=Decimal('1.00'), supplier=self.supplier,
+        )
+
+    def _move(self, quantity, when):
+        Product.objects.filter(pk=self.product.pk).update(quantity=self.product.quantity + quantity)
+        self.product.refresh_from_db()
+        ledger.record([StockMovement(product=self.product, kind=StockMovement.ADJUSTMENT,
+                                     quantity=quantity, created_at=when)])
+
+    def test_manual_edits_are_recorded(self):
+        self.product.quantity = 25
+        self.product.save()
+
+        rows = list(StockMovement.objects.filter(product=self.product).values_list('kind', 'quantity').order_by('id'))
+        self.assertEqual(rows, [(StockMovement.OPENING, 40), (StockMovement.ADJUSTMENT, -15)])
+        self.assertEqual(ledger.verify_ledger(), [])
+
+    def test_stock_at_combines_snapshot_and_later_movements(self):
+        now = timezone.now()
+        StockMovement.objects.update(created_at=now - timedelta(days=4))  # the opening balance
+        self._move(-10, now - timedelta(days=3))
+        with mock.patch('inventory.ledger.timezone.now', return_value=now - timedelta(days=2, hours=12)):
+            self.assertEqual(ledger.take_snapshot(), 1)
+            self.assertIsNone(ledger.take_snapshot())  # nothing moved since
+        self._move(5, now - timedelta(days=2))
+        self._move(-20, now - timedelta(days=1))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(ledger.stock_at(now - timedelta(days=1, hours=12)), {self.product.pk: 35})
+        # Newest run, its rows, and the delta since it
+        self.assertEqual(len(ctx), 3)
+        self.assertEqual(ledger.stock_at(), {self.product.pk: 15})
+        self.assertEqual(ledger.stock_at(product_ids=[self.product.pk, 999]), {self.product.pk: 15, 999: 0})
+
+        # A later run gives the same answers from fewer movements.
+        ledger.take_snapshot()
+        self.assertEqual(ledger.stock_at(), {self.product.pk: 15})
+        self.assertEqual(StockSnapshot.objects.count(), 2)
+
+    def test_verifier_reports_drift(self):
+        Product.objects.filter(pk=self.product.pk).update(quantity=33)
+
+        self.assertEqual(ledger.verify_ledger(), [(self.product.pk, 'Paracetamol', 33, 40)])
+        with self.assertRaisesMessage(CommandError, '1 product(s) disagree'):
+            call_command('verify_stock_ledger', stdout=StringIO())
+
+    def test_open_balances_carries_in_untracked_stock(self):
+        StockMovement.objects.all().delete()
+
+        call_command('verify_stock_ledger', open_missing=True, stdout=StringIO())
+        self.assertEqual(StockMovement.objects.get().kind, StockMovement.OPENING)
+
+
+class ReorderSuggestionTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name='Acme', email='acme@example.com', phone='123')
+        today = timezone.localdate()
+        self.batches = [
+            Product.objects.create(
+                name='Paracetamol', category='Analgesics', batch_number=batch, unit='Tablets',
+                expiry_date=today + timedelta(days=days), quantity=quantity, price=Decimal('1.00'),
+                supplier=self.supplier,
+            )
+            for batch, days, quantity in (('P1', 30, 20), ('P2', 300, 10), ('OLD', -5, 100))
+        ]
+
+    def _sell(self, quantity, days_ago=0, product=None):
+        sale = Sale.objects.create(total_amount=Decimal('1.00'))
+        Sale.objects.filter(pk=sale.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        SaleItem.objects.create(sale=sale, product=product or self.batches[0], quantity=quantity,
+                                unit_price=Decimal('1.00'))
+
+    def test_velocity_cover_and_suggested_quantity(self):
+        self._sell(28, days_ago=3)
+        self._sell(28, days_ago=10, product=self.batches[1])
+        self._sell(500, days_ago=40)  # outside the 28-day window
+        # Deliveries every 5 days make a 5-day lead time.
+        for days_ago in (0, 5, 10):
+            restock = RestockHistory.objects.create(product=self.batches[1], supplier=self.supplier,
+                                                    quantity_added=1, cost_per_unit=Decimal('0.5'))
+            RestockHistory.objects.filter(pk=restock.pk).update(restock_date=timezone.now() - timedelta(days=days_ago))
+
+        self.assertEqual(compute_suggestions(), 1)
+        suggestion = ReorderSuggestion.objects.get()
+        # 56 units over 28 days; the expired batch is not stock on hand.
+        self.assertEqual((suggestion.name, suggestion.supplier, suggestion.quantity), ('Paracetamol', self.supplier, 30))
+        self.assertEqual((suggestion.daily_velocity, suggestion.days_of_cover), (Decimal('2.000'), Decimal('15.0')))
+        # 2/day over 5 days' lead time plus 14 days' cover, less 30 on hand
+        self.assertEqual((suggestion.lead_time_days, suggestion.suggested_quantity), (5, 8))
+
+    def test_runs_only_read_sales_since_the_last_run(self):
+        self._sell(10)
+        compute_suggestions()
+        self._sell(4)
+        compute_suggestions()
+
+        self.assertEqual(ReorderRun.objects.order_by('-id').first().items_scanned, 1)
+        self.assertEqual(ProductDailySales.objects.get().units, 14)
+        self.assertEqual(ReorderSuggestion.objects.get().daily_velocity, Decimal('0.500'))
+
+        # A deleted sale is only forgotten by a rebuild.
+        Sale.objects.filter(items__quantity=4).delete()
+        compute_suggestions(rebuild=True)
+        self.assertEqual(ProductDailySales.objects.get().units, 10)
+        call_command('compute_reorder_suggestions', stdout=StringIO())
+        self.assertEqual(ReorderRun.objects.order_by('-id').first().items_scanned, 0)
+
+
+class SeedDataTests(TestCase):
+    def test_seeds_a_consistent_data_set(self):
+        call_command('seed_data', suppliers=3, products=40, promotions=5, restocks=30, sales=120,
+                     cashiers=2, days=30, batch_size=50, stdout=StringIO())
 
-# Create your tests here.
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Sale.objects.count(), 120)
+        self.assertEqual(RestockHistory.objects.count(), 30)
+        # Sales are spread over past days, not all stamped now
+        today = timezone.localdate()
+        days = {created.date() for created in Sale.objects.values_list('created_at', flat=True)}
+        self.assertGreater(len(days), 1)
+        self.assertTrue(all(today - timedelta(days=31) <= day < today for day in days))
+        for sale in Sale.objects.prefetch_related('items')[:20]:
+            self.assertEqual(sale.subtotal, sum(item.quantity * item.unit_price for item in sale.items.all()))
+            self.assertEqual(sale.total_amount, sale.subtotal - sale.discount_amount)
+        # Rollups are rebuilt from the seeded rows
+        self.assertEqual(StatsRollup.objects.get(key=StatsRollup.ALL_TIME).sales_count, 120)
+        # The ledger opens at the seeded stock
+        self.assertEqual(ledger.verify_ledger(), [])